@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark: one POST per record vs batched Airtable writes
+Runs both write paths against a local stand-in Airtable server
+
+    python benchmarks/bench_airtable_batch.py --records 200 --latency 0.1
+"""
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import rate_limit
+from airtable_batch import AirtableBatchWriter
+from fake_services import FakeAirtableHandler, FakeServer
+
+# The stand-in server has no rate limit; measure the write path, not the limiter
+rate_limit.RATE_LIMITS["airtable"] = 10_000
+
+BASE_ID = "appBenchmark"
+TABLE_NAME = "Leaderboard Players"
+TOKEN = "bench-token"
+
+
+def sample_record(i):
+    return {
+        "player_name": f"Player {i}",
+        "profile_id": 1000 + i,
+        "rank": i + 1,
+        "rating": 2400 - i,
+        "rank_level": "conqueror_3",
+        "win_rate": 61.5,
+        "games_count": 320,
+        "leaderboard": "rm_solo",
+        "country": "de",
+        "last_game": "2024-01-01T00:00:00Z"
+    }
+
+
+def write_one_by_one(api_url, records):
+    """The previous create_airtable_record loop: one POST per record"""
+    url = f"{api_url}/{BASE_ID}/{TABLE_NAME}"
+    headers = {
+        'Authorization': f'Bearer {TOKEN}',
+        'Content-Type': 'application/json'
+    }
+    created = 0
+    for fields in records:
+        response = requests.post(url, headers=headers, json={'fields': fields})
+        response.raise_for_status()
+        created += 1
+    return created
+
+
+def write_batched(api_url, records):
+    with AirtableBatchWriter(BASE_ID, TABLE_NAME, TOKEN, api_url) as writer:
+        for fields in records:
+            writer.add(fields)
+    return writer.created
+
+
+def run(name, write, records, latency):
+    with FakeServer(FakeAirtableHandler, latency=latency) as server:
+        start = time.perf_counter()
+        created = write(f"{server.url}/v0", records)
+        elapsed = time.perf_counter() - start
+    rate = created / elapsed if elapsed else float('inf')
+    print(f"{name:<14} {created:>6} records  {server.requests:>5} requests  "
+          f"{elapsed:>7.2f}s  {rate:>8.1f} records/sec")
+    return rate
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help="simulated server latency per request in seconds")
+    args = parser.parse_args()
+
+    records = [sample_record(i) for i in range(args.records)]
+    print(f"Writing {args.records} records, {args.latency * 1000:.0f} ms per request")
+    before = run("one-by-one", write_one_by_one, records, args.latency)
+    after = run("batched", write_batched, records, args.latency)
+    print(f"Speedup: {after / before:.1f}x")
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark: the real sync pipelines against local stand-in services
+Starts fake AoE4 World, Airtable and OpenAI servers (and the fake MCP server
+with --writer mcp), then runs sync_leaderboard, sync_all_slices and the meta
+analysis at increasing scale. Each run is a fresh process with empty caches
+and reports throughput, p50/p99 latency per upstream and peak memory.
+
+    python benchmarks/bench_end_to_end.py
+    python benchmarks/bench_end_to_end.py --players 50 500 5000 --civs 22 88 --latency 0.05
+    python benchmarks/bench_end_to_end.py --writer mcp --error-rate 0.01 --json results.json
+    python benchmarks/bench_end_to_end.py --baseline results.json   # fail on >10% slowdowns
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = os.path.join(HERE, '..', 'scripts')
+FAKE_MCP_SERVER = os.path.join(HERE, 'fake_mcp_server.py')
+RESULT_PREFIX = "BENCH_RESULT "
+STAGES = ("leaderboard", "civ_stats", "analysis")
+# Throughput drop against the baseline that counts as a regression
+REGRESSION_THRESHOLD = 0.10
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+# -- child process: runs one stage with timers around every upstream call --
+
+def install_timers(latencies):
+    """Record the duration of every upstream call, grouped by upstream"""
+    import http_client
+    import llm_cache
+    import mcp_session
+
+    aoe4_api = os.environ['AOE4_WORLD_API']
+    original_request = http_client.PooledSession.request
+
+    def timed_request(self, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original_request(self, method, url, **kwargs)
+        finally:
+            upstream = "aoe4world" if url.startswith(aoe4_api) else "airtable"
+            latencies.setdefault(upstream, []).append(time.perf_counter() - start)
+    http_client.PooledSession.request = timed_request
+
+    original_completion = llm_cache.cached_json_completion
+
+    def timed_completion(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original_completion(*args, **kwargs)
+        finally:
+            latencies.setdefault("openai", []).append(time.perf_counter() - start)
+    llm_cache.cached_json_completion = timed_completion
+
+    original_mcp_request = mcp_session.McpSession.request
+
+    def timed_mcp_request(self, method, params=None):
+        start = time.perf_counter()
+        future = original_mcp_request(self, method, params)
+        if method == "tools/call":
+            # Registered before call_tool's own callback, so it has run by
+            # the time the writer sees the call complete
+            future.add_done_callback(
+                lambda _: latencies.setdefault("mcp", []).append(time.perf_counter() - start))
+        return future
+    mcp_session.McpSession.request = timed_mcp_request
+
+
+def run_child(spec):
+    import resource
+    sys.path.insert(0, SCRIPTS)
+    latencies = {}
+    # Timers go in before the scripts import the functions they wrap
+    install_timers(latencies)
+    suffix = "_standalone" if spec['writer'] == "rest" else ""
+
+    if spec['stage'] == "leaderboard":
+        module = __import__(f"sync_leaderboard{suffix}")
+        run, records = lambda: module.sync_leaderboard("rm_solo", top_n=spec['scale']), spec['scale']
+    elif spec['stage'] == "civ_stats":
+        module = __import__(f"sync_civ_meta_stats{suffix}")
+        run, records = module.sync_all_slices, len(module.stat_slices()) * spec['scale']
+    else:
+        from matchup_matrix import fetch_matchup_matrix
+        module = __import__(f"generate_meta_analysis{suffix}")
+
+        def run():
+            stats = module.fetch_civ_stats("rm_solo")
+            module.generate_analysis(stats, fetch_matchup_matrix(),
+                                     batch_guides=spec['batch_guides'])
+        records = spec['scale'] + 1
+
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(RESULT_PREFIX + json.dumps({
+        "seconds": seconds,
+        "records": records,
+        "peak_mb": peak_kb / 1024,
+        "stage_mb": (peak_kb - baseline_kb) / 1024,
+        "latency": {upstream: {"count": len(values),
+                               "p50_ms": percentile(values, 50) * 1000,
+                               "p99_ms": percentile(values, 99) * 1000}
+                    for upstream, values in latencies.items()},
+    }))
+
+
+# -- parent process: fake services, one child per run, report --
+
+def run_stage(stage, scale, args):
+    sys.path.insert(0, HERE)
+    from fake_services import (FakeAirtableHandler, FakeAoe4WorldHandler,
+                               FakeOpenAIHandler, FakeServer)
+
+    faults = {'error_rate': args.error_rate, 'throttle_rate': args.throttle_rate}
+    civs = scale if stage != "leaderboard" else None
+    with tempfile.TemporaryDirectory() as tmp, \
+            FakeServer(FakeAoe4WorldHandler, latency=args.latency, civilizations=civs,
+                       players=max(10_000, scale), **faults) as aoe4, \
+            FakeServer(FakeAirtableHandler, latency=args.latency, **faults) as airtable, \
+            FakeServer(FakeOpenAIHandler, latency=args.openai_latency,
+                       analysis_chars=args.analysis_chars,
+                       invalid_rate=args.invalid_rate, **faults) as openai:
+        env = dict(os.environ,
+                   AOE4_WORLD_API=f"{aoe4.url}/api/v0",
+                   AIRTABLE_API_URL=f"{airtable.url}/v0",
+                   AIRTABLE_ACCESS_TOKEN="bench-token",
+                   OPENAI_BASE_URL=f"{openai.url}/v1",
+                   OPENAI_API_KEY="bench-key",
+                   AOE4_HTTP_CACHE_DIR=os.path.join(tmp, 'http'),
+                   OPENAI_CACHE_PATH=os.path.join(tmp, 'llm.sqlite3'),
+                   AOE4_SYNC_STATE_DIR=os.path.join(tmp, 'state'),
+                   AOE4_SNAPSHOT_DB=os.path.join(tmp, 'snapshots.sqlite3'),
+                   AIRTABLE_MCP_COMMAND=(f"{sys.executable} {FAKE_MCP_SERVER} "
+                                         f"--latency {args.latency} --bulk"
+                                         if args.writer == "mcp" else ""))
+        if not args.rate_limits:
+            # Measure the pipelines, not the politeness limiter
+            env.update(AIRTABLE_RATE_LIMIT="10000", AOE4_WORLD_RATE_LIMIT="10000",
+                       OPENAI_RATE_LIMIT="10000")
+        spec = {"stage": stage, "scale": scale, "writer": args.writer,
+                "batch_guides": args.batch_guides}
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', json.dumps(spec)],
+                               env=env, cwd=tmp, capture_output=True, text=True)
+
+    lines = [line for line in child.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+    if child.returncode != 0 or not lines:
+        print(f"{stage} at scale {scale} failed:\n{child.stderr[-2000:]}")
+        return None
+    result = json.loads(lines[-1][len(RESULT_PREFIX):])
+    result.update(stage=stage, scale=scale, writer=args.writer,
+                  requests={"aoe4world": aoe4.requests, "airtable": airtable.requests,
+                            "openai": openai.requests})
+    if args.verbose:
+        print(child.stdout)
+    return result
+
+
+def print_result(result):
+    rate = result['records'] / result['seconds'] if result['seconds'] else 0.0
+    print(f"{result['stage']:<12} {result['scale']:>6} {result['records']:>8} "
+          f"{result['seconds']:>8.2f} {rate:>10.1f} {result['peak_mb']:>8.1f} {result['stage_mb']:>8.1f}")
+    for upstream, stats in sorted(result['latency'].items()):
+        print(f"{'':<12} {upstream:>10}: {stats['count']:>6} calls  "
+              f"p50 {stats['p50_ms']:>7.1f} ms  p99 {stats['p99_ms']:>7.1f} ms")
+
+
+def compare(results, baseline_path):
+    """Regressions against an earlier --json file: (label, old rate, new rate)"""
+    with open(baseline_path) as f:
+        baseline = {(r['stage'], r['scale'], r['writer']): r for r in json.load(f)}
+    regressions = []
+    for result in results:
+        old = baseline.get((result['stage'], result['scale'], result['writer']))
+        if not old:
+            continue
+        old_rate = old['records'] / old['seconds']
+        new_rate = result['records'] / result['seconds']
+        if new_rate < old_rate * (1 - REGRESSION_THRESHOLD):
+            regressions.append((f"{result['stage']} @ {result['scale']}", old_rate, new_rate))
+    return regressions
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == '--child':
+        run_child(json.loads(sys.argv[2]))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--players', type=int, nargs='+', default=[50, 500, 2000],
+                        help="top_n values for the leaderboard sync")
+    parser.add_argument('--civs', type=int, nargs='+', default=[22, 44],
+                        help="civilizations in the stats payloads for civ_stats and analysis")
+    parser.add_argument('--writer', choices=("rest", "mcp"), default="rest",
+                        help="standalone REST writers or the MCP scripts")
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help="seconds per AoE4 World, Airtable and MCP request")
+    parser.add_argument('--openai-latency', type=float, default=0.2)
+    parser.add_argument('--analysis-chars', type=int, default=2000,
+                        help="size of each fake OpenAI analysis")
+    parser.add_argument('--batch-guides', action='store_true',
+                        help="pack the civ guides into batched structured completions")
+    parser.add_argument('--invalid-rate', type=float, default=0.0,
+                        help="fraction of batched guides the fake OpenAI leaves incomplete")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="fraction of requests answered 500")
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help="fraction of requests answered 429")
+    parser.add_argument('--rate-limits', action='store_true',
+                        help="keep the real per-upstream rate limits")
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--baseline', help="compare throughput with an earlier --json file")
+    parser.add_argument('--verbose', action='store_true', help="show the scripts' own output")
+    args = parser.parse_args()
+
+    runs = [(stage, scale) for stage in args.stages
+            for scale in (args.players if stage == "leaderboard" else args.civs)]
+    print(f"{'Stage':<12} {'Scale':>6} {'Records':>8} {'Seconds':>8} {'Records/s':>10} "
+          f"{'Peak MB':>8} {'Stage MB':>8}")
+    results = []
+    for stage, scale in runs:
+        result = run_stage(stage, scale, args)
+        if result:
+            print_result(result)
+            results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {len(results)} results to {args.json}")
+
+    failed = len(results) < len(runs)
+    if args.baseline:
+        regressions = compare(results, args.baseline)
+        for label, old_rate, new_rate in regressions:
+            print(f"REGRESSION {label}: {old_rate:.1f} → {new_rate:.1f} records/s")
+        if not regressions:
+            print(f"\nNo regressions over {REGRESSION_THRESHOLD:.0%} against {args.baseline}")
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Benchmark: module-level requests.get vs the pooled keep-alive session
+Fetches leaderboard pages from a local stand-in AoE4 World server
+
+    python benchmarks/bench_http_client.py --requests 500
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_services import FakeAoe4WorldHandler, FakeServer
+from http_client import decode_json, session
+
+
+def module_level(url, n):
+    for page in range(1, n + 1):
+        response = requests.get(url, params={"page": page % 200 + 1})
+        response.raise_for_status()
+        json.loads(response.text)
+
+
+def pooled(url, n):
+    client = session("aoe4world")
+    for page in range(1, n + 1):
+        response = client.get(url, params={"page": page % 200 + 1})
+        response.raise_for_status()
+        decode_json(response.content)
+
+
+def run(name, fetch, n):
+    with FakeServer(FakeAoe4WorldHandler) as server:
+        url = f"{server.url}/api/v0/leaderboards/rm_solo"
+        start = time.perf_counter()
+        fetch(url, n)
+        elapsed = time.perf_counter() - start
+    print(f"{name:<16} {n:>6} requests  {elapsed:>7.2f}s  "
+          f"{elapsed / n * 1000:>6.2f} ms/request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+
+    run("requests.get", module_level, args.requests)
+    run("pooled session", pooled, args.requests)
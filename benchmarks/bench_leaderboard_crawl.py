@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark: serial page loop vs the concurrent leaderboard crawler
+Runs against a local stand-in AoE4 World server
+
+    python benchmarks/bench_leaderboard_crawl.py --top-n 5000 --latency 0.1
+"""
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_services import FakeAoe4WorldHandler, FakeServer
+from leaderboard_crawler import crawl_leaderboard
+
+
+def page_fetcher(api_base):
+    def fetch_leaderboard(leaderboard="rm_solo", page=1):
+        response = requests.get(f"{api_base}/leaderboards/{leaderboard}", params={"page": page})
+        response.raise_for_status()
+        return response.json()
+    return fetch_leaderboard
+
+
+def serial(fetch_page, top_n):
+    players, page = [], 1
+    while len(players) < top_n:
+        data = fetch_page("rm_solo", page=page)
+        if not data or not data.get('players'):
+            break
+        players.extend(data['players'])
+        page += 1
+    return players[:top_n]
+
+
+def concurrent(fetch_page, top_n, workers):
+    return list(crawl_leaderboard(fetch_page, "rm_solo", top_n, workers=workers))
+
+
+def run(name, crawl, args):
+    with FakeServer(FakeAoe4WorldHandler, latency=args.latency,
+                    players=args.ladder) as server:
+        fetch_page = page_fetcher(f"{server.url}/api/v0")
+        start = time.perf_counter()
+        players = crawl(fetch_page)
+        elapsed = time.perf_counter() - start
+    print(f"{name:<22} {len(players):>6} players  {server.requests:>4} pages  "
+          f"{elapsed:>7.2f}s  {len(players) / elapsed:>9.0f} players/sec")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--top-n', type=int, default=2000)
+    parser.add_argument('--ladder', type=int, default=10_000, help="players on the fake ladder")
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    run("serial page loop", lambda f: serial(f, args.top_n), args)
+    run(f"crawler ({args.workers} workers)",
+        lambda f: concurrent(f, args.top_n, args.workers), args)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark: full match-history re-pull vs incremental ingestion
+Runs against a local stand-in AoE4 World server where each pair of players
+keeps playing each other; between runs every player gets a few new games
+
+    python benchmarks/bench_match_history.py --players 500 --latency 0.05
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import rate_limit
+from fake_services import FakeAoe4WorldHandler, FakeServer
+from match_history import MatchStore, ingest_match_history
+
+# Measure the pipeline, not the politeness limiter
+rate_limit.RATE_LIMITS["aoe4world"] = 10_000
+
+
+def games_fetcher(api_base):
+    http = requests.Session()
+
+    def fetch_player_games(profile_id, leaderboard="rm_solo", since=None, page=1):
+        params = {"leaderboard": leaderboard, "page": page}
+        if since:
+            params['since'] = since
+        response = http.get(f"{api_base}/players/{profile_id}/games", params=params)
+        response.raise_for_status()
+        return response.json()
+    return fetch_player_games
+
+
+def run(name, server, profile_ids, store, args):
+    fetch = games_fetcher(f"{server.url}/api/v0")
+    before = server.requests
+    start = time.perf_counter()
+    result = ingest_match_history(profile_ids, "rm_solo", args.workers, fetch=fetch, store=store)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {server.requests - before:>6} requests  {result['fetched']:>7} games  "
+          f"{result['new']:>6} new  {elapsed:>7.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--players', type=int, default=200)
+    parser.add_argument('--history', type=int, default=120, help="games per player on run 1")
+    parser.add_argument('--new-games', type=int, default=3, help="games added per player before run 2")
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    profile_ids = [10_000_000 + n for n in range(args.players)]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, \
+            FakeServer(FakeAoe4WorldHandler, latency=args.latency,
+                       games_per_player=args.history) as server:
+        incremental = MatchStore(os.path.join(tmp, "incremental.sqlite3"))
+        run("run 1: backfill", server, profile_ids, incremental, args)
+
+        server.state['games_per_player'] = args.history + args.new_games
+        run("run 2: incremental", server, profile_ids, incremental, args)
+        # What a full re-pull costs: the same ingestion without high-water marks
+        run("run 2: full re-pull", server, profile_ids,
+            MatchStore(os.path.join(tmp, "full.sqlite3")), args)
+        size = os.path.getsize(os.path.join(tmp, "incremental.sqlite3"))
+        print(f"\nStore: {size / 1024:.0f} KiB for "
+              f"{incremental.db.execute('SELECT COUNT(*) FROM games').fetchone()[0]} games")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark: a new MCP process per record vs one persistent session
+Runs against benchmarks/fake_mcp_server.py instead of the real CLI
+
+    python benchmarks/bench_mcp_session.py --records 100 --latency 0.05
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from mcp_session import McpRecordWriter, McpSession
+
+BASE_ID = "appBenchmark"
+TABLE_ID = "Leaderboard Players"
+FAKE_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_mcp_server.py')
+
+
+def server_command(args, bulk=False):
+    command = [sys.executable, FAKE_SERVER, '--latency', str(args.latency),
+               '--startup', str(args.startup)]
+    return command + ['--bulk'] if bulk else command
+
+
+def sample_record(i):
+    return {"player_name": f"Player {i}", "profile_id": 1000 + i, "rating": 2400 - i,
+            "leaderboard": "rm_solo"}
+
+
+def process_per_record(args, records):
+    """What manus-mcp-cli does today: spawn, handshake, call, exit"""
+    for fields in records:
+        with McpSession(server_command(args)) as session:
+            session.initialize()
+            session.call_tool("create_record", {"baseId": BASE_ID, "tableId": TABLE_ID,
+                                                "fields": fields}).result()
+    return len(records), len(records)
+
+
+def persistent(args, records, bulk=False):
+    with McpRecordWriter(BASE_ID, TABLE_ID, command=server_command(args, bulk)) as writer:
+        for fields in records:
+            writer.add(fields)
+    return writer.created, writer.calls
+
+
+def run(name, write, records):
+    start = time.perf_counter()
+    created, calls = write(records)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<20} {created:>5} records  {calls:>5} calls  {elapsed:>7.2f}s  "
+          f"{elapsed / max(created, 1) * 1000:>8.1f} ms/record")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help="simulated Airtable latency per tool call in seconds")
+    parser.add_argument('--startup', type=float, default=0.2,
+                        help="simulated CLI/server start-up time in seconds")
+    args = parser.parse_args()
+
+    records = [sample_record(i) for i in range(args.records)]
+    run("process per record", lambda r: process_per_record(args, r), records)
+    run("persistent session", lambda r: persistent(args, r), records)
+    run("persistent + bulk", lambda r: persistent(args, r, bulk=True), records)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Fake Airtable MCP server speaking JSON-RPC over stdio
+
+    python benchmarks/fake_mcp_server.py --latency 0.05 --bulk
+
+Answers initialize, tools/list and tools/call for create_record and
+update_records (and create_records with --bulk). Tool calls are handled
+concurrently, each taking --latency seconds, the way an async server
+backed by a remote API would behave. --startup adds a delay before the
+server starts reading, standing in for interpreter and CLI start-up cost.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from itertools import count
+
+write_lock = threading.Lock()
+record_ids = count(1)
+
+
+def send(message):
+    with write_lock:
+        sys.stdout.write(json.dumps(message) + "\n")
+        sys.stdout.flush()
+
+
+def tool_result(text, is_error=False):
+    return {"content": [{"type": "text", "text": text}], "isError": is_error}
+
+
+def call_tool(request_id, params, args):
+    time.sleep(args.latency)
+    name = params.get('name')
+    arguments = params.get('arguments', {})
+    if name == 'create_record':
+        fields = arguments.get('fields') or {}
+        if args.fail_field and args.fail_field in fields:
+            result = tool_result(f"Unknown field name: {args.fail_field}", is_error=True)
+        else:
+            result = tool_result(json.dumps({"id": f"rec{next(record_ids):014d}", "fields": fields}))
+    elif name == 'update_records':
+        records = arguments.get('records', [])
+        result = tool_result(json.dumps([{"id": r.get('id'), "fields": r.get('fields', {})}
+                                         for r in records]))
+    elif name == 'create_records' and args.bulk:
+        records = arguments.get('records', [])
+        created = [{"id": f"rec{next(record_ids):014d}", "fields": r.get('fields', {})}
+                   for r in records]
+        result = tool_result(json.dumps({"records": created}))
+    else:
+        send({"jsonrpc": "2.0", "id": request_id,
+              "error": {"code": -32601, "message": f"Unknown tool: {name}"}})
+        return
+    send({"jsonrpc": "2.0", "id": request_id, "result": result})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--startup', type=float, default=0.0)
+    parser.add_argument('--bulk', action='store_true', help="advertise create_records")
+    parser.add_argument('--fail-field', default='', help="reject records containing this field")
+    args = parser.parse_args()
+
+    time.sleep(args.startup)
+    tools = [{"name": "create_record", "inputSchema": {"type": "object"}},
+             {"name": "update_records", "inputSchema": {"type": "object"}}]
+    if args.bulk:
+        tools.append({"name": "create_records", "inputSchema": {"type": "object"}})
+
+    for line in sys.stdin:
+        message = json.loads(line)
+        method = message.get('method')
+        request_id = message.get('id')
+        if request_id is None:
+            continue
+        if method == 'initialize':
+            send({"jsonrpc": "2.0", "id": request_id, "result": {
+                "protocolVersion": message['params'].get('protocolVersion'),
+                "capabilities": {"tools": {}},
+                "serverInfo": {"name": "fake-airtable", "version": "0.1"}}})
+        elif method == 'tools/list':
+            send({"jsonrpc": "2.0", "id": request_id, "result": {"tools": tools}})
+        elif method == 'tools/call':
+            threading.Thread(target=call_tool, args=(request_id, message['params'], args),
+                             daemon=True).start()
+        else:
+            send({"jsonrpc": "2.0", "id": request_id,
+                  "error": {"code": -32601, "message": f"Unknown method: {method}"}})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,482 @@
+"""
+Local stand-ins for the external services used by the sync scripts
+Each server runs on a background thread on 127.0.0.1 with a configurable
+per-request latency so benchmarks never touch the real APIs
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+
+
+class FakeServer:
+    """Run a request handler class on a random local port"""
+
+    def __init__(self, handler_class, latency=0.0, **options):
+        handler = type(handler_class.__name__, (handler_class,), {
+            'latency': latency,
+            'options': options,
+        })
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.httpd.daemon_threads = True
+        handler.server_state = {'requests': 0, 'lock': threading.Lock()}
+        self.state = handler.server_state
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self):
+        return self.state['requests']
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        return False
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    """Shared plumbing: latency, request counting, JSON helpers"""
+    # Keep-alive, like the real services. Buffer each response into a single
+    # write so delayed ACKs don't add ~40 ms per request on a reused socket.
+    protocol_version = "HTTP/1.1"
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+    latency = 0.0
+    options = {}
+    server_state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def begin(self):
+        """Count the request and apply latency; False if it was throttled
+
+        options: throttle_rate (fraction of requests answered 429),
+        retry_after (seconds sent in the Retry-After header, default 0.1)
+        and error_rate (fraction of requests answered 500)
+        """
+        with self.server_state['lock']:
+            self.server_state['requests'] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        throttle_rate = self.options.get('throttle_rate', 0)
+        if throttle_rate and random.random() < throttle_rate:
+            with self.server_state['lock']:
+                self.server_state['throttled'] = self.server_state.get('throttled', 0) + 1
+            self.send_json(429, {'error': {'type': 'RATE_LIMIT_REACHED',
+                                           'message': 'Rate limit exceeded'}},
+                           headers={'Retry-After': str(self.options.get('retry_after', 0.1))})
+            return False
+        error_rate = self.options.get('error_rate', 0)
+        if error_rate and random.random() < error_rate:
+            with self.server_state['lock']:
+                self.server_state['errors'] = self.server_state.get('errors', 0) + 1
+            self.send_json(500, {'error': {'type': 'SERVER_ERROR',
+                                           'message': 'Injected server error'}})
+            return False
+        return True
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+_record_ids = count(1)
+
+
+class FakeAirtableHandler(FakeHandler):
+    """Airtable REST record endpoints on /v0/{base}/{table}
+
+    POST creates records from a single-record body ({"fields": ...}) or a
+    batch body ({"records": [...]}). PATCH updates records by id, or by the
+    performUpsert merge fields. Batches of more than 10 are rejected the
+    same way the real API does.
+    """
+
+    def table(self):
+        tables = self.server_state.setdefault('tables', {})
+        return tables.setdefault(self.path.split('?')[0], {})
+
+    def new_id(self):
+        return f"rec{next(_record_ids):014d}"
+
+    def merge_index(self, merge_on):
+        """merge field values -> record id, kept up to date by every write
+
+        Lets performUpsert find its record without scanning the table, so
+        large benchmarks measure the client rather than this server.
+        """
+        indexes = self.server_state.setdefault('merge_indexes', {})
+        name = (self.path.split('?')[0], tuple(merge_on))
+        if name not in indexes:
+            indexes[name] = {json.dumps([fields.get(f) for f in merge_on]): record_id
+                             for record_id, fields in self.table().items()}
+        return indexes[name]
+
+    def index_record(self, record_id):
+        path = self.path.split('?')[0]
+        fields = self.table()[record_id]
+        for (table, merge_on), index in self.server_state.get('merge_indexes', {}).items():
+            if table == path:
+                index.setdefault(json.dumps([fields.get(f) for f in merge_on]), record_id)
+
+    def too_many(self, records):
+        if len(records) <= 10:
+            return False
+        self.send_json(422, {'error': {'type': 'INVALID_RECORDS',
+                                       'message': 'Too many records'}})
+        return True
+
+    def do_POST(self):
+        if not self.begin():
+            return
+        body = self.read_json()
+        with self.server_state['lock']:
+            table = self.table()
+            if 'records' not in body:
+                record_id = self.new_id()
+                table[record_id] = body.get('fields', {})
+                self.index_record(record_id)
+                self.send_json(200, {'id': record_id, 'fields': table[record_id]})
+                return
+            if self.too_many(body['records']):
+                return
+            created = []
+            for record in body['records']:
+                record_id = self.new_id()
+                table[record_id] = record.get('fields', {})
+                self.index_record(record_id)
+                created.append({'id': record_id, 'fields': table[record_id]})
+        self.send_json(200, {'records': created})
+
+    def do_PATCH(self):
+        if not self.begin():
+            return
+        body = self.read_json()
+        records = body.get('records', [])
+        if self.too_many(records):
+            return
+        merge_on = body.get('performUpsert', {}).get('fieldsToMergeOn')
+        written, created_ids, updated_ids = [], [], []
+        with self.server_state['lock']:
+            table = self.table()
+            for record in records:
+                fields = record.get('fields', {})
+                record_id = record.get('id')
+                if merge_on:
+                    key = json.dumps([fields.get(name) for name in merge_on])
+                    record_id = self.merge_index(merge_on).get(key)
+                if record_id is None:
+                    record_id = self.new_id()
+                    table[record_id] = {}
+                    created_ids.append(record_id)
+                elif record_id not in table:
+                    self.send_json(404, {'error': {'type': 'NOT_FOUND',
+                                                   'message': f"Record {record_id} not found"}})
+                    return
+                else:
+                    updated_ids.append(record_id)
+                table[record_id].update(fields)
+                if record_id in created_ids:
+                    self.index_record(record_id)
+                written.append({'id': record_id, 'fields': table[record_id]})
+        body = {'records': written}
+        if merge_on:
+            body.update({'createdRecords': created_ids, 'updatedRecords': updated_ids})
+        self.send_json(200, body)
+
+
+CIVILIZATIONS = [
+    "english", "french", "holy_roman_empire", "rus", "mongols", "chinese",
+    "delhi_sultanate", "abbasid_dynasty", "ottomans", "malians", "byzantines",
+    "japanese", "ayyubids", "jeanne_darc", "order_of_the_dragon",
+    "zhu_xis_legacy", "golden_horde", "macedonian_dynasty", "sengoku_daimyo",
+    "tughlaq_dynasty", "knights_templar", "house_of_lancaster",
+]
+
+
+def civilizations(count=None):
+    """The real civ ids, extended with made-up ones for bigger payloads"""
+    count = len(CIVILIZATIONS) if count is None else count
+    return (CIVILIZATIONS + [f"extra_civ_{i}" for i in range(max(0, count - len(CIVILIZATIONS)))])[:count]
+
+
+MAPS = [
+    "Dry Arabia", "Ancient Spires", "Altai", "Hideout", "Black Forest",
+    "Mountain Pass", "Nagari", "Boulder Bay", "Archipelago", "Four Lakes",
+    "Lipany", "High View",
+]
+# Type the fake maps endpoint tags each map with; made-up maps go untagged
+MAP_TYPES = ["open", "open", "open", "closed", "closed", "hybrid", "hybrid", "hybrid",
+             "water", "water", "open", "open"]
+
+
+def maps(count=None):
+    """Real map names, extended with made-up ones for bigger payloads"""
+    count = len(MAPS) if count is None else count
+    return (MAPS + [f"Extra Map {i}" for i in range(max(0, count - len(MAPS)))])[:count]
+
+
+RANK_LEVELS = ["conqueror_3", "conqueror_2", "conqueror_1", "diamond_3", "diamond_2",
+               "diamond_1", "platinum_3", "platinum_2", "platinum_1", "gold_3"]
+
+
+def fake_player(leaderboard, rank, shared_profiles=False):
+    """Deterministic leaderboard row for a 1-based rank
+
+    With shared_profiles, rank r on every leaderboard is the same player.
+    """
+    wins = 100 + (rank * 7919) % 400
+    losses = 80 + (rank * 104729) % 400
+    offset = 0 if leaderboard == "rm_solo" or shared_profiles else 5_000_000
+    return {
+        "name": f"Player {rank}",
+        "profile_id": 10_000_000 + rank + offset,
+        "rank": rank,
+        "rating": max(400, 2500 - rank // 4),
+        "rank_level": RANK_LEVELS[min(len(RANK_LEVELS) - 1, rank // 500)],
+        "wins": wins,
+        "losses": losses,
+        "country": ["de", "us", "cn", "fr", "kr", "br", "gb"][rank % 7],
+        "last_game_at": "2024-01-01T00:00:00.000Z",
+    }
+
+
+class FakeAoe4WorldHandler(FakeHandler):
+    """AoE4 World endpoints under /api/v0
+
+    options: players (ladder size per leaderboard, default 10,000),
+    per_page (default 50), patch (default "10.1.48"), civilizations (civs in
+    the stats, matchups and maps payloads, default 22), maps (maps in the
+    maps payload, default 12), games_per_player
+    (default 120; server.state['games_per_player'] overrides it so a
+    benchmark can add games between runs), shared_profiles (rm_team rank r
+    is rm_solo rank r's player, so profiles repeat across leaderboards)
+    """
+
+    def do_GET(self):
+        if not self.begin():
+            return
+        from urllib.parse import parse_qs, urlparse
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        parts = url.path.strip('/').split('/')
+        if parts[:2] != ['api', 'v0']:
+            self.send_json(404, {'error': 'not found'})
+            return
+        parts = parts[2:]
+        if len(parts) == 2 and parts[0] == 'leaderboards':
+            body = self.leaderboard(parts[1], int(query.get('page', 1)))
+        elif len(parts) == 3 and parts[0] == 'stats' and parts[2] == 'civilizations':
+            body = self.civ_stats(parts[1], query.get('rank_level'))
+        elif len(parts) == 3 and parts[0] == 'stats' and parts[2] == 'matchups':
+            body = self.matchups(parts[1], query.get('rank_level'))
+        elif len(parts) == 3 and parts[0] == 'stats' and parts[2] == 'maps':
+            body = self.map_stats(parts[1], query.get('rank_level'))
+        elif len(parts) == 2 and parts[0] == 'players':
+            body = self.player_profile(int(parts[1]))
+        elif len(parts) == 3 and parts[0] == 'players' and parts[2] == 'games':
+            body = self.player_games(int(parts[1]), query.get('leaderboard', 'rm_solo'),
+                                     int(query.get('page', 1)), query.get('since'))
+        else:
+            self.send_json(404, {'error': 'not found'})
+            return
+        self.send_cacheable(body)
+
+    def send_cacheable(self, body):
+        """Send body with an ETag, answering a matching If-None-Match with 304"""
+        etag = '"%s"' % hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            with self.server_state['lock']:
+                self.server_state['not_modified'] = self.server_state.get('not_modified', 0) + 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_json(200, body, headers={'ETag': etag})
+
+    def leaderboard(self, leaderboard, page):
+        total = self.options.get('players', 10_000)
+        per_page = self.options.get('per_page', 50)
+        first = (page - 1) * per_page + 1
+        last = min(total, first + per_page - 1)
+        shared = self.options.get('shared_profiles', False)
+        players = [fake_player(leaderboard, rank, shared) for rank in range(first, last + 1)]
+        return {"key": leaderboard, "total_count": total, "page": page,
+                "per_page": per_page, "count": len(players),
+                "offset": first - 1, "players": players}
+
+    def civ_stats(self, leaderboard, rank_level):
+        seed = sum(map(ord, f"{leaderboard}{rank_level}"))
+        data = []
+        for i, civ in enumerate(civilizations(self.options.get('civilizations'))):
+            data.append({
+                "civilization": civ,
+                "win_rate": 44 + ((seed + i * 37) % 1100) / 100,
+                "pick_rate": 1 + ((seed + i * 53) % 800) / 100,
+                "games_count": 500 + (seed * (i + 1)) % 20000,
+                "duration_average": 900 + (seed + i * 61) % 900,
+            })
+        return {"leaderboard": leaderboard, "rank_level": rank_level,
+                "patch": self.options.get('patch', "10.1.48"), "data": data}
+
+
+    def matchups(self, leaderboard, rank_level):
+        """Both directions of every civ pair, with consistent win counts"""
+        seed = sum(map(ord, f"{leaderboard}{rank_level}"))
+        data = []
+        civs = civilizations(self.options.get('civilizations'))
+        for i, civ in enumerate(civs):
+            for j, other in enumerate(civs):
+                if i == j:
+                    continue
+                a, b = min(i, j), max(i, j)
+                games = 20 + (seed * (a + 1) * (b + 3)) % 3000
+                wins_a = round(games * (40 + ((seed + a * 31 + b * 17) % 2000) / 100) / 100)
+                wins = wins_a if i == a else games - wins_a
+                data.append({"civilization": civ, "other_civilization": other,
+                             "games_count": games, "win_count": wins,
+                             "win_rate": round(wins / games * 100, 2)})
+        return {"leaderboard": leaderboard, "rank_level": rank_level,
+                "patch": self.options.get('patch', "10.1.48"), "data": data}
+
+    def player_profile(self, profile_id):
+        """A profile whose modes agree with the player's leaderboard rows"""
+        shared = self.options.get('shared_profiles', False)
+        rank = (profile_id - 10_000_000) % 5_000_000
+        leaderboards = ("rm_solo", "rm_team") if shared else (
+            ("rm_team",) if profile_id - 10_000_000 > 5_000_000 else ("rm_solo",))
+        modes = {}
+        for leaderboard in leaderboards:
+            row = fake_player(leaderboard, rank, shared)
+            history = {str(1_700_000_000 + i * 86_400): {"rating": row['rating'] - 60 + (i * 7) % 90,
+                                                         "games_count": i}
+                       for i in range(100)}
+            modes[leaderboard] = {
+                "rating": row['rating'], "max_rating": row['rating'] + 40,
+                "max_rating_7d": row['rating'] + 10, "max_rating_1m": row['rating'] + 25,
+                "rank": rank, "rank_level": row['rank_level'], "streak": rank % 7 - 3,
+                "games_count": row['wins'] + row['losses'], "wins_count": row['wins'],
+                "losses_count": row['losses'], "last_game_at": row['last_game_at'],
+                "rating_history": history,
+            }
+        return {"name": f"Player {rank}", "profile_id": profile_id,
+                "steam_id": str(76_561_198_000_000_000 + profile_id),
+                "site_url": f"https://aoe4world.com/players/{profile_id}",
+                "country": ["de", "us", "cn", "fr", "kr", "br", "gb"][rank % 7], "modes": modes}
+
+    def map_stats(self, leaderboard, rank_level):
+        """Every civ on every map, nested under each map's row"""
+        seed = sum(map(ord, f"{leaderboard}{rank_level}"))
+        civs = civilizations(self.options.get('civilizations'))
+        data = []
+        for m, name in enumerate(maps(self.options.get('maps'))):
+            rows = []
+            for i, civ in enumerate(civs):
+                games = 5 + (seed * (m + 2) * (i + 1)) % 1500
+                wins = round(games * (42 + ((seed + m * 13 + i * 29) % 1600) / 100) / 100)
+                rows.append({"civilization": civ, "games_count": games, "win_count": wins,
+                             "win_rate": round(wins / games * 100, 2),
+                             "pick_rate": round(100 * games / (2 * 1500), 2)})
+            data.append({"map": name, "map_id": m + 1,
+                         "map_type": MAP_TYPES[m] if m < len(MAP_TYPES) else None,
+                         "games_count": sum(row['games_count'] for row in rows) // 2,
+                         "duration_average": 900 + (seed + m * 71) % 1200,
+                         "civilizations": rows})
+        return {"leaderboard": leaderboard, "rank_level": rank_level,
+                "patch": self.options.get('patch', "10.1.48"), "data": data}
+
+    def player_games(self, profile_id, leaderboard, page, since):
+        """Hourly games, newest first; profiles 2k and 2k+1 always play each other"""
+        total = self.server_state.get('games_per_player',
+                                      self.options.get('games_per_player', 120))
+        per_page = self.options.get('per_page', 50)
+        opponent = profile_id ^ 1
+        pair = min(profile_id, opponent)
+        games = []
+        for i in range(total - 1, -1, -1):
+            started_at = time.strftime("%Y-%m-%dT%H:%M:%S.000Z",
+                                       time.gmtime(1_700_000_000 + i * 3600))
+            if since and started_at <= since:
+                break
+            players = [{"player": {"profile_id": pid, "name": f"Player {pid}",
+                                   "civilization": CIVILIZATIONS[(pid + i) % len(CIVILIZATIONS)],
+                                   "result": "win" if (pid + i) % 2 else "loss",
+                                   "rating": 2000 + pid % 300, "rating_diff": 12 - 24 * ((pid + i) % 2)}}
+                       for pid in (pair, pair + 1)]
+            games.append({"game_id": pair * 100_000 + i, "started_at": started_at,
+                          "duration": 900 + (pair + i) % 1200, "map": "Dry Arabia",
+                          "kind": "rm_1v1", "leaderboard": leaderboard,
+                          "patch": self.options.get('patch', "10.1.48"),
+                          "average_rating": 2000 + pair % 300, "ongoing": False,
+                          "teams": [[players[0]], [players[1]]]})
+        first = (page - 1) * per_page
+        return {"total_count": len(games), "page": page, "per_page": per_page,
+                "count": len(games[first:first + per_page]),
+                "games": games[first:first + per_page]}
+
+
+class FakeOpenAIHandler(FakeHandler):
+    """OpenAI chat completions endpoint: POST /v1/chat/completions
+
+    Replies with a fixed JSON analysis so json_object responses parse; a
+    json_schema response_format gets one analysis per required key.
+    options: analysis_chars pads the reasoning field to about that size,
+             invalid_rate blanks that fraction of the keyed analyses
+    """
+
+    def do_POST(self):
+        if not self.begin():
+            return
+        body = self.read_json()
+        prompt = "".join(m.get('content', '') for m in body.get('messages', []))
+        analysis = {
+            "early_game": "Scout and boom behind a quick second town center.",
+            "mid_game": "Hit the castle age timing with a strong army.",
+            "late_game": "Transition into siege and a gold-light composition.",
+            "key_units": "Spearmen, archers, mangonels",
+            "key_technologies": "Wheelbarrow, Professional Scouts",
+            "confidence": 85,
+            "reasoning": f"Stub analysis for a {len(prompt)} character prompt.",
+        }
+        padding = self.options.get('analysis_chars', 0) - len(analysis['reasoning'])
+        if padding > 0:
+            analysis['reasoning'] += " " + "x" * padding
+        response_format = body.get('response_format') or {}
+        if response_format.get('type') == "json_schema":
+            schema = response_format.get('json_schema', {}).get('schema', {})
+            invalid_rate = self.options.get('invalid_rate', 0.0)
+            analysis = {key: dict(analysis, reasoning="") if random.random() < invalid_rate else analysis
+                        for key in schema.get('required', [])}
+        content = json.dumps(analysis)
+        self.send_json(200, {
+            "id": f"chatcmpl-{next(_record_ids)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get('model', 'gpt-4.1-mini'),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                      "total_tokens": len(prompt) // 4 + len(content) // 4},
+        })
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Batched Airtable record writes
+Buffers creates, updates and upserts and sends them to the REST API in
+chunks of 10
+"""
+import os
+
+import requests
+
+from http_client import decode_json, session
+from rate_limit import call_with_backoff, limiter
+from run_metrics import metrics
+
+AIRTABLE_API = os.getenv('AIRTABLE_API_URL', "https://api.airtable.com/v0")
+
+# Airtable accepts at most 10 records per create/update request
+MAX_BATCH_SIZE = 10
+
+
+class AirtableBatchWriter:
+    """Collect records and write them to Airtable 10 per request
+
+    Use as a context manager so the final partial batches are flushed:
+
+        with AirtableBatchWriter(BASE_ID, TABLE_NAME, token) as writer:
+            for record in records:
+                writer.add(record)
+        print(writer.created)
+
+    Every write method takes an optional on_written(fields, record_id)
+    callback that runs once Airtable has accepted the record.
+    """
+
+    def __init__(self, base_id, table_name, token, api_url=AIRTABLE_API,
+                 batch_size=MAX_BATCH_SIZE):
+        self.url = f"{api_url}/{base_id}/{table_name}"
+        self.headers = {
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/json'
+        }
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        self.limiter = limiter(f"airtable:{base_id}")
+        # (method, merge_on) -> [(record body, fields, on_written)]
+        self.pending = {}
+        self.created = 0
+        self.updated = 0
+        self.requests = 0
+        self.failures = []  # (fields, error message) per rejected record
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def add(self, fields, on_written=None):
+        """Queue a new record, sending a batch once 10 are waiting"""
+        self._queue(('POST', None), {'fields': fields}, fields, on_written)
+
+    def update(self, record_id, fields, on_written=None):
+        """Queue a PATCH of the given fields on an existing record"""
+        self._queue(('PATCH', None), {'id': record_id, 'fields': fields}, fields, on_written)
+
+    def upsert(self, fields, merge_on, on_written=None):
+        """Queue a create-or-update matched on the merge_on fields"""
+        self._queue(('PATCH', tuple(merge_on)), {'fields': fields}, fields, on_written)
+
+    def flush(self):
+        """Send every queued record"""
+        for operation, queue in self.pending.items():
+            while queue:
+                chunk, queue[:] = queue[:self.batch_size], queue[self.batch_size:]
+                self._send(operation, chunk)
+
+    def close(self):
+        """Flush; there is nothing else to release"""
+        self.flush()
+
+    def _queue(self, operation, body, fields, on_written):
+        queue = self.pending.setdefault(operation, [])
+        queue.append((body, fields, on_written))
+        if len(queue) >= self.batch_size:
+            self._send(operation, queue[:])
+            queue.clear()
+
+    def _request(self, operation, chunk):
+        method, merge_on = operation
+        self.requests += 1
+        data = {'records': [body for body, _, _ in chunk]}
+        if merge_on:
+            data['performUpsert'] = {'fieldsToMergeOn': list(merge_on)}
+        with metrics.timed("write", "airtable"):
+            response = call_with_backoff(
+                self.limiter,
+                lambda: session("airtable").request(method, self.url, headers=self.headers, json=data))
+        metrics.count("bytes", len(response.request.body or b''), upstream="airtable", direction="out")
+        metrics.count("bytes", len(response.content), upstream="airtable", direction="in")
+        response.raise_for_status()
+        return decode_json(response.content)
+
+    def _send(self, operation, chunk):
+        try:
+            result = self._request(operation, chunk)
+        except requests.HTTPError as e:
+            # Airtable rejects the whole batch if any record is invalid, so
+            # resend one at a time to find the bad records and keep the rest
+            if len(chunk) > 1 and e.response is not None and e.response.status_code == 422:
+                for item in chunk:
+                    self._send(operation, [item])
+                return
+            self._fail(chunk, _error_message(e))
+            return
+        except Exception as e:
+            self._fail(chunk, str(e))
+            return
+
+        written = result.get('records', [])
+        metrics.count("records", len(written), stage="write", target="airtable")
+        created_ids = set(result.get('createdRecords', []))
+        for (body, fields, on_written), record in zip(chunk, written):
+            if operation[0] == 'POST' or record.get('id') in created_ids:
+                self.created += 1
+            else:
+                self.updated += 1
+            if on_written:
+                on_written(fields, record.get('id'))
+        if len(written) < len(chunk):
+            self._fail(chunk[len(written):], "record missing from batch response")
+
+    def _fail(self, chunk, message):
+        metrics.count("failures", len(chunk), stage="write", target="airtable")
+        for _, fields, _ in chunk:
+            self.failures.append((fields, message))
+            label = next(iter(fields.values()), '') if fields else ''
+            print(f"Error writing record {label}: {message}")
+
+
+def _error_message(error):
+    """Pull Airtable's error description out of a failed response"""
+    try:
+        body = error.response.json().get('error', {})
+        if isinstance(body, dict):
+            return f"{error.response.status_code} {body.get('type', '')}: {body.get('message', '')}"
+        return f"{error.response.status_code} {body}"
+    except Exception:
+        return str(error)
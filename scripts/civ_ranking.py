@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Civ ranking for stats snapshots
+Scores every civ once per slice with a win rate shrunk toward 50% by its
+games_count, so a civ with a handful of lucky games doesn't top the list,
+and keeps a civ -> rank/percentile index for constant-time lookups
+"""
+import os
+
+import numpy as np
+
+from run_metrics import metrics
+
+# Strength of the 50% prior, in games: a civ with this many games sits
+# halfway between its raw win rate and 50%
+PRIOR_GAMES = int(os.getenv('AOE4_RANKING_PRIOR_GAMES', '200'))
+
+
+def shrunk_win_rate(win_rate, games, prior_games=PRIOR_GAMES):
+    """Posterior mean win rate (percent) under a Beta prior centred on 50%"""
+    win_rate = np.asarray(win_rate, dtype=float)
+    games = np.asarray(games, dtype=float)
+    return (win_rate * games + 50.0 * prior_games) / (games + prior_games)
+
+
+class CivRanking:
+    """Scores, ranks and percentiles of every civ in every slice
+
+    Arrays are slice × civ; rank 1 is the best score in its slice. Civs
+    missing from a slice have rank 0 and a NaN score.
+    """
+
+    def __init__(self, slices, civs, rows, win_rate, games, prior_games=PRIOR_GAMES):
+        self.slices = list(slices)
+        self.civs = list(civs)
+        self.rows = rows
+        self.slice_index = {slice_: s for s, slice_ in enumerate(self.slices)}
+        self.civ_index = {civ: i for i, civ in enumerate(self.civs)}
+        self.win_rate = win_rate
+        self.games = games
+        present = ~np.isnan(win_rate)
+        self.score = np.where(present, shrunk_win_rate(np.nan_to_num(win_rate), games, prior_games),
+                              np.nan)
+
+        # Best first, missing civs last
+        self.order = np.argsort(np.where(present, -self.score, np.inf), axis=1, kind='stable')
+        self.rank = np.zeros(win_rate.shape, dtype=int)
+        np.put_along_axis(self.rank, self.order,
+                          np.broadcast_to(np.arange(1, len(self.civs) + 1), win_rate.shape), axis=1)
+        self.rank = np.where(present, self.rank, 0)
+        self.size = present.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            spread = np.maximum(self.size - 1, 1)[:, None]
+            self.percentile = np.where(present, (self.size[:, None] - self.rank) / spread * 100, np.nan)
+
+    def _entry(self, s, i):
+        return {
+            "civilization": self.civs[i],
+            "rank": int(self.rank[s, i]),
+            "total": int(self.size[s]),
+            "percentile": float(self.percentile[s, i]),
+            "score": float(self.score[s, i]),
+            "stats": self.rows[s].get(self.civs[i], {}),
+        }
+
+    def position(self, civ, leaderboard="rm_solo", rank_level=None):
+        """Rank entry of one civ, or None if it isn't in that slice"""
+        s = self.slice_index.get((leaderboard, rank_level))
+        i = self.civ_index.get(civ)
+        if s is None or i is None or not self.rank[s, i]:
+            return None
+        return self._entry(s, i)
+
+    def ranked(self, leaderboard="rm_solo", rank_level=None):
+        """Every civ of a slice, best first"""
+        s = self.slice_index[(leaderboard, rank_level)]
+        return [self._entry(s, i) for i in self.order[s, :self.size[s]]]
+
+    def top(self, n, leaderboard="rm_solo", rank_level=None):
+        return self.ranked(leaderboard, rank_level)[:n]
+
+    def bottom(self, n, leaderboard="rm_solo", rank_level=None):
+        return self.ranked(leaderboard, rank_level)[-n:] if n else []
+
+
+def rank_slices(results, prior_games=PRIOR_GAMES):
+    """Rank every slice at once
+
+    results is a list of ((leaderboard, rank_level), stats response) as
+    yielded by stat_slices.fetch_slices.
+    """
+    results = [(slice_, data) for slice_, data in results if data]
+    slices = [slice_ for slice_, _ in results]
+    rows = [{row['civilization']: row for row in data.get('data', [])} for _, data in results]
+    civs = sorted({civ for by_civ in rows for civ in by_civ})
+    index = {civ: i for i, civ in enumerate(civs)}
+
+    win_rate = np.full((len(slices), len(civs)), np.nan)
+    games = np.zeros((len(slices), len(civs)))
+    cells = [(s, index[civ], row.get('win_rate', 0), row.get('games_count', 0))
+             for s, by_civ in enumerate(rows) for civ, row in by_civ.items()]
+    if cells:
+        s, i, rate, count = (np.array(column) for column in zip(*cells))
+        win_rate[s, i] = rate
+        games[s, i] = count
+    return CivRanking(slices, civs, rows, win_rate, games, prior_games)
+
+
+def rank_snapshot(stats_data, leaderboard="rm_solo", rank_level=None, prior_games=PRIOR_GAMES):
+    """Rank one stats response"""
+    with metrics.timed("transform", "ranking"):
+        return rank_slices([((leaderboard, rank_level), stats_data)], prior_games)
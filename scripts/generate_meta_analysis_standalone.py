@@ -3,16 +3,28 @@
 Generate AI-powered meta analysis using live data from AoE4 World API
 STANDALONE VERSION - Uses Airtable API directly (no MCP dependency)
 """
-import json
+import argparse
 import os
-import requests
 from openai import OpenAI
 
+from airtable_batch import AirtableBatchWriter
+from civ_ranking import rank_snapshot
+from http_cache import cached_get_json
+from llm_batch import ITEM_OUTPUT_TOKENS, Batcher, analysis_schema, estimate_tokens, valid_analysis
+from llm_cache import cache as llm_cache, cached_json_completion
+from llm_pool import MAX_CONCURRENT_REQUESTS, map_concurrently
+from map_matrix import fetch_map_matrix, map_prompt_lines
+from matchup_matrix import fetch_matchup_matrix, matchup_prompt_lines
+from rate_limit import print_rate_limit_summary
+from record_sinks import add_sink_arguments, configure_sinks, open_writer
+from run_journal import RunJournal
+from run_metrics import add_metrics_arguments, configure_metrics, finish_metrics
+
 # Configuration
 BASE_ID = "appKeqSFMnexidZfd"
 TABLE_NAME = "Strategy Analysis"
-API_BASE = "https://aoe4world.com/api/v0"
-AIRTABLE_API = "https://api.airtable.com/v0"
+API_BASE = os.getenv('AOE4_WORLD_API', "https://aoe4world.com/api/v0")
+AIRTABLE_API = os.getenv('AIRTABLE_API_URL', "https://api.airtable.com/v0")
 
 # Get tokens from environment
 AIRTABLE_TOKEN = os.getenv('AIRTABLE_ACCESS_TOKEN')
@@ -22,50 +34,40 @@ if not AIRTABLE_TOKEN:
 # Initialize OpenAI client
 client = OpenAI()
 
-def create_airtable_record(fields):
-    """Create a record in Airtable using REST API"""
-    url = f"{AIRTABLE_API}/{BASE_ID}/{TABLE_NAME}"
-    headers = {
-        'Authorization': f'Bearer {AIRTABLE_TOKEN}',
-        'Content-Type': 'application/json'
-    }
-    data = {'fields': fields}
-    
-    try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"Error creating record: {e}")
-        return None
-
 def fetch_civ_stats(leaderboard="rm_solo"):
     """Fetch current civilization statistics"""
     url = f"{API_BASE}/stats/{leaderboard}/civilizations"
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()
+        return cached_get_json(url)
     except Exception as e:
         print(f"Error fetching stats: {e}")
         return None
 
-def generate_meta_report(stats_data):
+def generate_meta_report(stats_data, matchups=None, ranking=None):
     """Use AI to analyze the current meta based on live statistics"""
-    civs = stats_data.get('data', [])
-    top_5 = civs[:5]
-    bottom_5 = civs[-5:]
+    
+    # Civs ordered by win rate shrunk toward 50% for small samples
+    ranking = ranking or rank_snapshot(stats_data)
+    top_5 = ranking.top(5)
+    bottom_5 = ranking.bottom(5)
     
     top_civs_text = "\n".join([
-        f"- {c['civilization'].replace('_', ' ').title()}: {c['win_rate']:.2f}% WR, {c['pick_rate']:.2f}% PR, {c['games_count']} games"
+        f"- {c['civilization'].replace('_', ' ').title()}: {c['stats']['win_rate']:.2f}% WR ({c['score']:.2f}% adjusted), {c['stats']['pick_rate']:.2f}% PR, {c['stats']['games_count']} games"
         for c in top_5
     ])
     
     bottom_civs_text = "\n".join([
-        f"- {c['civilization'].replace('_', ' ').title()}: {c['win_rate']:.2f}% WR, {c['pick_rate']:.2f}% PR, {c['games_count']} games"
+        f"- {c['civilization'].replace('_', ' ').title()}: {c['stats']['win_rate']:.2f}% WR ({c['score']:.2f}% adjusted), {c['stats']['pick_rate']:.2f}% PR, {c['stats']['games_count']} games"
         for c in bottom_5
     ])
     
+    lopsided_text = ""
+    lopsided = matchups.lopsided() if matchups is not None else []
+    if lopsided:
+        lopsided_text = "\n**Most Lopsided Matchups:**\n" + "\n".join(
+            f"- {civ.replace('_', ' ').title()} beats {other.replace('_', ' ').title()}: {rate:.1f}% WR over {games} games"
+            for civ, other, rate, games in lopsided) + "\n"
+    
     prompt = f"""You are an expert Age of Empires 4 meta analyst. Analyze the current competitive meta based on live statistics from ranked 1v1 games.
 
 **Top 5 Performing Civilizations:**
@@ -75,7 +77,7 @@ def generate_meta_report(stats_data):
 {bottom_civs_text}
 
 **Patch:** {stats_data.get('patch', 'Unknown')}
-
+{lopsided_text}
 Provide a comprehensive meta analysis including:
 1. Why the top civilizations are dominating
 2. What strategies they enable
@@ -95,35 +97,49 @@ Format as JSON:
 }}"""
 
     try:
-        response = client.chat.completions.create(
+        # Identical prompts (same patch, same numbers) are answered from the cache
+        return cached_json_completion(
+            client,
             model="gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": "You are an expert Age of Empires 4 competitive analyst who provides data-driven meta analysis."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            response_format={"type": "json_object"}
+            system_prompt="You are an expert Age of Empires 4 competitive analyst who provides data-driven meta analysis.",
+            user_prompt=prompt,
+            temperature=0.7
         )
-        
-        result = json.loads(response.choices[0].message.content)
-        return result
     except Exception as e:
         print(f"Error generating analysis: {e}")
         return None
 
-def generate_civ_specific_guide(civ_name, civ_stats, all_stats):
-    """Generate a guide for playing a specific civilization in the current meta"""
-    rank = next((i+1 for i, c in enumerate(all_stats) if c['civilization'] == civ_stats['civilization']), 0)
-    total_civs = len(all_stats)
-    
-    prompt = f"""You are an expert Age of Empires 4 coach. Create a guide for playing {civ_name} in the current competitive meta.
+GUIDE_SYSTEM_PROMPT = "You are an expert Age of Empires 4 coach who provides practical, data-driven advice."
 
-**{civ_name} Statistics:**
+def civ_stats_block(civ_name, civ_stats, ranking, matchups=None, maps=None):
+    """The statistics section of a civ guide prompt"""
+    position = ranking.position(civ_stats['civilization'])
+    
+    matchup_text = ""
+    if matchups is not None:
+        best, worst = matchups.civ_matchups(civ_stats['civilization'])
+        if best:
+            matchup_text += f"\n**Best Matchups:**\n{matchup_prompt_lines(best)}\n"
+        if worst:
+            matchup_text += f"\n**Worst Matchups:**\n{matchup_prompt_lines(worst)}\n"
+    if maps is not None:
+        by_type = maps.type_results(civ_stats['civilization'])
+        if by_type:
+            matchup_text += f"\n**Results by Map Type:**\n{map_prompt_lines(by_type)}\n"
+    
+    return f"""**{civ_name} Statistics:**
 - Win Rate: {civ_stats['win_rate']:.2f}%
 - Pick Rate: {civ_stats['pick_rate']:.2f}%
-- Meta Ranking: #{rank} out of {total_civs}
+- Meta Ranking: #{position['rank']} out of {position['total']} ({position['percentile']:.0f}th percentile)
 - Average Game Duration: {civ_stats.get('duration_average', 0):.0f} seconds
+{matchup_text}"""
 
+def generate_civ_specific_guide(civ_name, civ_stats, ranking, matchups=None, maps=None):
+    """Generate a guide for playing a specific civilization in the current meta"""
+    
+    prompt = f"""You are an expert Age of Empires 4 coach. Create a guide for playing {civ_name} in the current competitive meta.
+
+{civ_stats_block(civ_name, civ_stats, ranking, matchups, maps)}
 Provide practical advice for:
 1. Early game priorities (first 10 minutes)
 2. Mid game power spikes and strategies
@@ -143,28 +159,202 @@ Format as JSON:
 }}"""
 
     try:
-        response = client.chat.completions.create(
+        return cached_json_completion(
+            client,
             model="gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": "You are an expert Age of Empires 4 coach who provides practical, data-driven advice."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            response_format={"type": "json_object"}
+            system_prompt=GUIDE_SYSTEM_PROMPT,
+            user_prompt=prompt,
+            temperature=0.7
         )
-        
-        result = json.loads(response.choices[0].message.content)
-        return result
     except Exception as e:
         print(f"Error generating guide: {e}")
         return None
 
+def civ_guides_prompt(batch, ranking, matchups=None, maps=None):
+    """One prompt asking for a guide for every (civ id, (civ_name, civ_stats)) in batch"""
+    blocks = "\n".join(f"### {civ_id}\n{civ_stats_block(civ_name, civ_stats, ranking, matchups, maps)}"
+                       for civ_id, (civ_name, civ_stats) in batch)
+    return f"""You are an expert Age of Empires 4 coach. Create a guide for playing each of the civilizations below in the current competitive meta.
+
+{blocks}
+For each civilization, provide practical advice for:
+1. Early game priorities (first 10 minutes)
+2. Mid game power spikes and strategies
+3. Late game compositions
+4. Key matchups to be aware of
+5. Why this civ is performing at this level
+
+Answer with a JSON object keyed by the ids above ({', '.join(civ_id for civ_id, _ in batch)}). Each value has early_game, mid_game, late_game, key_units, key_technologies, reasoning and a confidence from 0 to 100."""
+
+def generate_civ_guides(batch, ranking, matchups=None, maps=None, retry=False):
+    """Generate the guides of several civilizations in one structured call
+
+    Returns {civ id: guide} with only the guides that pass validation, so
+    the caller can retry the rest. An answer is only cached when every
+    guide in it is valid, and retries bypass the cache.
+    """
+    civ_ids = [civ_id for civ_id, _ in batch]
+    try:
+        result = cached_json_completion(
+            client,
+            model="gpt-4.1-mini",
+            system_prompt=GUIDE_SYSTEM_PROMPT,
+            user_prompt=civ_guides_prompt(batch, ranking, matchups, maps),
+            temperature=0.7,
+            response_format=analysis_schema(civ_ids),
+            validate=lambda result: isinstance(result, dict) and
+                all(valid_analysis(result.get(civ_id)) for civ_id in civ_ids),
+            refresh=retry
+        )
+    except Exception as e:
+        print(f"Error generating guides: {e}")
+        return {}
+    return {civ_id: result[civ_id] for civ_id in civ_ids
+            if isinstance(result, dict) and valid_analysis(result.get(civ_id))}
+
+def guide_batcher(ranking, matchups=None, maps=None, workers=MAX_CONCURRENT_REQUESTS):
+    """Batcher packing civ guides into as few calls as the token budget allows"""
+    base = estimate_tokens(GUIDE_SYSTEM_PROMPT + civ_guides_prompt([], ranking, matchups, maps))
+    return Batcher(
+        lambda batch, retry: generate_civ_guides(batch, ranking, matchups, maps, retry),
+        cost=lambda item: estimate_tokens(civ_stats_block(*item, ranking, matchups, maps)) + ITEM_OUTPUT_TOKENS,
+        base=base,
+        fallback=lambda civ_id, item: generate_civ_specific_guide(*item, ranking, matchups, maps),
+        workers=workers,
+    )
+
+def analysis_record(title, civilization, matchup_vs, analysis, default_confidence=80,
+                    map_type="Open"):
+    """Turn an AI analysis into a Strategy Analysis record"""
+    return {
+        "title": title,
+        "civilization": civilization,
+        "matchup_vs": matchup_vs,
+        "map_type": map_type,
+        "early_game": analysis.get('early_game', ''),
+        "mid_game": analysis.get('mid_game', ''),
+        "late_game": analysis.get('late_game', ''),
+        "key_units": analysis.get('key_units', ''),
+        "key_technologies": analysis.get('key_technologies', ''),
+        "ai_confidence": analysis.get('confidence', default_confidence),
+        "ai_reasoning": analysis.get('reasoning', '')
+    }
+
+def analysis_jobs(stats_data, matchups=None, batch_guides=False, done=None,
+                  workers=MAX_CONCURRENT_REQUESTS, maps=None):
+    """Every report to generate: the meta overview, then one guide per civ
+
+    Each job is (key, label, generate, to_record) where key names the job
+    across runs, generate() calls the model and to_record(result) builds
+    the Airtable record. With batch_guides, the guides of every civ not
+    already done(key) are requested several civs per call. With maps, each
+    record's map_type is the civ's strongest map type (the most played one
+    for the report) instead of "Open".
+    """
+    patch = stats_data.get('patch', 'Unknown')
+    ranking = rank_snapshot(stats_data)
+    jobs = [(
+        "All",
+        "meta analysis report",
+        lambda: generate_meta_report(stats_data, matchups, ranking),
+        lambda result: analysis_record(f"Current Meta Analysis - Patch {patch}",
+                                       "All", "Meta Overview", result,
+                                       map_type=maps.most_played_type() if maps else "Open"),
+    )]
+    
+    batcher = guide_batcher(ranking, matchups, maps, workers) if batch_guides else None
+    ranked = ranking.ranked()
+    for entry in ranked:
+        civ_stats = entry['stats']
+        civ_name = civ_stats['civilization'].replace('_', ' ').title()
+        if entry['rank'] <= 3:
+            title, confidence = f"{civ_name} - Current Meta Guide (Top Tier)", 80
+        elif entry['rank'] > len(ranked) - 2:
+            title, confidence = f"{civ_name} - Underdog Guide (How to Win)", 75
+        else:
+            title, confidence = f"{civ_name} - Current Meta Guide", 80
+        civ_id = civ_stats['civilization']
+        if batcher is not None and not (done and done(civ_id)):
+            generate = batcher.add(civ_id, (civ_name, civ_stats))
+        else:
+            generate = lambda civ_name=civ_name, civ_stats=civ_stats: generate_civ_specific_guide(civ_name, civ_stats, ranking, matchups, maps)
+        map_type = maps.best_map_type(civ_id) if maps else "Open"
+        jobs.append((
+            civ_id,
+            f"guide for #{entry['rank']}: {civ_name}",
+            generate,
+            lambda result, title=title, civ_name=civ_name, confidence=confidence, map_type=map_type:
+                analysis_record(title, civ_name, "Current Meta", result, confidence, map_type),
+        ))
+    return jobs
+
+def generate_analysis(stats_data, matchups=None, workers=MAX_CONCURRENT_REQUESTS,
+                      batch_guides=False, maps=None):
+    """Generate the meta report and every civ guide and write them to Airtable
+
+    The model calls run concurrently; each record is queued for writing as
+    soon as its turn in the list comes up. Generated analyses and accepted
+    writes are journaled per patch, so a run that dies halfway resumes
+    without paying for those completions again or writing a row twice.
+    With batch_guides, civ guides are generated several per call; with
+    maps (a MapMatrix), prompts and map_type use each civ's map results.
+    """
+    journal = RunJournal(f"meta_analysis_{stats_data.get('patch', 'Unknown')}")
+    jobs = analysis_jobs(stats_data, matchups, batch_guides,
+                         done=lambda key: journal.has("write", key) or journal.has("analysis", key),
+                         workers=workers, maps=maps)
+    print("\n" + "="*60)
+    print(f"Generating meta report and {len(jobs) - 1} civilization guides ({workers} at a time)...")
+    print("="*60)
+    
+    def run_job(job):
+        key, _, generate, _ = job
+        if journal.has("write", key):
+            return True
+        return journal.step("analysis", key, generate)
+    
+    writer = open_writer(lambda: AirtableBatchWriter(BASE_ID, TABLE_NAME, AIRTABLE_TOKEN, AIRTABLE_API),
+                         BASE_ID, TABLE_NAME)
+    failed = 0
+    for (key, label, _, to_record), result in map_concurrently(run_job, jobs, workers):
+        if journal.has("write", key):
+            print(f"  ✓ Already written {label}")
+        elif result:
+            writer.add(to_record(result), on_written=lambda fields, record_id, key=key:
+                       journal.record("write", key, {"id": record_id}))
+            print(f"  ✓ Queued {label}")
+        else:
+            failed += 1
+            print(f"  ✗ Failed {label}")
+    
+    writer.close()
+    if failed or writer.failures:
+        # Keep the journal so the next run only redoes what is missing
+        journal.close()
+    else:
+        journal.complete()
+    print(f"\n✓ Created {writer.created} analysis records ({len(writer.failures)} failed)")
+    cache_stats = llm_cache.stats()
+    print(f"LLM cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate AI meta analysis into Airtable")
+    parser.add_argument('--workers', type=int, default=MAX_CONCURRENT_REQUESTS,
+                        help="OpenAI requests in flight at once")
+    parser.add_argument('--batch-guides', action='store_true',
+                        help="generate several civ guides per OpenAI call")
+    add_sink_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    configure_sinks(args)
+    configure_metrics(args)
+    
     print("="*60)
     print("AI Meta Analysis Generator (Standalone)")
     print("Using Live AoE4 World Data")
     print("="*60)
     
+    # Fetch current stats
     print("\nFetching live statistics...")
     stats_data = fetch_civ_stats("rm_solo")
     
@@ -178,59 +368,19 @@ if __name__ == "__main__":
     print(f"Loaded data for {len(civs)} civilizations")
     print(f"Patch: {patch}")
     
-    # Generate overall meta report
-    print("\n" + "="*60)
-    print("Generating Overall Meta Report...")
-    print("="*60)
+    # Matchup and map data sharpen the prompts but aren't required
+    matchups = fetch_matchup_matrix()
+    if matchups is not None:
+        print(f"Loaded matchups for {len(matchups.civs)} civilizations")
+    maps = fetch_map_matrix()
+    if maps is not None:
+        print(f"Loaded stats for {len(maps.maps)} maps")
     
-    meta_analysis = generate_meta_report(stats_data)
-    if meta_analysis:
-        record = {
-            "title": f"Current Meta Analysis - Patch {patch}",
-            "civilization": "All",
-            "matchup_vs": "Meta Overview",
-            "map_type": "Open",
-            "early_game": meta_analysis.get('early_game', ''),
-            "mid_game": meta_analysis.get('mid_game', ''),
-            "late_game": meta_analysis.get('late_game', ''),
-            "key_units": meta_analysis.get('key_units', ''),
-            "key_technologies": meta_analysis.get('key_technologies', ''),
-            "ai_confidence": meta_analysis.get('confidence', 80),
-            "ai_reasoning": meta_analysis.get('reasoning', '')
-        }
-        
-        result = create_airtable_record(record)
-        if result:
-            print("✓ Created meta analysis report")
-    
-    # Generate guides for top 3 civs
-    print("\n" + "="*60)
-    print("Generating Top Tier Guides...")
-    print("="*60)
+    generate_analysis(stats_data, matchups, args.workers, args.batch_guides, maps)
     
-    for i, civ_stats in enumerate(civs[:3]):
-        civ_name = civ_stats['civilization'].replace('_', ' ').title()
-        print(f"\nGenerating guide for #{i+1}: {civ_name}...")
-        
-        guide = generate_civ_specific_guide(civ_name, civ_stats, civs)
-        if guide:
-            record = {
-                "title": f"{civ_name} - Current Meta Guide (Top Tier)",
-                "civilization": civ_name,
-                "matchup_vs": "Current Meta",
-                "map_type": "Open",
-                "early_game": guide.get('early_game', ''),
-                "mid_game": guide.get('mid_game', ''),
-                "late_game": guide.get('late_game', ''),
-                "key_units": guide.get('key_units', ''),
-                "key_technologies": guide.get('key_technologies', ''),
-                "ai_confidence": guide.get('confidence', 80),
-                "ai_reasoning": guide.get('reasoning', '')
-            }
-            
-            result = create_airtable_record(record)
-            if result:
-                print(f"  ✓ Created guide for {civ_name}")
+    print()
+    print_rate_limit_summary()
+    finish_metrics(args)
     
     print("\n" + "="*60)
     print("Meta Analysis Complete!")
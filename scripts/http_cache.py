@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+On-disk HTTP cache for AoE4 World fetches
+Responses are reused across scripts and runs for a short TTL, then
+revalidated with ETag / If-Modified-Since so unchanged payloads come back
+as a cheap 304
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from http_client import decode_json, session
+from rate_limit import call_with_backoff, limiter
+from run_metrics import endpoint_label, metrics
+
+CACHE_DIR = os.getenv('AOE4_HTTP_CACHE_DIR', os.path.join('.cache', 'http'))
+DEFAULT_TTL = int(os.getenv('AOE4_HTTP_CACHE_TTL', '300'))
+MAX_CACHE_BYTES = int(os.getenv('AOE4_HTTP_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+
+class HttpCache:
+    """JSON GET responses stored one file per URL, evicted oldest-first by size
+
+    Entries younger than the TTL are returned without touching the network.
+    Older entries are revalidated with the stored validators; a 304 renews
+    the entry, anything else replaces it.
+    """
+
+    def __init__(self, cache_dir=None, ttl=None, max_bytes=None):
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.ttl = DEFAULT_TTL if ttl is None else ttl
+        self.max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+        self.lock = threading.Lock()
+        self.total_bytes = None
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def get_json(self, url, params=None, ttl=None):
+        """GET url and return the decoded JSON body, using the cache"""
+        with metrics.timed("fetch", endpoint_label(url)):
+            return self._get_json(url, params, ttl)
+
+    def _get_json(self, url, params, ttl):
+        ttl = self.ttl if ttl is None else ttl
+        path = self._path(url, params)
+        entry = self._load(path)
+        if entry and time.time() - entry['stored_at'] < ttl:
+            self.hits += 1
+            metrics.count("cache_lookups", cache="http", result="hit")
+            _touch(path)
+            return decode_json(entry['body'])
+
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = call_with_backoff(
+            limiter("aoe4world"),
+            lambda: session("aoe4world").get(url, params=params, headers=headers))
+        if response.status_code == 304 and entry:
+            self.revalidated += 1
+            metrics.count("cache_lookups", cache="http", result="revalidated")
+            entry['stored_at'] = time.time()
+            self._store(path, entry)
+            return decode_json(entry['body'])
+
+        response.raise_for_status()
+        self.misses += 1
+        metrics.count("cache_lookups", cache="http", result="miss")
+        metrics.count("bytes", len(response.content), upstream="aoe4world", direction="in")
+        body = response.text
+        data = decode_json(body)
+        self._store(path, {
+            'url': response.url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'stored_at': time.time(),
+            'body': body,
+        })
+        return data
+
+    def clear(self):
+        for name in _listdir(self.cache_dir):
+            _remove(os.path.join(self.cache_dir, name))
+        self.total_bytes = 0
+
+    def _path(self, url, params):
+        key = json.dumps([url, sorted((params or {}).items())], default=str)
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def _load(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, path, entry):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        payload = json.dumps(entry)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            old_size = os.path.getsize(path)
+        except OSError:
+            old_size = 0
+        with open(tmp_path, 'w') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = _directory_size(self.cache_dir)
+            else:
+                self.total_bytes += len(payload) - old_size
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until under max_bytes"""
+        files = []
+        for name in _listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        # Evict down to 90% so the next few writes don't each trigger a scan
+        target = self.max_bytes * 0.9
+        for _, size, path in files:
+            if total <= target:
+                break
+            _remove(path)
+            total -= size
+        self.total_bytes = total
+
+
+def _listdir(path):
+    try:
+        return [name for name in os.listdir(path) if name.endswith('.json')]
+    except OSError:
+        return []
+
+
+def _directory_size(path):
+    total = 0
+    for name in _listdir(path):
+        try:
+            total += os.path.getsize(os.path.join(path, name))
+        except OSError:
+            pass
+    return total
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# Shared by every fetch function in the process
+cache = HttpCache()
+
+
+def cached_get_json(url, params=None, ttl=None):
+    """GET a JSON endpoint through the shared on-disk cache"""
+    return cache.get_json(url, params=params, ttl=ttl)
+
+
+def get_json(url, params=None):
+    """GET a JSON endpoint without the cache
+
+    For pages that are read once, like per-player game pages and the pages
+    of a whole-ladder crawl: caching them would only evict the shared stats
+    payloads.
+    """
+    with metrics.timed("fetch", endpoint_label(url)):
+        response = call_with_backoff(
+            limiter("aoe4world"),
+            lambda: session("aoe4world").get(url, params=params))
+        response.raise_for_status()
+    metrics.count("bytes", len(response.content), upstream="aoe4world", direction="in")
+    return decode_json(response.content)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP sessions for every fetch and write path
+One keep-alive requests.Session per upstream with a sized connection pool,
+compressed responses, default timeouts and a fast JSON decoder
+"""
+import json
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+try:
+    import brotli  # noqa: F401  (urllib3 decodes "br" when this is installed)
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        ACCEPT_ENCODING = "gzip, deflate"
+
+CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '30'))
+
+# Connections kept open per upstream; sized for the thread pools that use them
+POOL_SIZES = {
+    "aoe4world": 16,
+    "airtable": 4,
+}
+USER_AGENT = "aoe4-sync/1.0 (+https://aoe4world.com/api)"
+
+
+class PooledSession(requests.Session):
+    """Session that applies default timeouts to every request"""
+
+    def __init__(self, pool_size, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        super().__init__()
+        self.timeout = timeout
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.headers.update({
+            'Accept-Encoding': ACCEPT_ENCODING,
+            'User-Agent': USER_AGENT,
+        })
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def session(upstream):
+    """The shared session for an upstream ("aoe4world", "airtable", ...)"""
+    with _lock:
+        if upstream not in _sessions:
+            _sessions[upstream] = PooledSession(POOL_SIZES.get(upstream, 4))
+        return _sessions[upstream]
+
+
+def decode_json(body):
+    """Decode a JSON body (str or bytes), with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def close_sessions():
+    with _lock:
+        for pooled in _sessions.values():
+            pooled.close()
+        _sessions.clear()
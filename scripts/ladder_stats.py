@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Rating distribution of a whole leaderboard
+Players are packed into typed columns (rating, wins, losses, rank_level,
+country) as the crawl streams in, then percentiles, rating histograms,
+win-rate spread and the country breakdown are computed for every segment
+in one vectorized pass and written as a few dozen summary rows
+"""
+import json
+from array import array
+
+import numpy as np
+
+from run_metrics import metrics
+
+# Width of a rating histogram bucket
+RATING_BUCKET = 50
+RATING_PERCENTILES = (10, 25, 50, 75, 90, 99)
+WIN_RATE_PERCENTILES = (10, 25, 50, 75, 90)
+# Countries beyond the most populous ones are summed up as "Other"
+TOP_COUNTRIES = 25
+
+
+class LadderColumns:
+    """The columns the distribution needs, one typed array each
+
+    About 14 bytes per player, so a full ladder fits comfortably in memory
+    where the player dicts would not. rank_level and country are stored as
+    codes into the names lists.
+    """
+
+    def __init__(self):
+        self.rating = array('i')
+        self.wins = array('i')
+        self.losses = array('i')
+        self.rank_level = array('h')
+        self.country = array('h')
+        self.rank_levels = {}
+        self.countries = {}
+
+    def __len__(self):
+        return len(self.rating)
+
+    def add(self, player):
+        rank_level = player.get('rank_level') or 'Unknown'
+        country = (player.get('country') or 'Unknown').upper()
+        self.rating.append(int(player.get('rating') or 0))
+        self.wins.append(int(player.get('wins') or 0))
+        self.losses.append(int(player.get('losses') or 0))
+        self.rank_level.append(self.rank_levels.setdefault(rank_level, len(self.rank_levels)))
+        self.country.append(self.countries.setdefault(country, len(self.countries)))
+
+    def extend(self, players):
+        for player in players:
+            self.add(player)
+        return self
+
+
+def group_percentiles(values, groups, n_groups, percentiles):
+    """Linear-interpolated percentiles of values within each group
+
+    Returns a n_groups × len(percentiles) array; empty groups are NaN.
+    """
+    order = np.lexsort((values, groups))
+    ordered = values[order].astype(float)
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    result = np.full((n_groups, len(percentiles)), np.nan)
+    present = counts > 0
+    for k, q in enumerate(percentiles):
+        position = starts[present] + (counts[present] - 1) * (q / 100)
+        low = np.floor(position).astype(int)
+        high = np.ceil(position).astype(int)
+        result[present, k] = ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+    return result
+
+
+def group_moments(values, groups, n_groups):
+    """Count, mean and standard deviation of values within each group"""
+    counts = np.bincount(groups, minlength=n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.bincount(groups, weights=values, minlength=n_groups) / counts
+        square = np.bincount(groups, weights=values * values, minlength=n_groups) / counts
+        std = np.sqrt(np.maximum(square - mean * mean, 0))
+    return counts, mean, std
+
+
+class LadderDistribution:
+    """Distribution statistics of every segment of a ladder
+
+    A segment is a (segment_type, name) pair: ("rank_level", "All Ranks"),
+    ("rank_level", "conqueror_3"), ("country", "DE"), ... Every statistic
+    is an array with one entry per segment.
+    """
+
+    def __init__(self, columns, top_countries=TOP_COUNTRIES, bucket=RATING_BUCKET):
+        rating = np.frombuffer(columns.rating, dtype=np.int32)
+        wins = np.frombuffer(columns.wins, dtype=np.int32).astype(np.int64)
+        losses = np.frombuffer(columns.losses, dtype=np.int32).astype(np.int64)
+        rank_level = np.frombuffer(columns.rank_level, dtype=np.int16)
+        country = np.frombuffer(columns.country, dtype=np.int16)
+        self.total = len(rating)
+        self.bucket = bucket
+
+        # Segments: the whole ladder, every rank level, then the top countries
+        # and "Other". groups holds each player's segment in each grouping.
+        level_names = list(columns.rank_levels)
+        country_names = list(columns.countries)
+        country_counts = np.bincount(country, minlength=len(country_names))
+        top = np.argsort(-country_counts, kind='stable')[:top_countries]
+        country_segment = np.full(len(country_names), len(top))
+        country_segment[top] = np.arange(len(top))
+        country_labels = [country_names[c] for c in top]
+        if len(country_names) > len(top):
+            country_labels.append("Other")
+
+        self.segments = ([("rank_level", "All Ranks")] +
+                         [("rank_level", name) for name in level_names] +
+                         [("country", name) for name in country_labels])
+        n = len(self.segments)
+        level_offset = 1
+        country_offset = 1 + len(level_names)
+        groupings = [
+            np.zeros(self.total, dtype=np.int64),
+            level_offset + rank_level.astype(np.int64),
+            country_offset + country_segment[country],
+        ]
+        # Every player appears once per grouping; stack the groupings so each
+        # statistic is one bincount or sort over all segments at once
+        groups = np.concatenate(groupings)
+        ratings = np.tile(rating, len(groupings))
+        games = np.tile(wins + losses, len(groupings))
+        played = games > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            win_rate = np.tile(wins, len(groupings)) / games * 100
+
+        self.players, self.rating_mean, self.rating_std = group_moments(ratings, groups, n)
+        # The 0th and 100th percentiles are the min and max
+        quantiles = group_percentiles(ratings, groups, n, (0,) + RATING_PERCENTILES + (100,))
+        self.rating_min = quantiles[:, 0]
+        self.rating_max = quantiles[:, -1]
+        self.rating_percentiles = quantiles[:, 1:-1]
+        _, self.games_mean, _ = group_moments(games, groups, n)
+        _, self.win_rate_mean, self.win_rate_std = group_moments(win_rate[played], groups[played], n)
+        self.win_rate_percentiles = group_percentiles(win_rate[played], groups[played], n,
+                                                      WIN_RATE_PERCENTILES)
+
+        # Shared bucket edges, so histograms of different segments line up
+        self.rating_floor = int(rating.min()) // bucket * bucket if self.total else 0
+        bins = (rating - self.rating_floor) // bucket
+        n_bins = int(bins.max()) + 1 if self.total else 0
+        self.histogram = np.bincount(groups * n_bins + np.tile(bins, len(groupings)),
+                                     minlength=n * n_bins).reshape(n, n_bins)
+
+        # Rank levels best first, by their median rating
+        median = self.rating_percentiles[:, RATING_PERCENTILES.index(50)]
+        levels = sorted(range(level_offset, country_offset), key=lambda s: -median[s])
+        self.order = [0] + levels + list(range(country_offset, n))
+
+    def histogram_counts(self, s):
+        """{bucket floor: players} of one segment, empty buckets left out"""
+        return {str(self.rating_floor + b * self.bucket): int(count)
+                for b, count in enumerate(self.histogram[s]) if count}
+
+    def records(self, leaderboard, timestamp):
+        """One Airtable record per segment"""
+
+        def number(value, digits=2):
+            return None if np.isnan(value) else round(float(value), digits)
+
+        records = []
+        for s in self.order:
+            segment_type, segment = self.segments[s]
+            record = {
+                "leaderboard": leaderboard,
+                "segment_type": segment_type,
+                "segment": segment,
+                "players": int(self.players[s]),
+                "share": number(self.players[s] / self.total * 100),
+                "rating_mean": number(self.rating_mean[s], 1),
+                "rating_std": number(self.rating_std[s], 1),
+                "rating_min": number(self.rating_min[s], 0),
+                "rating_max": number(self.rating_max[s], 0),
+            }
+            for q, value in zip(RATING_PERCENTILES, self.rating_percentiles[s]):
+                record[f"rating_p{q}"] = number(value, 1)
+            record["win_rate_mean"] = number(self.win_rate_mean[s])
+            record["win_rate_std"] = number(self.win_rate_std[s])
+            for q, value in zip(WIN_RATE_PERCENTILES, self.win_rate_percentiles[s]):
+                record[f"win_rate_p{q}"] = number(value)
+            record["games_mean"] = number(self.games_mean[s], 1)
+            record["rating_histogram"] = json.dumps(self.histogram_counts(s))
+            record["histogram_bucket"] = self.bucket
+            record["last_updated"] = timestamp
+            records.append(record)
+        return records
+
+
+def ladder_distribution(players, top_countries=TOP_COUNTRIES, bucket=RATING_BUCKET):
+    """Distribution of an iterable of leaderboard players, or None if it is empty
+
+    players are consumed as they arrive, so a streaming crawl never holds
+    more than its prefetch window of player dicts.
+    """
+    columns = LadderColumns().extend(players)
+    if not len(columns):
+        return None
+    with metrics.timed("transform", "ladder"):
+        return LadderDistribution(columns, top_countries, bucket)
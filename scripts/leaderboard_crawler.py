@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Concurrent leaderboard crawler
+Fetches as many leaderboard pages as top_n needs, several at a time, and
+hands players on as each page arrives
+"""
+import itertools
+import math
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Pages fetched in parallel; keep this modest, AoE4 World is a free API
+MAX_WORKERS = 8
+# Pages fetched or waiting to be consumed at once
+PREFETCH_PAGES = 2 * MAX_WORKERS
+# Failed pages in a row that end a crawl with no known last page
+MAX_FAILED_PAGES = 3
+
+
+def crawl_leaderboard(fetch_page, leaderboard="rm_solo", top_n=50, workers=MAX_WORKERS,
+                      prefetch=PREFETCH_PAGES):
+    """Yield the top_n players of a leaderboard, a page at a time
+
+    fetch_page(leaderboard, page=n) returns the API response for one page,
+    or None on failure. Page 1 is fetched first to learn the page size and
+    total player count, then the remaining pages are fetched concurrently
+    and yielded in the order they complete, so callers can start writing
+    before the crawl finishes. Failed pages are reported and skipped.
+    top_n=None crawls the whole ladder; without a total_count it stops at
+    the first short page, or after MAX_FAILED_PAGES failed pages in a row.
+
+    At most `prefetch` pages are in flight or waiting for the caller at any
+    time, so a slow writer holds back the crawl instead of letting fetched
+    pages pile up; the crawler's own memory does not depend on top_n.
+    """
+    first = fetch_page(leaderboard, page=1)
+    if not first:
+        return
+    players = first.get('players', [])
+    per_page = first.get('per_page') or len(players)
+    if top_n is None:
+        top_n = math.inf
+    yield from players[:min(top_n, len(players))]
+    if not per_page or len(players) < per_page:
+        return
+
+    last_page = math.inf if top_n == math.inf else math.ceil(top_n / per_page)
+    total = first.get('total_count')
+    if total is not None:
+        last_page = min(last_page, math.ceil(total / per_page))
+    if last_page < 2:
+        return
+
+    # Without a total, a whole-ladder crawl runs until it reaches a short page
+    pages = itertools.count(2)
+    failed_in_a_row = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {}
+
+        def stop_after(page):
+            nonlocal last_page
+            last_page = min(last_page, page)
+            for pending, pending_page in list(futures.items()):
+                if pending_page > page and pending.cancel():
+                    del futures[pending]
+
+        def refill():
+            while len(futures) < max(1, prefetch):
+                page = next(pages, None)
+                if page is None or page > last_page:
+                    return
+                futures[pool.submit(fetch_page, leaderboard, page=page)] = page
+
+        refill()
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in sorted(done, key=futures.get):
+                page = futures.pop(future)
+                if page > last_page:
+                    # Finished before the crawl was cut short
+                    continue
+                try:
+                    data = future.result()
+                except Exception as e:
+                    data = None
+                    print(f"Error fetching {leaderboard} page {page}: {e}")
+                if not data:
+                    print(f"Skipping {leaderboard} page {page}")
+                    failed_in_a_row += 1
+                    if last_page == math.inf and failed_in_a_row >= MAX_FAILED_PAGES:
+                        # Nothing else would end an open-ended crawl while
+                        # the API keeps failing
+                        print(f"Stopping {leaderboard} crawl after {failed_in_a_row} failed pages in a row")
+                        stop_after(page)
+                    refill()
+                    continue
+                failed_in_a_row = 0
+
+                players = data.get('players', [])
+                if len(players) < per_page:
+                    # Past the end of the ladder: later pages would be empty
+                    stop_after(page)
+                remaining = top_n - (page - 1) * per_page
+                # Queue the next pages before handing this one over, so they
+                # download while the caller writes
+                refill()
+                yield from players[:max(0, min(remaining, len(players)))]
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Batched structured completions
+Packs many small keyed requests (one guide per civ) into a few chat
+completions sized by a token budget, asks for one JSON object per key
+through a JSON schema, and retries only the keys whose answer fails
+validation
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_pool import MAX_CONCURRENT_REQUESTS
+
+# Prompt plus expected answer per batched request, in tokens
+TOKEN_BUDGET = int(os.getenv('OPENAI_BATCH_TOKEN_BUDGET', '12000'))
+# Expected answer size of one item (a civ guide), in tokens
+ITEM_OUTPUT_TOKENS = int(os.getenv('OPENAI_BATCH_ITEM_TOKENS', '800'))
+# Extra rounds for keys that come back missing or invalid
+BATCH_RETRIES = 2
+
+# Fields of an analysis / guide answer
+ANALYSIS_TEXT_FIELDS = ("early_game", "mid_game", "late_game", "key_units",
+                        "key_technologies", "reasoning")
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token for English)"""
+    return len(text) // 4 + 1
+
+
+def analysis_schema(keys, name="civ_guides"):
+    """JSON schema asking for one analysis object per key"""
+    analysis = {
+        "type": "object",
+        "properties": {field: {"type": "string"} for field in ANALYSIS_TEXT_FIELDS},
+        "required": list(ANALYSIS_TEXT_FIELDS) + ["confidence"],
+        "additionalProperties": False,
+    }
+    analysis["properties"]["confidence"] = {"type": "integer"}
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {key: analysis for key in keys},
+                "required": list(keys),
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+def valid_analysis(value):
+    """Whether one answer has every field filled in and a 0-100 confidence"""
+    if not isinstance(value, dict):
+        return False
+    if not all(isinstance(value.get(field), str) and value[field].strip()
+               for field in ANALYSIS_TEXT_FIELDS):
+        return False
+    confidence = value.get('confidence')
+    return isinstance(confidence, int) and 0 <= confidence <= 100
+
+
+def plan_batches(items, cost, budget=TOKEN_BUDGET, base=0):
+    """Split (key, item) pairs into consecutive batches within a token budget
+
+    cost(item) is an item's prompt plus answer tokens and base the shared
+    part of every request. A batch always holds at least one item.
+    """
+    batches = []
+    batch, used = [], base
+    for key, item in items:
+        tokens = cost(item)
+        if batch and used + tokens > budget:
+            batches.append(batch)
+            batch, used = [], base
+        batch.append((key, item))
+        used += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class Batcher:
+    """Answers keyed requests with as few batched calls as the budget allows
+
+        batcher = Batcher(run_batch, cost, base=system_tokens, fallback=run_one)
+        generate = batcher.add("mongols", civ)
+        ...
+        guide = generate()
+
+    run_batch(batch, retry) takes a list of (key, item) and returns {key:
+    answer} with only the answers that passed validation; retry is True for
+    the retry rounds, which must not be answered from a cache. The first generate() call
+    plans the batches and starts all of them, `workers` at a time; each
+    generate() then waits for its own batch. Keys missing from an answer
+    are sent again together, up to `retries` more times, and then go
+    through fallback(key, item) one at a time.
+    """
+
+    def __init__(self, run_batch, cost, budget=TOKEN_BUDGET, base=0, fallback=None,
+                 retries=BATCH_RETRIES, workers=MAX_CONCURRENT_REQUESTS):
+        self.run_batch = run_batch
+        self.cost = cost
+        self.budget = budget
+        self.base = base
+        self.fallback = fallback
+        self.retries = retries
+        self.workers = workers
+        self.items = []
+        self.futures = None  # key -> Future of its batch
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.retried = 0
+        self.fallbacks = 0
+
+    def add(self, key, item):
+        """Register an item; returns a callable producing its answer"""
+        self.items.append((key, item))
+        return lambda: self.result(key)
+
+    def batches(self):
+        return plan_batches(self.items, self.cost, self.budget, self.base)
+
+    def result(self, key):
+        with self.lock:
+            if self.futures is None:
+                self._start()
+        return self.futures[key].result().get(key)
+
+    def _start(self):
+        batches = self.batches()
+        if batches:
+            print(f"Batching {len(self.items)} requests into {len(batches)} calls")
+        pool = ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(batches) or 1)))
+        self.futures = {}
+        for batch in batches:
+            future = pool.submit(self._run, batch)
+            for key, _ in batch:
+                self.futures[key] = future
+        pool.shutdown(wait=False)
+
+    def _call(self, batch, retry=False):
+        with self.lock:
+            self.calls += 1
+        try:
+            return self.run_batch(batch, retry) or {}
+        except Exception as e:
+            print(f"Error in batched call: {e}")
+            return {}
+
+    def _run(self, batch):
+        answers = self._call(batch)
+        for _ in range(self.retries):
+            missing = [(key, item) for key, item in batch if key not in answers]
+            if not missing:
+                break
+            with self.lock:
+                self.retried += len(missing)
+            print(f"Retrying {len(missing)} of {len(batch)} batched requests: "
+                  f"{', '.join(str(key) for key, _ in missing)}")
+            answers.update(self._call(missing, retry=True))
+        if self.fallback is not None:
+            for key, item in batch:
+                if key not in answers:
+                    with self.lock:
+                        self.fallbacks += 1
+                    answer = self.fallback(key, item)
+                    if answer:
+                        answers[key] = answer
+        return answers
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Persistent cache for LLM completions
+Completions are keyed on a hash of model, system prompt, user prompt and
+temperature, so re-running the analysis on unchanged data costs nothing
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from rate_limit import call_with_backoff, limiter
+from run_metrics import metrics
+
+CACHE_PATH = os.getenv('OPENAI_CACHE_PATH', os.path.join('.cache', 'llm.sqlite3'))
+CACHE_TTL = int(os.getenv('OPENAI_CACHE_TTL', str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv('OPENAI_CACHE_MAX_ENTRIES', '2000'))
+
+
+def completion_key(model, system_prompt, user_prompt, temperature, response_format=None):
+    """Content address of a completion request"""
+    request = [model, system_prompt, user_prompt, temperature]
+    if response_format is not None:
+        request.append(response_format)
+    payload = json.dumps(request, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LlmCache:
+    """SQLite-backed completion cache with TTL and least-recently-used eviction"""
+
+    def __init__(self, path=None, ttl=None, max_entries=None):
+        self.path = path or CACHE_PATH
+        self.ttl = CACHE_TTL if ttl is None else ttl
+        self.max_entries = CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.lock = threading.Lock()
+        self.db = None
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        if self.db is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    content TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )""")
+            self.db.execute("CREATE INDEX IF NOT EXISTS completions_last_used "
+                            "ON completions (last_used)")
+        return self.db
+
+    def get(self, key):
+        """Cached content for key, or None if missing or expired"""
+        now = time.time()
+        with self.lock:
+            db = self._connect()
+            row = db.execute("SELECT content, created_at FROM completions WHERE key = ?",
+                             (key,)).fetchone()
+            if row and now - row[1] < self.ttl:
+                db.execute("UPDATE completions SET last_used = ? WHERE key = ?", (now, key))
+                db.commit()
+                self.hits += 1
+                return row[0]
+            if row:
+                db.execute("DELETE FROM completions WHERE key = ?", (key,))
+                db.commit()
+            self.misses += 1
+            return None
+
+    def put(self, key, content):
+        now = time.time()
+        with self.lock:
+            db = self._connect()
+            db.execute("INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?)",
+                       (key, content, now, now))
+            db.execute("""
+                DELETE FROM completions WHERE key IN (
+                    SELECT key FROM completions ORDER BY last_used DESC
+                    LIMIT -1 OFFSET ?)""", (self.max_entries,))
+            db.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+# Shared by every completion in the process
+cache = LlmCache()
+
+
+def cached_json_completion(client, model, system_prompt, user_prompt, temperature,
+                           response_format=None, validate=None, refresh=False):
+    """Run a JSON-mode chat completion, reusing an identical earlier answer
+
+    response_format defaults to a plain JSON object; pass a json_schema
+    format (see llm_batch.analysis_schema) for structured output. Only
+    responses that parse as JSON, and pass validate(result) when given, are
+    cached, so a malformed answer is retried on the next run instead of
+    being replayed. refresh skips the cache lookup, e.g. when retrying an
+    answer that came back incomplete.
+    """
+    with metrics.timed("llm", model):
+        return _cached_json_completion(client, model, system_prompt, user_prompt, temperature,
+                                       response_format, validate, refresh)
+
+
+def _cached_json_completion(client, model, system_prompt, user_prompt, temperature,
+                            response_format=None, validate=None, refresh=False):
+    key = completion_key(model, system_prompt, user_prompt, temperature, response_format)
+    content = None if refresh else cache.get(key)
+    if content is not None:
+        metrics.count("cache_lookups", cache="llm", result="hit")
+        return json.loads(content)
+    metrics.count("cache_lookups", cache="llm", result="miss")
+
+    # The shared limiter handles 429s, so the client's own retries are off
+    response = call_with_backoff(
+        limiter("openai"),
+        lambda: client.with_options(max_retries=0).chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=temperature,
+            response_format=response_format or {"type": "json_object"}
+        ))
+    content = response.choices[0].message.content
+    metrics.count("bytes", len(system_prompt.encode()) + len(user_prompt.encode()), upstream="openai", direction="out")
+    metrics.count("bytes", len((content or '').encode()), upstream="openai", direction="in")
+    usage = getattr(response, 'usage', None)
+    if usage is not None:
+        metrics.count("llm_tokens", usage.prompt_tokens or 0, model=model, kind="prompt")
+        metrics.count("llm_tokens", usage.completion_tokens or 0, model=model, kind="completion")
+    result = json.loads(content)
+    if validate is None or validate(result):
+        cache.put(key, content)
+    return result
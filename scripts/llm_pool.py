@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Bounded-concurrency runner for blocking LLM calls
+The OpenAI client is thread-safe, so completions run on a small thread
+pool instead of one after another
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Completions in flight at once; raise it if your OpenAI rate limit allows
+MAX_CONCURRENT_REQUESTS = int(os.getenv('OPENAI_MAX_CONCURRENCY', '6'))
+
+
+def map_concurrently(fn, items, workers=MAX_CONCURRENT_REQUESTS):
+    """Call fn(item) for every item with at most `workers` calls in flight
+
+    Yields (item, result) in the order of items, each as soon as it and
+    every item before it have finished. Output order is deterministic while
+    later calls are still running. A call that raises is reported and
+    yielded with a None result.
+    """
+    items = list(items)
+
+    def call(item):
+        try:
+            return fn(item)
+        except Exception as e:
+            print(f"Error in concurrent call: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        yield from zip(items, pool.map(call, items))
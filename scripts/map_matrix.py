@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Map × civ statistics from the AoE4 World maps endpoint
+Every leaderboard × rank_level slice is held in one set of NumPy arrays
+(slice × map × civ), so per-map records and each civ's results by map type
+come out of the whole stack at once
+"""
+import json
+import os
+
+import numpy as np
+
+from http_cache import cached_get_json
+from matchup_matrix import wilson_interval
+from run_metrics import metrics
+from stat_slices import MAX_WORKERS, fetch_slices, slice_label, stat_slices
+
+API_BASE = os.getenv('AOE4_WORLD_API', "https://aoe4world.com/api/v0")
+# Map × civ cells with fewer games are too noisy to call a civ strong or weak there
+MIN_GAMES = 30
+# Strategy Analysis single-select options
+MAP_TYPE_CHOICES = ("Open", "Closed", "Water", "Hybrid")
+
+
+def fetch_map_stats(leaderboard="rm_solo", rank_level=None):
+    """Fetch map × civilization statistics from AoE4 World API"""
+    url = f"{API_BASE}/stats/{leaderboard}/maps"
+    params = {}
+    if rank_level:
+        params['rank_level'] = rank_level
+
+    try:
+        return cached_get_json(url, params=params)
+    except Exception as e:
+        print(f"Error fetching map stats: {e}")
+        return None
+
+
+def map_type(row):
+    """Open / Closed / Water / Hybrid as tagged by the API, or None
+
+    Maps the API doesn't tag (or tags with something else) stay
+    unclassified and are left out of the per-type results.
+    """
+    tagged = row.get('map_type') or row.get('type')
+    if tagged and str(tagged).title() in MAP_TYPE_CHOICES:
+        return str(tagged).title()
+    return None
+
+
+def map_rows(data):
+    """(map row, civ row) pairs of a maps response
+
+    The endpoint nests each map's civs under `civilizations`; flat rows with
+    both `map` and `civilization` are read as their own map row.
+    """
+    for row in data.get('data', []):
+        civ_rows = row.get('civilizations')
+        if civ_rows is None:
+            yield row, row
+            continue
+        for civ_row in civ_rows:
+            yield row, civ_row
+
+
+def map_name(row):
+    return row.get('map') or row.get('map_name') or str(row.get('map_id', 'unknown'))
+
+
+class MapMatrix:
+    """Counts for every slice: games[s, m, c] is civ c's games on map m in slice s"""
+
+    def __init__(self, slices, patches, maps, map_types, civs, games, wins, picks,
+                 map_games, durations):
+        self.slices = list(slices)
+        self.patches = list(patches)
+        self.maps = list(maps)
+        self.map_types = list(map_types)  # None where the API gave no type
+        self.civs = list(civs)
+        self.civ_index = {civ: i for i, civ in enumerate(self.civs)}
+        self.games = games
+        self.wins = wins
+        self.picks = picks  # pick rate in percent, as reported
+        self.map_games = map_games  # slice × map
+        self.durations = durations  # slice × map, seconds (NaN if unknown)
+
+    @property
+    def win_rate(self):
+        """Win rate per cell in percent (NaN where no games were played)"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.games > 0, self.wins / self.games * 100, np.nan)
+
+    def slice_index(self, leaderboard="rm_solo", rank_level=None):
+        return self.slices.index((leaderboard, rank_level))
+
+    def type_results(self, civ, leaderboard="rm_solo", rank_level=None, min_games=MIN_GAMES):
+        """A civ's win rate per map type in one slice, best first
+
+        Returns a list of (map_type, win_rate, games) for the types with at
+        least min_games games, ordered by the lower Wilson bound so a type
+        only leads when the data backs it up.
+        """
+        if civ not in self.civ_index or (leaderboard, rank_level) not in self.slices:
+            return []
+        s, c = self.slice_index(leaderboard, rank_level), self.civ_index[civ]
+        types = np.array(self.map_types)
+        results = []
+        for kind in MAP_TYPE_CHOICES:
+            on_type = types == kind
+            games = int(self.games[s, on_type, c].sum())
+            if games >= min_games:
+                wins = float(self.wins[s, on_type, c].sum())
+                low, _ = wilson_interval(wins, games)
+                results.append((float(low), kind, wins / games * 100, games))
+        results.sort(key=lambda item: -item[0])
+        return [(kind, rate, games) for _, kind, rate, games in results]
+
+    def best_map_type(self, civ, leaderboard="rm_solo", rank_level=None, default="Open"):
+        results = self.type_results(civ, leaderboard, rank_level)
+        return results[0][0] if results else default
+
+    def most_played_type(self, leaderboard="rm_solo", rank_level=None, default="Open"):
+        """The map type with the most games in a slice"""
+        if (leaderboard, rank_level) not in self.slices or not self.maps:
+            return default
+        s = self.slice_index(leaderboard, rank_level)
+        types = np.array(self.map_types)
+        totals = [(int(self.map_games[s, types == kind].sum()), kind) for kind in MAP_TYPE_CHOICES]
+        games, kind = max(totals, key=lambda item: item[0])
+        return kind if games else default
+
+    def records(self, timestamp, civ_name=str, min_games=MIN_GAMES, n=3):
+        """One compact Airtable record per map per slice
+
+        Each civ's win rate, pick rate and games on the map are packed into
+        the civ_stats JSON field as {civ: [win_rate, pick_rate, games]}, and
+        the n strongest and weakest civs with min_games are spelled out.
+        """
+        rate = self.win_rate
+        low, high = wilson_interval(self.wins, self.games)
+        records = []
+        for s, m in zip(*np.nonzero(self.map_games > 0)):
+            leaderboard, rank_level = self.slices[s]
+            played = np.flatnonzero(self.games[s, m] > 0)
+            usable = played[self.games[s, m, played] >= min_games]
+            best = usable[np.argsort(-low[s, m, usable], kind='stable')][:n]
+            worst = usable[np.argsort(high[s, m, usable], kind='stable')][:n]
+
+            def summary(indexes):
+                return ", ".join(f"{civ_name(self.civs[c])} {rate[s, m, c]:.1f}%" for c in indexes)
+
+            duration = self.durations[s, m]
+            records.append({
+                "map": self.maps[m],
+                "map_type": self.map_types[m],
+                "leaderboard": leaderboard,
+                "rank_level": rank_level if rank_level else "All Ranks",
+                "games_count": int(self.map_games[s, m]),
+                "avg_game_duration": 0 if np.isnan(duration) else int(duration),
+                "civilizations": len(played),
+                "strongest_civs": summary(best),
+                "weakest_civs": summary(worst),
+                "civ_stats": json.dumps({
+                    self.civs[c]: [round(float(rate[s, m, c]), 2), round(float(self.picks[s, m, c]), 2),
+                                   int(self.games[s, m, c])]
+                    for c in played}, separators=(',', ':')),
+                "patch": self.patches[s],
+                "last_updated": timestamp,
+            })
+        return records
+
+
+def map_prompt_lines(results):
+    """Prompt lines for type_results() rows"""
+    return "\n".join(f"- {kind} maps: {rate:.1f}% WR over {games} games"
+                     for kind, rate, games in results)
+
+
+def build_map_matrix(results):
+    """Stack the maps responses of every slice into one MapMatrix
+
+    results is a list of ((leaderboard, rank_level), data).
+    """
+    results = [(slice_, data) for slice_, data in results if data]
+    slices = [slice_ for slice_, _ in results]
+    patches = [data.get('patch', 'unknown') for _, data in results]
+    rows = [(s, map_row, civ_row) for s, (_, data) in enumerate(results)
+            for map_row, civ_row in map_rows(data) if civ_row.get('civilization')]
+    maps = sorted({map_name(map_row) for _, map_row, _ in rows})
+    map_index = {name: i for i, name in enumerate(maps)}
+    civs = sorted({civ_row['civilization'] for _, _, civ_row in rows})
+    civ_index = {civ: i for i, civ in enumerate(civs)}
+
+    types = {}
+    for _, map_row, _ in rows:
+        if types.get(map_name(map_row)) is None:
+            types[map_name(map_row)] = map_type(map_row)
+    map_types = [types.get(name) for name in maps]
+
+    shape = (len(slices), len(maps), len(civs))
+    games = np.zeros(shape, dtype=np.int64)
+    wins = np.zeros(shape, dtype=float)
+    picks = np.zeros(shape, dtype=float)
+    map_games = np.zeros(shape[:2], dtype=np.int64)
+    durations = np.full(shape[:2], np.nan)
+    duration_total = np.zeros(shape[:2])
+    duration_games = np.zeros(shape[:2])
+    if rows:
+        s = np.array([s for s, _, _ in rows])
+        m = np.array([map_index[map_name(map_row)] for _, map_row, _ in rows])
+        c = np.array([civ_index[civ_row['civilization']] for _, _, civ_row in rows])
+        count = np.array([civ_row.get('games_count', 0) for _, _, civ_row in rows], dtype=np.int64)
+        won = np.array([civ_row.get('win_count', civ_row.get('wins_count', np.nan))
+                        for _, _, civ_row in rows], dtype=float)
+        rate = np.array([civ_row.get('win_rate', 0) for _, _, civ_row in rows], dtype=float)
+        games[s, m, c] = count
+        wins[s, m, c] = np.where(np.isnan(won), np.round(rate / 100 * count), won)
+        picks[s, m, c] = [civ_row.get('pick_rate', 0) for _, _, civ_row in rows]
+
+        # Map totals come from the map row when it has them, else from its civs
+        map_games[:] = games.sum(axis=2)
+        for s_, (_, data) in enumerate(results):
+            for row in data.get('data', []):
+                m_ = map_index.get(map_name(row))
+                if m_ is None:
+                    continue
+                if 'civilizations' in row and row.get('games_count'):
+                    map_games[s_, m_] = row['games_count']
+                if row.get('duration_average'):
+                    # Flat rows give one average per civ: weight each by its games
+                    weight = row.get('games_count') or 1
+                    duration_total[s_, m_] += row['duration_average'] * weight
+                    duration_games[s_, m_] += weight
+        np.divide(duration_total, duration_games, out=durations, where=duration_games > 0)
+    return MapMatrix(slices, patches, maps, map_types, civs, games, wins, picks,
+                     map_games, durations)
+
+
+def fetch_map_matrix(leaderboards=("rm_solo",), rank_levels=(None,),
+                     workers=MAX_WORKERS, fetch=fetch_map_stats):
+    """Fetch every slice concurrently and build the matrix, or None if all failed"""
+    slices = stat_slices(leaderboards, rank_levels)
+    results = []
+    for slice_, data in fetch_slices(fetch, slices, workers):
+        if not data:
+            print(f"  {slice_label(*slice_)}: failed to fetch map stats")
+            continue
+        results.append((slice_, data))
+    if not results:
+        return None
+    # Keep the slice order stable no matter which fetch finished first
+    results.sort(key=lambda item: slices.index(item[0]))
+    with metrics.timed("transform", "maps"):
+        return build_map_matrix(results)
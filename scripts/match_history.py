@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Incremental match-history ingestion for leaderboard players
+Pulls /players/:profile_id/games for the players of the latest
+sync_leaderboard run, several players at a time, and keeps only games newer
+than each player's high-water mark. Games are stored once in a local SQLite
+file even when both sides of a match are ingested.
+
+    python scripts/match_history.py --leaderboard rm_solo --top-n 500
+"""
+import argparse
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from http_cache import get_json
+from rate_limit import print_rate_limit_summary
+from run_metrics import add_metrics_arguments, configure_metrics, finish_metrics
+from snapshot_store import snapshot_store
+
+API_BASE = os.getenv('AOE4_WORLD_API', "https://aoe4world.com/api/v0")
+MATCH_DB = os.getenv('AOE4_MATCH_DB', os.path.join('.data', 'matches.sqlite3'))
+# Players fetched at once; the shared AoE4 World limiter still caps the rate
+MAX_WORKERS = int(os.getenv('AOE4_MATCH_WORKERS', '8'))
+# Pages read for a player with no history yet (50 games per page)
+MAX_PAGES = int(os.getenv('AOE4_MATCH_MAX_PAGES', '10'))
+# Pages read for a player with a high-water mark before giving up on
+# reaching it this run
+MAX_CATCHUP_PAGES = int(os.getenv('AOE4_MATCH_CATCHUP_PAGES', '100'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    game_id INTEGER PRIMARY KEY,
+    leaderboard TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    duration INTEGER,
+    map TEXT,
+    patch TEXT,
+    average_rating INTEGER
+);
+CREATE INDEX IF NOT EXISTS games_started
+    ON games (leaderboard, started_at);
+
+CREATE TABLE IF NOT EXISTS game_players (
+    game_id INTEGER NOT NULL,
+    profile_id INTEGER NOT NULL,
+    team INTEGER NOT NULL,
+    civilization TEXT,
+    result TEXT,
+    rating INTEGER,
+    rating_diff INTEGER,
+    PRIMARY KEY (game_id, profile_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS game_players_profile
+    ON game_players (profile_id, game_id);
+
+CREATE TABLE IF NOT EXISTS high_water (
+    profile_id INTEGER NOT NULL,
+    leaderboard TEXT NOT NULL,
+    last_started_at TEXT NOT NULL,
+    PRIMARY KEY (profile_id, leaderboard)
+) WITHOUT ROWID;
+"""
+
+
+def fetch_player_games(profile_id, leaderboard="rm_solo", since=None, page=1):
+    """Fetch one page of a player's games from AoE4 World API, newest first
+
+    Pages skip the on-disk HTTP cache; the high-water marks already keep
+    reruns from fetching old games again.
+    """
+    url = f"{API_BASE}/players/{profile_id}/games"
+    params = {"leaderboard": leaderboard, "page": page}
+    if since:
+        params['since'] = since
+
+    try:
+        return get_json(url, params=params)
+    except Exception as e:
+        print(f"Error fetching games for {profile_id}: {e}")
+        return None
+
+
+def game_players(game):
+    """(team index, player dict) for everyone in a game"""
+    for team, members in enumerate(game.get('teams') or []):
+        for member in members:
+            yield team, member.get('player', member)
+
+
+class MatchStore:
+    """Compact SQLite store of games, their players and per-player high-water marks"""
+
+    def __init__(self, path=None):
+        self.path = path or MATCH_DB
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.db.close()
+
+    def high_water_marks(self, leaderboard):
+        """profile_id -> started_at of the newest stored game"""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT profile_id, last_started_at FROM high_water WHERE leaderboard = ?",
+                (leaderboard,))
+            return {row[0]: row[1] for row in rows}
+
+    def add_games(self, games, leaderboard):
+        """Store games not seen before; returns how many were new"""
+        game_rows = [(g['game_id'], g.get('leaderboard') or leaderboard, g['started_at'],
+                      g.get('duration'), g.get('map'), g.get('patch'), g.get('average_rating'))
+                     for g in games]
+        player_rows = [(g['game_id'], p.get('profile_id'), team, p.get('civilization'),
+                        p.get('result'), p.get('rating'), p.get('rating_diff'))
+                       for g in games for team, p in game_players(g)]
+        with self.lock, self.db:
+            before = self.db.total_changes
+            self.db.executemany(
+                "INSERT OR IGNORE INTO games VALUES (?, ?, ?, ?, ?, ?, ?)", game_rows)
+            new = self.db.total_changes - before
+            self.db.executemany(
+                "INSERT OR IGNORE INTO game_players VALUES (?, ?, ?, ?, ?, ?, ?)", player_rows)
+        return new
+
+    def set_high_water(self, profile_id, leaderboard, started_at):
+        with self.lock, self.db:
+            self.db.execute("""
+                INSERT INTO high_water VALUES (?, ?, ?)
+                ON CONFLICT (profile_id, leaderboard) DO UPDATE
+                SET last_started_at = MAX(last_started_at, excluded.last_started_at)""",
+                (profile_id, leaderboard, started_at))
+
+    def player_games(self, profile_id, leaderboard="rm_solo", limit=50):
+        """A player's stored games, newest first, with their own civ and result"""
+        with self.lock:
+            rows = self.db.execute("""
+                SELECT g.*, p.civilization, p.result, p.rating, p.rating_diff
+                FROM game_players p JOIN games g USING (game_id)
+                WHERE p.profile_id = ? AND g.leaderboard = ?
+                ORDER BY g.started_at DESC
+                LIMIT ?""", (profile_id, leaderboard, limit))
+            return [dict(row) for row in rows]
+
+
+def fetch_new_games(fetch, profile_id, leaderboard, since=None, max_pages=MAX_PAGES):
+    """(games, complete) for one player, or None on failure
+
+    games are the finished games started after `since`. Pages are read
+    newest first and reading stops at the first page that reaches the
+    high-water mark, so a player with no new games costs one request.
+    complete is False when max_pages ran out before the mark or the end of
+    the player's history was reached, i.e. older new games were not read.
+    """
+    games = []
+    for page in range(1, max_pages + 1):
+        data = fetch(profile_id, leaderboard, since, page)
+        if data is None:
+            return None
+        batch = data.get('games', [])
+        reached = False
+        for game in batch:
+            if since and game.get('started_at', '') <= since:
+                reached = True
+                break
+            # Ongoing games are picked up once finished, on a later run
+            if not game.get('ongoing') and game.get('started_at'):
+                games.append(game)
+        per_page = data.get('per_page') or len(batch)
+        if reached or not batch or len(batch) < per_page:
+            return games, True
+    return games, False
+
+
+def ingest_match_history(profile_ids, leaderboard="rm_solo", workers=MAX_WORKERS,
+                         fetch=fetch_player_games, store=None, max_pages=MAX_PAGES,
+                         catchup_pages=MAX_CATCHUP_PAGES):
+    """Pull new games for every player concurrently into the match store
+
+    A player's high-water mark only moves once all of their new games are
+    stored, so a failed fetch is simply retried in full on the next run. A
+    new player's backfill stops after max_pages; a known player is read for
+    up to catchup_pages, and if that still doesn't reach their mark it stays
+    put and the gap is read again next run.
+    """
+    store = store or MatchStore()
+    marks = store.high_water_marks(leaderboard)
+    fetched = new = failed = behind = 0
+
+    print(f"\n{'='*60}")
+    print(f"Ingesting {leaderboard} games for {len(profile_ids)} players "
+          f"({sum(1 for p in profile_ids if p in marks)} incremental)")
+    print(f"{'='*60}")
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(fetch_new_games, fetch, profile_id, leaderboard,
+                               marks.get(profile_id),
+                               catchup_pages if profile_id in marks else max_pages): profile_id
+                   for profile_id in profile_ids}
+        for future in as_completed(futures):
+            profile_id = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Error ingesting games for {profile_id}: {e}")
+                result = None
+            if result is None:
+                failed += 1
+                continue
+            games, complete = result
+            if games:
+                fetched += len(games)
+                new += store.add_games(games, leaderboard)
+            if not complete and profile_id in marks:
+                # Moving the mark now would skip the games that weren't read
+                behind += 1
+                print(f"  {profile_id}: more than {catchup_pages} pages of new games, "
+                      f"continuing next run")
+            elif games:
+                store.set_high_water(profile_id, leaderboard,
+                                     max(g['started_at'] for g in games))
+
+    print(f"\n✓ {fetched} games fetched, {new} new, {fetched - new} already stored "
+          f"from the other side, {failed} players failed, {behind} not caught up")
+    return {"fetched": fetched, "new": new, "failed": failed, "behind": behind}
+
+
+def leaderboard_profile_ids(leaderboard="rm_solo", top_n=None):
+    """Profile ids from the latest sync_leaderboard snapshot"""
+    players = snapshot_store().latest_players(leaderboard)
+    ids = [p['profile_id'] for p in players if p.get('profile_id')]
+    return ids[:top_n] if top_n else ids
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest match history for leaderboard players")
+    parser.add_argument('--leaderboard', default="rm_solo")
+    parser.add_argument('--top-n', type=int, help="only the best N players of the latest snapshot")
+    parser.add_argument('--profile-ids', type=int, nargs='+',
+                        help="ingest these players instead of the leaderboard snapshot")
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    configure_metrics(args)
+
+    profile_ids = args.profile_ids or leaderboard_profile_ids(args.leaderboard, args.top_n)
+    if not profile_ids:
+        print(f"No {args.leaderboard} players in the snapshot history; run sync_leaderboard first")
+    else:
+        ingest_match_history(profile_ids, args.leaderboard, args.workers)
+        print()
+        print_rate_limit_summary()
+        finish_metrics(args)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Civ-vs-civ matchup matrix from the AoE4 World matchups endpoint
+Every leaderboard × rank_level slice is held in one set of NumPy arrays
+(slice × civ × civ), with sample counts and Wilson confidence intervals
+computed on the whole stack at once
+"""
+import os
+
+import numpy as np
+
+from http_cache import cached_get_json
+from run_metrics import metrics
+from stat_slices import MAX_WORKERS, fetch_slices, slice_label, stat_slices
+
+API_BASE = os.getenv('AOE4_WORLD_API', "https://aoe4world.com/api/v0")
+# z for a 95% interval
+Z_95 = 1.96
+# Matchups with fewer games are too noisy to report
+MIN_GAMES = 30
+
+
+def fetch_matchups(leaderboard="rm_solo", rank_level=None):
+    """Fetch civ-vs-civ statistics from AoE4 World API"""
+    url = f"{API_BASE}/stats/{leaderboard}/matchups"
+    params = {}
+    if rank_level:
+        params['rank_level'] = rank_level
+
+    try:
+        return cached_get_json(url, params=params)
+    except Exception as e:
+        print(f"Error fetching matchups: {e}")
+        return None
+
+
+def wilson_interval(wins, games, z=Z_95):
+    """Wilson score interval of wins/games, elementwise, in percent
+
+    Cells without games are NaN.
+    """
+    wins = np.asarray(wins, dtype=float)
+    games = np.asarray(games, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = wins / games
+        z2 = z * z
+        denominator = 1 + z2 / games
+        center = (p + z2 / (2 * games)) / denominator
+        margin = z * np.sqrt(p * (1 - p) / games + z2 / (4 * games * games)) / denominator
+    low = np.where(games > 0, (center - margin) * 100, np.nan)
+    high = np.where(games > 0, (center + margin) * 100, np.nan)
+    return low, high
+
+
+class MatchupMatrix:
+    """Win/game counts for every slice: games[s, i, j] is civ i vs civ j in slice s"""
+
+    def __init__(self, slices, patches, civs, games, wins):
+        self.slices = list(slices)
+        self.patches = list(patches)
+        self.civs = list(civs)
+        self.civ_index = {civ: i for i, civ in enumerate(self.civs)}
+        self.games = games
+        self.wins = wins
+
+    @property
+    def win_rate(self):
+        """Win rate of the row civ in percent (NaN where no games were played)"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.games > 0, self.wins / self.games * 100, np.nan)
+
+    def interval(self, z=Z_95):
+        return wilson_interval(self.wins, self.games, z)
+
+    def slice_index(self, leaderboard="rm_solo", rank_level=None):
+        return self.slices.index((leaderboard, rank_level))
+
+    def civ_matchups(self, civ, leaderboard="rm_solo", rank_level=None,
+                     n=3, min_games=MIN_GAMES):
+        """A civ's best and worst matchups in one slice
+
+        Best are ranked by the lower Wilson bound and worst by the upper one,
+        so a matchup only makes either list when the data backs it up.
+        Returns (best, worst), each a list of (opponent, win_rate, games, low, high).
+        """
+        if civ not in self.civ_index:
+            return [], []
+        s, i = self.slice_index(leaderboard, rank_level), self.civ_index[civ]
+        games = self.games[s, i]
+        low, high = wilson_interval(self.wins[s, i], games)
+        rate = self.win_rate[s, i]
+        usable = np.flatnonzero((games >= min_games) & (np.arange(len(self.civs)) != i))
+        best = usable[np.argsort(-low[usable], kind='stable')][:n]
+        worst = usable[np.argsort(high[usable], kind='stable')][:n]
+
+        def rows(indexes):
+            return [(self.civs[j], float(rate[j]), int(games[j]), float(low[j]), float(high[j]))
+                    for j in indexes]
+        return rows(best), rows(worst)
+
+    def lopsided(self, leaderboard="rm_solo", rank_level=None, n=5, min_games=MIN_GAMES):
+        """Up to n matchups furthest from 50%, each pair once (favoured civ first)
+
+        Only pairs whose whole Wilson interval is above 50% count, so every
+        row is one where the first civ demonstrably beats the second.
+        """
+        s = self.slice_index(leaderboard, rank_level)
+        low, _ = wilson_interval(self.wins[s], self.games[s])
+        # Distance of the lower bound above 50% only counts the favoured side
+        edge = np.where((self.games[s] >= min_games) & (low > 50), low - 50, -np.inf)
+        order = np.argsort(-edge, axis=None, kind='stable')
+        rate = self.win_rate[s]
+        result = []
+        seen = set()
+        for flat in order:
+            i, j = np.unravel_index(flat, edge.shape)
+            if not np.isfinite(edge[i, j]) or len(result) == n:
+                break
+            if (j, i) in seen:
+                continue
+            seen.add((i, j))
+            result.append((self.civs[i], self.civs[j], float(rate[i, j]), int(self.games[s, i, j])))
+        return result
+
+    def records(self, timestamp, civ_name=str, min_games=1):
+        """One Airtable record per civ pair per slice with at least min_games"""
+        low, high = self.interval()
+        rate = self.win_rate
+        records = []
+        for s, i, j in zip(*np.nonzero(self.games >= min_games)):
+            leaderboard, rank_level = self.slices[s]
+            records.append({
+                "civilization": civ_name(self.civs[i]),
+                "opponent": civ_name(self.civs[j]),
+                "leaderboard": leaderboard,
+                "rank_level": rank_level if rank_level else "All Ranks",
+                "win_rate": round(float(rate[s, i, j]), 2),
+                "win_rate_low": round(float(low[s, i, j]), 2),
+                "win_rate_high": round(float(high[s, i, j]), 2),
+                "games_count": int(self.games[s, i, j]),
+                "patch": self.patches[s],
+                "last_updated": timestamp,
+            })
+        return records
+
+
+def matchup_prompt_lines(rows):
+    """Prompt lines for civ_matchups() rows"""
+    return "\n".join(
+        f"- vs {opponent.replace('_', ' ').title()}: {rate:.1f}% WR over {games} games "
+        f"(95% CI {low:.1f}-{high:.1f}%)"
+        for opponent, rate, games, low, high in rows)
+
+
+def build_matchup_matrix(results):
+    """Stack the matchup responses of every slice into one MatchupMatrix
+
+    results is a list of ((leaderboard, rank_level), data). When a response
+    only lists one direction of a pair, the other is filled in from it.
+    """
+    results = [(slice_, data) for slice_, data in results if data]
+    slices = [slice_ for slice_, _ in results]
+    patches = [data.get('patch', 'unknown') for _, data in results]
+    rows = [(s, row) for s, (_, data) in enumerate(results) for row in data.get('data', [])]
+    civs = sorted({row['civilization'] for _, row in rows} |
+                  {row['other_civilization'] for _, row in rows})
+    index = {civ: i for i, civ in enumerate(civs)}
+
+    shape = (len(slices), len(civs), len(civs))
+    games = np.zeros(shape, dtype=np.int64)
+    wins = np.zeros(shape, dtype=float)
+    if rows:
+        s = np.array([s for s, _ in rows])
+        i = np.array([index[row['civilization']] for _, row in rows])
+        j = np.array([index[row['other_civilization']] for _, row in rows])
+        count = np.array([row.get('games_count', 0) for _, row in rows], dtype=np.int64)
+        won = np.array([row.get('win_count', row.get('wins_count', np.nan)) for _, row in rows],
+                       dtype=float)
+        rate = np.array([row.get('win_rate', 0) for _, row in rows], dtype=float)
+        games[s, i, j] = count
+        wins[s, i, j] = np.where(np.isnan(won), np.round(rate / 100 * count), won)
+
+    # Mirror pairs that only came back in one direction
+    games_t = games.transpose(0, 2, 1)
+    missing = (games == 0) & (games_t > 0)
+    wins = np.where(missing, games_t - wins.transpose(0, 2, 1), wins)
+    games = np.where(missing, games_t, games)
+    return MatchupMatrix(slices, patches, civs, games, wins)
+
+
+def fetch_matchup_matrix(leaderboards=("rm_solo",), rank_levels=(None,),
+                         workers=MAX_WORKERS, fetch=fetch_matchups):
+    """Fetch every slice concurrently and build the matrix, or None if all failed"""
+    slices = stat_slices(leaderboards, rank_levels)
+    results = []
+    for slice_, data in fetch_slices(fetch, slices, workers):
+        if not data:
+            print(f"  {slice_label(*slice_)}: failed to fetch matchups")
+            continue
+        results.append((slice_, data))
+    if not results:
+        return None
+    # Keep the slice order stable no matter which fetch finished first
+    results.sort(key=lambda item: slices.index(item[0]))
+    with metrics.timed("transform", "matchups"):
+        return build_matchup_matrix(results)
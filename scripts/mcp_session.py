@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Persistent MCP session for Airtable writes
+Keeps one stdio connection to the Airtable MCP server open for the whole
+run instead of starting manus-mcp-cli (and a fresh handshake) per record
+"""
+import json
+import os
+import shlex
+import subprocess
+import threading
+import time
+from concurrent.futures import Future
+
+from run_metrics import metrics
+
+# Command that starts the Airtable MCP server over stdio, e.g.
+# "npx -y airtable-mcp-server". Without it writes go through manus-mcp-cli.
+MCP_SERVER_COMMAND = os.getenv('AIRTABLE_MCP_COMMAND', '')
+MCP_PROTOCOL_VERSION = "2024-11-05"
+
+# Tools that create several records in one call, checked in this order
+BULK_CREATE_TOOLS = ("create_records", "batch_create_records")
+BULK_BATCH_SIZE = 10
+MAX_IN_FLIGHT = 8
+CALL_TIMEOUT = 60
+
+
+class McpError(Exception):
+    """Raised when the server answers with a JSON-RPC error or a tool error"""
+
+
+class McpSession:
+    """JSON-RPC client for an MCP server running as a child process
+
+    Requests are written as soon as they are made and matched to responses
+    by id on a reader thread, so several calls can be in flight at once.
+    """
+
+    def __init__(self, command):
+        if isinstance(command, str):
+            command = shlex.split(command)
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+        )
+        self.next_id = 0
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.reader = threading.Thread(target=self._read_loop, daemon=True)
+        self.reader.start()
+        self.tools = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def initialize(self, timeout=CALL_TIMEOUT):
+        """Run the MCP handshake and load the server's tool list"""
+        self.request("initialize", {
+            "protocolVersion": MCP_PROTOCOL_VERSION,
+            "capabilities": {},
+            "clientInfo": {"name": "aoe4-sync", "version": "1.0"},
+        }).result(timeout)
+        self.notify("notifications/initialized")
+        tools = self.request("tools/list").result(timeout)
+        self.tools = {tool.get('name') for tool in tools.get('tools', [])}
+        return self
+
+    def request(self, method, params=None):
+        """Send a request and return a Future for its result"""
+        future = Future()
+        with self.lock:
+            self.next_id += 1
+            request_id = self.next_id
+            self.pending[request_id] = future
+            self._write({"jsonrpc": "2.0", "id": request_id, "method": method,
+                         "params": params or {}})
+        return future
+
+    def notify(self, method, params=None):
+        with self.lock:
+            self._write({"jsonrpc": "2.0", "method": method, "params": params or {}})
+
+    def call_tool(self, name, arguments):
+        """Call a tool; the Future raises McpError if the tool reports an error"""
+        result = Future()
+
+        def unwrap(future):
+            try:
+                value = future.result()
+            except Exception as e:
+                result.set_exception(e)
+                return
+            if value.get('isError'):
+                result.set_exception(McpError(_content_text(value)))
+            else:
+                result.set_result(value)
+
+        self.request("tools/call", {"name": name, "arguments": arguments}).add_done_callback(unwrap)
+        return result
+
+    def close(self):
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except Exception:
+                self.process.kill()
+        self._fail_pending(McpError("session closed"))
+
+    def _write(self, message):
+        try:
+            line = json.dumps(message) + "\n"
+            self.process.stdin.write(line)
+            self.process.stdin.flush()
+            metrics.count("bytes", len(line), upstream="mcp", direction="out")
+        except (BrokenPipeError, ValueError, OSError) as e:
+            future = self.pending.pop(message.get('id'), None)
+            if future:
+                future.set_exception(McpError(f"server connection lost: {e}"))
+
+    def _read_loop(self):
+        for line in self.process.stdout:
+            metrics.count("bytes", len(line), upstream="mcp", direction="in")
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if 'id' not in message or 'method' in message:
+                continue  # server notifications and requests are not used here
+            with self.lock:
+                future = self.pending.pop(message['id'], None)
+            if future is None:
+                continue
+            if 'error' in message:
+                error = message['error']
+                future.set_exception(McpError(error.get('message', str(error))))
+            else:
+                future.set_result(message.get('result', {}))
+        self._fail_pending(McpError("server exited"))
+
+    def _fail_pending(self, error):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+
+def _content_text(result):
+    return " ".join(item.get('text', '') for item in result.get('content', [])
+                    if item.get('type') == 'text') or "tool call failed"
+
+
+def cli_call_tool(name, arguments):
+    """Call an Airtable MCP tool through manus-mcp-cli, returning its stdout"""
+    cmd = [
+        "manus-mcp-cli", "tool", "call", name,
+        "--server", "airtable",
+        "--input", json.dumps(arguments)
+    ]
+
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"Error: {result.stderr}")
+        return None
+    return result.stdout
+
+
+def cli_create_record(base_id, table_id, fields):
+    """Create a record in Airtable using manus-mcp-cli"""
+    return cli_call_tool("create_record", {
+        "baseId": base_id,
+        "tableId": table_id,
+        "fields": fields
+    })
+
+
+def record_ids(text):
+    """Pull record ids out of a tool result, in order, where it has any"""
+    starts = [i for i in (text.find('{'), text.find('[')) if i >= 0]
+    if not starts:
+        return []
+    try:
+        data = json.loads(text[min(starts):])
+    except ValueError:
+        return []
+    if isinstance(data, dict):
+        data = data.get('records', [data])
+    return [item.get('id') for item in data if isinstance(item, dict)]
+
+
+def open_session(command=None):
+    """Start and initialize an MCP session, or return None if that fails"""
+    command = command if command is not None else MCP_SERVER_COMMAND
+    if not command:
+        return None
+    session = None
+    try:
+        session = McpSession(command)
+        return session.initialize()
+    except Exception as e:
+        print(f"MCP session unavailable ({e}), falling back to manus-mcp-cli")
+        if session:
+            session.close()
+        return None
+
+
+_shared = {'enabled': False, 'session': None}
+_shared_lock = threading.Lock()
+
+
+def keep_session_open(enabled=True):
+    """Let every writer reuse one long-lived session (for the sync daemon)"""
+    with _shared_lock:
+        _shared['enabled'] = enabled
+
+
+def shared_session(command=None):
+    """The process-wide session, restarted if the server has exited"""
+    with _shared_lock:
+        session = _shared['session']
+        if session is None or session.process.poll() is not None:
+            if session is not None:
+                session.close()
+            session = _shared['session'] = open_session(command)
+        return session
+
+
+def close_shared_session():
+    with _shared_lock:
+        if _shared['session'] is not None:
+            _shared['session'].close()
+            _shared['session'] = None
+
+
+class McpRecordWriter:
+    """Write Airtable records over one MCP session
+
+    Calls are pipelined up to max_in_flight at a time, and records are sent
+    10 per call when the server has a bulk create tool. If no session can be
+    started each call goes through manus-mcp-cli as before.
+
+        with McpRecordWriter(BASE_ID, TABLE_ID) as writer:
+            for record in records:
+                writer.add(record)
+        print(writer.created)
+
+    Every write method takes an optional on_written(fields, record_id)
+    callback that runs once the server has accepted the record.
+    """
+
+    def __init__(self, base_id, table_id, session=None, command=None,
+                 max_in_flight=MAX_IN_FLIGHT, batch_size=BULK_BATCH_SIZE):
+        self.base_id = base_id
+        self.table_id = table_id
+        if session is None and _shared['enabled']:
+            session = shared_session(command)
+        self.owns_session = session is None
+        self.session = session if session is not None else open_session(command)
+        self.bulk_tool = None
+        if self.session:
+            self.bulk_tool = next((t for t in BULK_CREATE_TOOLS if t in self.session.tools), None)
+        self.create_batch_size = batch_size if self.bulk_tool else 1
+        self.update_batch_size = batch_size
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.in_flight = []
+        self.pending = {'create': [], 'update': []}
+        self.created = 0
+        self.updated = 0
+        self.calls = 0
+        self.failures = []  # (fields, error message) per rejected record
+        self.results_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def add(self, fields, on_written=None):
+        """Queue a new record, sending it once a full call's worth is waiting"""
+        self._queue('create', {"fields": fields}, fields, on_written)
+
+    def update(self, record_id, fields, on_written=None):
+        """Queue an update of the given fields on an existing record"""
+        self._queue('update', {"id": record_id, "fields": fields}, fields, on_written)
+
+    def upsert(self, fields, merge_on, on_written=None):
+        """Create a record whose key is not in Airtable yet
+
+        The MCP server has no upsert tool, so records without a known id
+        are created; UpsertIndex keeps the id for later updates.
+        """
+        self.add(fields, on_written)
+
+    def flush(self):
+        """Send queued records and wait for every in-flight call"""
+        for kind in self.pending:
+            if self.pending[kind]:
+                self._send(kind)
+        for future in self.in_flight:
+            try:
+                future.result(CALL_TIMEOUT)
+            except Exception:
+                pass  # recorded in _done
+        self.in_flight = []
+
+    def close(self):
+        self.flush()
+        if self.session and self.owns_session:
+            self.session.close()
+
+    def _queue(self, kind, body, fields, on_written):
+        queue = self.pending[kind]
+        queue.append((body, fields, on_written))
+        size = self.create_batch_size if kind == 'create' else self.update_batch_size
+        if len(queue) >= size:
+            self._send(kind)
+
+    def _send(self, kind):
+        chunk, self.pending[kind] = self.pending[kind], []
+        arguments = {"baseId": self.base_id, "tableId": self.table_id}
+        if kind == 'update':
+            tool = "update_records"
+            arguments["records"] = [body for body, _, _ in chunk]
+        elif self.bulk_tool:
+            tool = self.bulk_tool
+            arguments["records"] = [body for body, _, _ in chunk]
+        else:
+            tool = "create_record"
+            arguments["fields"] = chunk[0][0]["fields"]
+
+        self.calls += 1
+        metrics.count("requests", upstream="mcp")
+        if self.session is None:
+            with metrics.timed("write", "mcp-cli"):
+                output = cli_call_tool(tool, arguments)
+            if output is None:
+                self._record_failure(chunk, f"manus-mcp-cli {tool} failed")
+            else:
+                self._record_success(kind, chunk, output)
+            return
+
+        self.in_flight = [f for f in self.in_flight if not f.done()]
+        self.slots.acquire()
+        start = time.perf_counter()
+        future = self.session.call_tool(tool, arguments)
+        future.add_done_callback(lambda f: self._done(f, kind, chunk, start))
+        self.in_flight.append(future)
+
+    def _done(self, future, kind, chunk, start):
+        self.slots.release()
+        try:
+            result = future.result()
+        except Exception as e:
+            metrics.observe("write", time.perf_counter() - start, "mcp", error=True)
+            self._record_failure(chunk, str(e))
+            return
+        metrics.observe("write", time.perf_counter() - start, "mcp")
+        self._record_success(kind, chunk, _content_text(result))
+
+    def _record_success(self, kind, chunk, output):
+        ids = record_ids(output)
+        ids = [(body.get("id") or (ids[i] if i < len(ids) else None))
+               for i, (body, _, _) in enumerate(chunk)]
+        with self.results_lock:
+            if kind == 'update':
+                self.updated += len(chunk)
+            else:
+                self.created += len(chunk)
+        metrics.count("records", len(chunk), stage="write", target="mcp")
+        for (body, fields, on_written), record_id in zip(chunk, ids):
+            if on_written:
+                on_written(fields, record_id)
+
+    def _record_failure(self, chunk, message):
+        metrics.count("failures", len(chunk), stage="write", target="mcp")
+        with self.results_lock:
+            for _, fields, _ in chunk:
+                self.failures.append((fields, message))
+        print(f"Error: {message}")
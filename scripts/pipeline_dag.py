@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Dependency-graph runner for the sync pipelines
+Each stage runs on a thread pool as soon as the stages it depends on have
+finished, and receives their results in memory
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from run_metrics import metrics
+
+
+class Stage:
+    """One step of a pipeline
+
+    fn is called with the results of deps, in order. If a dependency fails,
+    the stage is skipped, unless that dependency is optional, in which case
+    the stage gets None for it.
+    """
+
+    def __init__(self, name, fn, deps=(), optional=False):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.optional = optional
+
+
+def select_stages(stages, targets):
+    """The target stages plus everything they depend on"""
+    by_name = {stage.name: stage for stage in stages}
+    selected = {}
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name in selected:
+            continue
+        if name not in by_name:
+            raise ValueError(f"Unknown stage: {name}")
+        selected[name] = by_name[name]
+        pending.extend(by_name[name].deps)
+    return [stage for stage in stages if stage.name in selected]
+
+
+def run_dag(stages, workers=4):
+    """Run the stages, independent ones in parallel
+
+    Returns name -> {"status": "ok" | "failed" | "skipped", "result",
+    "seconds", "error"}.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in by_name]
+        if missing:
+            raise ValueError(f"Stage {stage.name} depends on unknown stages: {', '.join(missing)}")
+
+    outcomes = {}
+    pending = list(stages)
+    running = {}
+
+    def usable(dep):
+        outcome = outcomes[dep]
+        return outcome['status'] == 'ok' or by_name[dep].optional
+
+    def timed(stage, args):
+        start = time.perf_counter()
+        try:
+            with metrics.timed("dag", stage.name):
+                return stage.fn(*args), None, time.perf_counter() - start
+        except Exception as e:
+            return None, e, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        while pending or running:
+            for stage in list(pending):
+                if not all(dep in outcomes for dep in stage.deps):
+                    continue
+                pending.remove(stage)
+                blocked = [dep for dep in stage.deps if not usable(dep)]
+                if blocked:
+                    print(f"- Skipping {stage.name} (needs {', '.join(blocked)})")
+                    outcomes[stage.name] = {"status": "skipped", "result": None,
+                                            "seconds": 0.0, "error": None}
+                    continue
+                args = [outcomes[dep]['result'] for dep in stage.deps]
+                print(f"▶ Starting {stage.name}")
+                running[pool.submit(timed, stage, args)] = stage
+
+            if not running:
+                if pending:
+                    names = ', '.join(stage.name for stage in pending)
+                    raise ValueError(f"Dependency cycle between stages: {names}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                result, error, seconds = future.result()
+                if error is None:
+                    print(f"✓ {stage.name} finished in {seconds:.2f}s")
+                    outcomes[stage.name] = {"status": "ok", "result": result,
+                                            "seconds": seconds, "error": None}
+                else:
+                    print(f"✗ {stage.name} failed after {seconds:.2f}s: {error}")
+                    outcomes[stage.name] = {"status": "failed", "result": None,
+                                            "seconds": seconds, "error": error}
+    return outcomes
+
+
+def print_dag_summary(outcomes, elapsed):
+    """Per-stage timings next to the wall-clock time of the whole run"""
+    print(f"\n{'Stage':<22} {'Status':<8} {'Seconds':>8}")
+    for name, outcome in outcomes.items():
+        print(f"{name:<22} {outcome['status']:<8} {outcome['seconds']:>8.2f}")
+    total = sum(outcome['seconds'] for outcome in outcomes.values())
+    print(f"\nWall clock {elapsed:.2f}s for {total:.2f}s of stage work")
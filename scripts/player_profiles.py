@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Player profile enrichment from /players/:profile_id
+Adds each leaderboard player's modes, peak ratings, streak and recent
+rating history. Profiles are cached per field group in SQLite: identity
+fields (name, country, Steam id) live for days, per-mode stats for hours,
+and a mode whose game count still matches the leaderboard row is renewed
+without a request. Concurrent lookups of the same profile share one fetch.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from http_client import decode_json, session
+from rate_limit import call_with_backoff, limiter
+from run_metrics import endpoint_label, metrics
+
+API_BASE = os.getenv('AOE4_WORLD_API', "https://aoe4world.com/api/v0")
+PROFILE_DB = os.getenv('AOE4_PROFILE_DB', os.path.join('.cache', 'profiles.sqlite3'))
+# Name, country, Steam id and site url rarely change
+PROFILE_TTL = int(os.getenv('AOE4_PROFILE_TTL', str(7 * 24 * 3600)))
+# Ratings, streaks and rating history; renewed early when the leaderboard
+# row shows no new games
+MODES_TTL = int(os.getenv('AOE4_PROFILE_MODES_TTL', str(6 * 3600)))
+# Profiles looked up at once; the shared AoE4 World limiter still caps the rate
+MAX_WORKERS = int(os.getenv('AOE4_PROFILE_WORKERS', '8'))
+# Players enriched or waiting to be consumed at once
+PREFETCH = 4 * MAX_WORKERS
+# Rating history points kept per mode
+HISTORY_POINTS = 30
+
+IDENTITY_FIELDS = ("name", "country", "steam_id", "site_url")
+MODE_FIELDS = ("rating", "max_rating", "max_rating_7d", "max_rating_1m", "rank",
+               "rank_level", "streak", "games_count", "wins_count", "losses_count",
+               "last_game_at")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    profile_id INTEGER PRIMARY KEY,
+    identity TEXT NOT NULL,
+    identity_at REAL NOT NULL,
+    modes TEXT NOT NULL,
+    modes_at REAL NOT NULL
+);
+"""
+
+
+def fetch_player_profile(profile_id):
+    """Fetch one player profile from AoE4 World API
+
+    Profiles bypass the on-disk HTTP cache: there are thousands of them and
+    the profile cache below keeps only the fields that are used.
+    """
+    url = f"{API_BASE}/players/{profile_id}"
+    with metrics.timed("fetch", endpoint_label(url)):
+        response = call_with_backoff(limiter("aoe4world"),
+                                     lambda: session("aoe4world").get(url))
+        response.raise_for_status()
+    metrics.count("bytes", len(response.content), upstream="aoe4world", direction="in")
+    return decode_json(response.content)
+
+
+def rating_history(mode):
+    """The last HISTORY_POINTS (unix time, rating) points of a mode, oldest first
+
+    The API sends history as {timestamp: {"rating": ...}}; lists of
+    {"timestamp"/"updated_at", "rating"} are read as well.
+    """
+    history = mode.get('rating_history') or {}
+    if isinstance(history, dict):
+        points = [(int(float(ts)), point.get('rating') if isinstance(point, dict) else point)
+                  for ts, point in history.items()]
+    else:
+        points = [(int(point.get('timestamp') or point.get('updated_at') or 0), point.get('rating'))
+                  for point in history if isinstance(point, dict)]
+    points = sorted((ts, rating) for ts, rating in points if rating is not None)
+    return points[-HISTORY_POINTS:]
+
+
+def compact_profile(profile):
+    """(identity, modes) field groups kept from a /players/:id response"""
+    identity = {field: profile.get(field) for field in IDENTITY_FIELDS if profile.get(field) is not None}
+    modes = {}
+    for name, mode in (profile.get('modes') or {}).items():
+        if not isinstance(mode, dict):
+            continue
+        summary = {field: mode[field] for field in MODE_FIELDS if mode.get(field) is not None}
+        if 'games_count' not in summary and 'wins_count' in summary:
+            summary['games_count'] = summary['wins_count'] + summary.get('losses_count', 0)
+        summary['history'] = rating_history(mode)
+        modes[name] = summary
+    return identity, modes
+
+
+def mode_unchanged(mode, player):
+    """Whether a leaderboard row shows no games since the cached mode was fetched"""
+    if not mode or not player:
+        return False
+    games = player.get('wins', 0) + player.get('losses', 0)
+    if mode.get('games_count') != games:
+        return False
+    last_game = player.get('last_game_at')
+    return not last_game or not mode.get('last_game_at') or mode['last_game_at'] == last_game
+
+
+def profile_fields(identity, modes, leaderboard):
+    """Airtable fields for one player on one leaderboard"""
+    mode = modes.get(leaderboard) or {}
+    history = mode.get('history') or []
+    trend = 0
+    if history:
+        # Change over the last 30 days of history (or all of it, if shorter)
+        cutoff = history[-1][0] - 30 * 24 * 3600
+        start = next((rating for ts, rating in history if ts >= cutoff), history[0][1])
+        trend = history[-1][1] - start
+    return {
+        "max_rating": mode.get('max_rating', 0),
+        "max_rating_1m": mode.get('max_rating_1m', 0),
+        "streak": mode.get('streak', 0),
+        "rating_trend_30d": trend,
+        "rating_history": json.dumps(history, separators=(',', ':')),
+        "modes": ", ".join(f"{name} {other.get('rating', 0)} ({other.get('rank_level') or 'unranked'})"
+                           for name, other in sorted(modes.items())),
+        "steam_id": str(identity.get('steam_id') or ''),
+    }
+
+
+class ProfileCache:
+    """Field-grouped, TTL-bound profile cache with coalesced fetches
+
+        profiles = ProfileCache()
+        fields = profiles.lookup(player, "rm_solo")
+
+    A lookup with a fresh identity and a fresh (or provably unchanged) mode
+    is answered from SQLite. Otherwise the profile is fetched; a second
+    lookup of the same profile_id while that fetch is in flight waits for
+    it instead of sending its own.
+    """
+
+    def __init__(self, path=None, ttl=None, modes_ttl=None, fetch=fetch_player_profile):
+        self.path = path or PROFILE_DB
+        self.ttl = PROFILE_TTL if ttl is None else ttl
+        self.modes_ttl = MODES_TTL if modes_ttl is None else modes_ttl
+        self.fetch = fetch
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # Losing the last few entries in a crash only costs refetches
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.in_flight = {}  # profile_id -> Future of (identity, modes)
+        self.fresh = 0
+        self.renewed = 0
+        self.fetched = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    def close(self):
+        self.db.close()
+
+    def lookup(self, player, leaderboard="rm_solo"):
+        """Enrichment fields for a leaderboard row, or None if the profile can't be had"""
+        profile_id = player.get('profile_id')
+        if not profile_id:
+            return None
+        entry = self._load(profile_id)
+        now = time.time()
+        if entry is not None:
+            identity, identity_at, modes, modes_at = entry
+            if now - identity_at < self.ttl:
+                if now - modes_at < self.modes_ttl:
+                    self._count("fresh")
+                    return profile_fields(identity, modes, leaderboard)
+                if mode_unchanged(modes.get(leaderboard), player):
+                    self._renew(profile_id, now)
+                    self._count("renewed")
+                    return profile_fields(identity, modes, leaderboard)
+        result = self._fetch_once(profile_id)
+        if result is None:
+            return None
+        return profile_fields(*result, leaderboard)
+
+    def _fetch_once(self, profile_id):
+        with self.lock:
+            future = self.in_flight.get(profile_id)
+            owner = future is None
+            if owner:
+                future = self.in_flight[profile_id] = Future()
+        if not owner:
+            self._count("coalesced")
+            return future.result()
+
+        result = None
+        try:
+            # Another lookup may have stored it between our check and now
+            entry = self._load(profile_id)
+            now = time.time()
+            if entry is not None and now - entry[1] < self.ttl and now - entry[3] < self.modes_ttl:
+                self._count("coalesced")
+                result = entry[0], entry[2]
+                return result
+            profile = self.fetch(profile_id)
+            if profile:
+                result = compact_profile(profile)
+                self._store(profile_id, *result)
+                self._count("fetched")
+            else:
+                self._count("failed")
+        except Exception as e:
+            print(f"Error fetching profile {profile_id}: {e}")
+            self._count("failed")
+        finally:
+            with self.lock:
+                del self.in_flight[profile_id]
+            future.set_result(result)
+        return result
+
+    def _count(self, result):
+        with self.lock:
+            setattr(self, result, getattr(self, result) + 1)
+        metrics.count("cache_lookups", cache="profiles", result=result)
+
+    def _load(self, profile_id):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT identity, identity_at, modes, modes_at FROM profiles WHERE profile_id = ?",
+                (profile_id,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], json.loads(row[2]), row[3]
+
+    def _store(self, profile_id, identity, modes):
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?)",
+                            (profile_id, json.dumps(identity, separators=(',', ':')), now,
+                             json.dumps(modes, separators=(',', ':')), now))
+
+    def _renew(self, profile_id, now):
+        with self.lock, self.db:
+            self.db.execute("UPDATE profiles SET modes_at = ? WHERE profile_id = ?", (now, profile_id))
+
+    def summary(self):
+        return (f"Profiles: {self.fresh} fresh, {self.renewed} renewed from the leaderboard, "
+                f"{self.fetched} fetched, {self.coalesced} coalesced, {self.failed} failed")
+
+
+def enrich_players(players, leaderboard="rm_solo", profiles=None, workers=MAX_WORKERS,
+                   prefetch=PREFETCH):
+    """Yield each player with its profile fields under 'profile', in order
+
+    Lookups run `workers` at a time and at most `prefetch` players are held
+    at once, so a streamed crawl stays streamed. A player whose profile
+    can't be fetched is yielded without 'profile'.
+    """
+    profiles = profiles or profile_cache()
+    window = deque()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for player in players:
+            window.append((player, pool.submit(profiles.lookup, player, leaderboard)))
+            if len(window) >= max(1, prefetch):
+                yield _enriched(*window.popleft())
+        while window:
+            yield _enriched(*window.popleft())
+
+
+def _enriched(player, future):
+    try:
+        fields = future.result()
+    except Exception as e:
+        print(f"Error enriching player {player.get('profile_id')}: {e}")
+        fields = None
+    return dict(player, profile=fields) if fields else player
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def profile_cache():
+    """The process-wide profile cache, opened on first use
+
+    Shared so that leaderboards enriched at the same time (rm_solo and
+    rm_team in run_pipelines) coalesce their lookups.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ProfileCache()
+        return _cache
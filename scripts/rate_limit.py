@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Adaptive rate limiting shared by every upstream call
+One token bucket per upstream (each Airtable base, AoE4 World, OpenAI).
+429/503 answers pause the bucket for Retry-After (or a jittered backoff)
+and cut its rate; the rate creeps back up as requests succeed.
+"""
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from run_metrics import metrics
+
+# Requests per second per upstream; Airtable documents 5/s per base
+RATE_LIMITS = {
+    "airtable": float(os.getenv('AIRTABLE_RATE_LIMIT', '5')),
+    "aoe4world": float(os.getenv('AOE4_WORLD_RATE_LIMIT', '10')),
+    "openai": float(os.getenv('OPENAI_RATE_LIMIT', '5')),
+}
+RETRY_STATUSES = (429, 503)
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+# Rate multiplier per throttled answer, and the fraction of the configured
+# rate won back per successful request
+DECREASE_FACTOR = 0.7
+INCREASE_STEP = 0.05
+
+
+class RateLimiter:
+    """Token bucket that adapts its rate to the throttling it sees
+
+    Multiplicative decrease on every 429, additive increase on success, so
+    a run settles just under the rate the upstream actually allows.
+    """
+
+    def __init__(self, name, rate, burst=None, min_rate=None):
+        self.name = name
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate / 8
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled_count = 0
+        self.retries = 0
+        self.waited = 0.0
+        self.first_request = None
+        self.last_request = None
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                wait = self.paused_until - now
+                if wait <= 0 and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.requests += 1
+                    self.first_request = self.first_request or now
+                    self.last_request = now
+                    return
+                if wait <= 0:
+                    wait = (1 - self.tokens) / self.rate
+                self.waited += wait
+            time.sleep(wait)
+
+    def succeeded(self):
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * INCREASE_STEP)
+
+    def throttled(self, retry_after=None, attempt=0):
+        """Record a throttled answer and pause the bucket; returns the delay"""
+        if retry_after is None:
+            retry_after = backoff_delay(attempt)
+        with self.lock:
+            self.throttled_count += 1
+            self.rate = max(self.min_rate, self.rate * DECREASE_FACTOR)
+            self.tokens = 0
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        return retry_after
+
+    def stats(self):
+        with self.lock:
+            elapsed = (self.last_request or 0) - (self.first_request or 0)
+            observed = self.requests / elapsed if elapsed > 0 else 0.0
+            return {
+                "limit": self.max_rate,
+                "current_rate": round(self.rate, 2),
+                "observed_rate": round(observed, 2),
+                "requests": self.requests,
+                "throttled": self.throttled_count,
+                "retries": self.retries,
+                "waited_seconds": round(self.waited, 2),
+            }
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with jitter: half fixed, half random"""
+    delay = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def retry_after_seconds(headers):
+    """Seconds to wait from a Retry-After header (delta or HTTP date)"""
+    value = (headers or {}).get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_limiters = {}
+_registry_lock = threading.Lock()
+
+
+def limiter(name):
+    """Shared limiter for an upstream, e.g. "aoe4world" or "airtable:appXYZ"
+
+    The part before ":" picks the rate from RATE_LIMITS.
+    """
+    with _registry_lock:
+        if name not in _limiters:
+            rate = RATE_LIMITS.get(name.split(':')[0], 5.0)
+            _limiters[name] = RateLimiter(name, rate)
+        return _limiters[name]
+
+
+def call_with_backoff(bucket, send, max_retries=MAX_RETRIES):
+    """Run send() under the limiter, retrying throttled answers
+
+    send() returns a response with status_code/headers, or raises. An
+    exception carrying such a response (e.g. openai.RateLimitError) is
+    treated like the response itself. The last answer (or exception) is
+    passed on once retries run out.
+    """
+    upstream = bucket.name.split(':')[0]
+    for attempt in range(max_retries + 1):
+        bucket.acquire()
+        metrics.count("requests", upstream=upstream)
+        try:
+            response = send()
+            error = None
+        except Exception as e:
+            response = getattr(e, 'response', None)
+            error = e
+            if getattr(response, 'status_code', None) not in RETRY_STATUSES:
+                raise
+
+        if getattr(response, 'status_code', None) not in RETRY_STATUSES:
+            bucket.succeeded()
+            return response
+
+        bucket.throttled(retry_after_seconds(response.headers), attempt)
+        metrics.count("throttled", upstream=upstream)
+        if attempt == max_retries:
+            break
+        with bucket.lock:
+            bucket.retries += 1
+        metrics.count("retries", upstream=upstream)
+
+    if error is not None:
+        raise error
+    return response
+
+
+def print_rate_limit_summary():
+    """One line per upstream used in this run"""
+    with _registry_lock:
+        limiters = list(_limiters.values())
+    for bucket in limiters:
+        s = bucket.stats()
+        print(f"Rate limit {bucket.name}: {s['requests']} requests at {s['observed_rate']}/s "
+              f"(limit {s['limit']}/s), {s['throttled']} throttled, {s['retries']} retried, "
+              f"{s['waited_seconds']}s waiting")
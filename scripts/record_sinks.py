@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+"""
+Destinations for synced records
+Besides Airtable (REST or MCP), records can go to a local SQLite mirror, a
+JSONL file or stdout. A run can write to several at once: each sink gets
+its own worker thread and buffer, so a throttled Airtable never holds up
+the local sinks. JSONL backfills are replayed into Airtable later:
+
+    AOE4_SINKS=jsonl,sqlite python scripts/sync_leaderboard.py
+    python scripts/record_sinks.py replay .data/sinks/appKeqSFMnexidZfd_leaderboard_players.jsonl
+"""
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import uuid
+from datetime import datetime
+
+from run_metrics import metrics
+
+SINK_NAMES = ("airtable", "sqlite", "jsonl", "stdout")
+# Comma-separated sinks every sync writes to; "airtable" is the script's own
+# writer (REST API or MCP)
+SINKS = os.getenv('AOE4_SINKS', 'airtable')
+SINK_DIR = os.getenv('AOE4_SINK_DIR', os.path.join('.data', 'sinks'))
+SINK_DB = os.getenv('AOE4_SINK_DB', os.path.join('.data', 'sinks.sqlite3'))
+# Writes queued per sink before the script waits for the slowest one
+SINK_BUFFER = int(os.getenv('AOE4_SINK_BUFFER', '10000'))
+# Records a local sink collects before writing them out
+SINK_BATCH = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    base_id TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    record_key TEXT,
+    record_id TEXT,
+    fields TEXT NOT NULL,
+    written_at TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS records_key ON records (base_id, table_name, record_key);
+CREATE INDEX IF NOT EXISTS records_id ON records (base_id, table_name, record_id);
+"""
+
+_configured = {'sinks': None}
+
+
+def table_slug(base_id, table_name):
+    return f"{base_id}_{table_name.lower().replace(' ', '_')}"
+
+
+def _key(fields, key_fields):
+    if not key_fields or any(fields.get(name) is None for name in key_fields):
+        return None
+    return json.dumps([fields.get(name) for name in key_fields])
+
+
+class LocalSink:
+    """Buffers writes and hands them to _write() SINK_BATCH at a time
+
+    Same interface as AirtableBatchWriter, minus the on_written callbacks:
+    a local copy doesn't make a record pushed as far as UpsertIndex or the
+    run journal are concerned.
+    """
+
+    name = "local"
+
+    def __init__(self, base_id, table_name, batch_size=SINK_BATCH):
+        self.base_id = base_id
+        self.table_name = table_name
+        self.batch_size = batch_size
+        self.pending = []  # (op, record_id, merge_on, fields)
+        self.created = 0
+        self.updated = 0
+        self.requests = 0
+        self.failures = []
+
+    def add(self, fields, on_written=None):
+        self._queue("create", None, None, fields)
+
+    def update(self, record_id, fields, on_written=None):
+        self._queue("update", record_id, None, fields)
+
+    def upsert(self, fields, merge_on, on_written=None):
+        self._queue("upsert", None, tuple(merge_on), fields)
+
+    def flush(self):
+        if not self.pending:
+            return
+        chunk, self.pending = self.pending, []
+        self.requests += 1
+        try:
+            with metrics.timed("write", self.name):
+                self._write(chunk)
+        except Exception as e:
+            metrics.count("failures", len(chunk), stage="write", target=self.name)
+            print(f"Error writing {len(chunk)} records to {self.name}: {e}")
+            self.failures.extend((fields, str(e)) for _, _, _, fields in chunk)
+            return
+        metrics.count("records", len(chunk), stage="write", target=self.name)
+
+    def close(self):
+        self.flush()
+
+    def _queue(self, op, record_id, merge_on, fields):
+        self.pending.append((op, record_id, merge_on, fields))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def _write(self, chunk):
+        raise NotImplementedError
+
+
+class JsonlSink(LocalSink):
+    """Appends one JSON line per write to .data/sinks/<base>_<table>.jsonl"""
+
+    name = "jsonl"
+
+    def __init__(self, base_id, table_name, path=None, batch_size=SINK_BATCH):
+        super().__init__(base_id, table_name, batch_size)
+        self.path = path or os.path.join(SINK_DIR, f"{table_slug(base_id, table_name)}.jsonl")
+
+    def _write(self, chunk):
+        at = datetime.now().isoformat()
+        lines = []
+        for op, record_id, merge_on, fields in chunk:
+            entry = {"at": at, "base": self.base_id, "table": self.table_name, "op": op}
+            if record_id:
+                entry["id"] = record_id
+            if merge_on:
+                entry["merge_on"] = list(merge_on)
+            entry["fields"] = fields
+            lines.append(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+        self.created += sum(1 for op, _, _, _ in chunk if op != "update")
+        self.updated += sum(1 for op, _, _, _ in chunk if op == "update")
+
+
+class StdoutSink(JsonlSink):
+    """JSON lines on the process's stdout, for piping a run into other tools
+
+    Records go to sys.__stdout__ itself, so they still reach the pipe when
+    sys.stdout has been pointed elsewhere; configure_sinks does that for
+    the scripts, so their progress prints stay out of the record stream.
+    """
+
+    name = "stdout"
+
+    def __init__(self, base_id, table_name, batch_size=1, stream=None):
+        super().__init__(base_id, table_name, path="-", batch_size=batch_size)
+        self.stream = stream or sys.__stdout__
+
+    def _write(self, chunk):
+        for op, record_id, merge_on, fields in chunk:
+            entry = {"table": self.table_name, "op": op}
+            if record_id:
+                entry["id"] = record_id
+            if merge_on:
+                entry["merge_on"] = list(merge_on)
+            entry["fields"] = fields
+            self.stream.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.stream.flush()
+        self.created += sum(1 for op, _, _, _ in chunk if op != "update")
+        self.updated += sum(1 for op, _, _, _ in chunk if op == "update")
+
+
+class SqliteSink(LocalSink):
+    """Local mirror of the Airtable tables in one SQLite file
+
+    Rows are matched on key_fields (or an upsert's merge_on fields) and
+    changed fields are merged into them, so the mirror holds the latest
+    value of every row rather than a log.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, base_id, table_name, key_fields=None, path=None, batch_size=SINK_BATCH):
+        super().__init__(base_id, table_name, batch_size)
+        self.key_fields = tuple(key_fields) if key_fields else None
+        self.path = path or SINK_DB
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # Written from the fan-out worker thread, never from two at once
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        super().close()
+        self.db.close()
+
+    def _write(self, chunk):
+        at = datetime.now().isoformat()
+        scope = (self.base_id, self.table_name)
+        with self.db:
+            for op, record_id, merge_on, fields in chunk:
+                data = json.dumps(fields, ensure_ascii=False)
+                key = _key(fields, merge_on or self.key_fields)
+                if key is not None:
+                    exists = self.db.execute(
+                        "SELECT 1 FROM records WHERE base_id = ? AND table_name = ? AND record_key = ?",
+                        scope + (key,)).fetchone()
+                    self.db.execute(
+                        "INSERT INTO records (base_id, table_name, record_key, record_id, fields, written_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (base_id, table_name, record_key) DO UPDATE SET "
+                        "fields = json_patch(records.fields, excluded.fields), "
+                        "record_id = COALESCE(excluded.record_id, records.record_id), "
+                        "written_at = excluded.written_at",
+                        scope + (key, record_id, data, at))
+                elif op == "update" and record_id:
+                    exists = self.db.execute(
+                        "UPDATE records SET fields = json_patch(fields, ?), written_at = ? "
+                        "WHERE base_id = ? AND table_name = ? AND record_id = ?",
+                        (data, at) + scope + (record_id,)).rowcount
+                    if not exists:
+                        self.db.execute(
+                            "INSERT INTO records (base_id, table_name, record_id, fields, written_at) "
+                            "VALUES (?, ?, ?, ?, ?)", scope + (record_id, data, at))
+                else:
+                    exists = False
+                    self.db.execute(
+                        "INSERT INTO records (base_id, table_name, record_id, fields, written_at) "
+                        "VALUES (?, ?, ?, ?, ?)", scope + (f"local{uuid.uuid4().hex[:14]}", data, at))
+                if exists:
+                    self.updated += 1
+                else:
+                    self.created += 1
+
+
+class FanOutWriter:
+    """Send every write to several sinks, each from its own worker thread
+
+    Each sink has a queue of up to `buffer` writes, so a slow sink only
+    holds the script back once its queue is full, and never holds up the
+    other sinks. on_written callbacks run for the `confirming` sink only
+    (the Airtable writer, if it is one of the sinks). Counts come from that
+    sink, or the first one; failures are collected from all of them.
+    """
+
+    def __init__(self, sinks, confirming=None, buffer=SINK_BUFFER):
+        self.sinks = list(sinks)  # (name, sink)
+        self.confirming = confirming
+        self.primary = confirming or self.sinks[0][1]
+        self.queues = [queue.Queue(maxsize=max(0, buffer)) for _ in self.sinks]
+        self.peak = [0] * len(self.sinks)
+        self.errors = []
+        self.threads = []
+        for (name, sink), work in zip(self.sinks, self.queues):
+            thread = threading.Thread(target=self._run, args=(name, sink, work),
+                                      name=f"sink-{name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    @property
+    def created(self):
+        return self.primary.created
+
+    @property
+    def updated(self):
+        return self.primary.updated
+
+    @property
+    def requests(self):
+        return getattr(self.primary, 'requests', getattr(self.primary, 'calls', 0))
+
+    @property
+    def failures(self):
+        failures = list(self.errors)
+        for _, sink in self.sinks:
+            failures.extend(sink.failures)
+        return failures
+
+    def add(self, fields, on_written=None):
+        self._put("add", (fields,), on_written)
+
+    def update(self, record_id, fields, on_written=None):
+        self._put("update", (record_id, fields), on_written)
+
+    def upsert(self, fields, merge_on, on_written=None):
+        self._put("upsert", (fields, merge_on), on_written)
+
+    def flush(self):
+        """Wait until every sink has written everything queued so far
+
+        After close() there is nothing left to wait for.
+        """
+        if self.threads:
+            self._wait("flush")
+
+    def close(self):
+        if self.threads:
+            self._wait("close")
+            for thread in self.threads:
+                thread.join()
+            self.threads = []
+            print_sink_summary(self)
+
+    def _put(self, method, args, on_written):
+        if not self.threads:
+            raise RuntimeError("write to a closed FanOutWriter")
+        for i, ((_, sink), work) in enumerate(zip(self.sinks, self.queues)):
+            work.put((method, args, on_written if sink is self.confirming else None))
+            self.peak[i] = max(self.peak[i], work.qsize())
+
+    def _wait(self, method):
+        done = [threading.Event() for _ in self.sinks]
+        for work, event in zip(self.queues, done):
+            work.put((method, (), event))
+        for event in done:
+            event.wait()
+
+    def _run(self, name, sink, work):
+        while True:
+            method, args, extra = work.get()
+            try:
+                if method in ("flush", "close"):
+                    getattr(sink, method, sink.flush)()
+                else:
+                    getattr(sink, method)(*args, on_written=extra)
+            except Exception as e:
+                print(f"Error in {name} sink: {e}")
+                if method not in ("flush", "close"):
+                    fields = args[1] if method == "update" else args[0]
+                    self.errors.append((fields, str(e)))
+            finally:
+                if method in ("flush", "close"):
+                    extra.set()
+            if method == "close":
+                return
+
+
+def print_sink_summary(writer):
+    for (name, sink), peak in zip(writer.sinks, writer.peak):
+        print(f"  Sink {name}: {sink.created} created, {sink.updated} updated, "
+              f"{len(sink.failures)} failed, peak queue {peak}")
+
+
+def sink_names(sinks=None):
+    names = sinks or _configured['sinks'] or SINKS.split(',')
+    names = [name.strip().lower() for name in names if name.strip()]
+    unknown = [name for name in names if name not in SINK_NAMES]
+    if unknown:
+        raise ValueError(f"Unknown sink: {', '.join(unknown)} (choose from {', '.join(SINK_NAMES)})")
+    return names or ["airtable"]
+
+
+def open_writer(airtable, base_id, table_name, key_fields=None, sinks=None):
+    """The writer a sync script sends its records through
+
+    airtable() builds the script's own Airtable writer and is only called
+    when "airtable" is one of the sinks. With just that sink it is returned
+    as is; otherwise every sink is wrapped in a FanOutWriter.
+    """
+    names = sink_names(sinks)
+    if names == ["airtable"]:
+        return airtable()
+    opened = []
+    confirming = None
+    for name in names:
+        if name == "airtable":
+            sink = confirming = airtable()
+        elif name == "sqlite":
+            sink = SqliteSink(base_id, table_name, key_fields)
+        elif name == "jsonl":
+            sink = JsonlSink(base_id, table_name)
+        else:
+            sink = StdoutSink(base_id, table_name)
+        opened.append((name, sink))
+    return FanOutWriter(opened, confirming)
+
+
+def add_sink_arguments(parser):
+    parser.add_argument('--sinks', nargs='+', choices=SINK_NAMES, default=None,
+                        help=f"where records are written (default: AOE4_SINKS or {SINKS})")
+
+
+def configure_sinks(args):
+    if getattr(args, 'sinks', None):
+        _configured['sinks'] = list(args.sinks)
+    if "stdout" in sink_names():
+        # stdout is the record stream: send the scripts' progress prints to
+        # stderr now, before their banners and before any sink thread starts
+        sys.stdout = sys.stderr
+
+
+def replay_jsonl(path, writer, index_for=None):
+    """Send the writes logged by a JsonlSink through writer
+
+    Upserts go through UpsertIndex when index_for(merge_on) returns one, so
+    rows Airtable already has are skipped. Returns the number of entries.
+    """
+    from upsert_index import upsert_record
+
+    count = 0
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            count += 1
+            fields = entry['fields']
+            if entry['op'] == "update" and entry.get('id'):
+                writer.update(entry['id'], fields)
+            elif entry.get('merge_on'):
+                index = index_for(tuple(entry['merge_on'])) if index_for else None
+                if index is not None:
+                    upsert_record(index, writer, fields)
+                else:
+                    writer.upsert(fields, entry['merge_on'])
+            else:
+                writer.add(fields)
+    return count
+
+
+def replay(path, keep=False):
+    """Replay a JSONL backfill into Airtable over the REST API"""
+    from airtable_batch import AIRTABLE_API, AirtableBatchWriter
+    from upsert_index import UpsertIndex
+
+    token = os.getenv('AIRTABLE_ACCESS_TOKEN')
+    if not token:
+        raise ValueError("AIRTABLE_ACCESS_TOKEN environment variable not set")
+    with open(path, encoding='utf-8') as f:
+        first = json.loads(next((line for line in f if line.strip()), 'null'))
+    if first is None:
+        print(f"{path} is empty")
+        return
+    base_id, table_name = first['base'], first['table']
+    indexes = {}
+
+    def index_for(merge_on):
+        if merge_on not in indexes:
+            indexes[merge_on] = UpsertIndex(base_id, table_name, merge_on)
+        return indexes[merge_on]
+
+    writer = AirtableBatchWriter(base_id, table_name, token, AIRTABLE_API)
+    count = replay_jsonl(path, writer, index_for)
+    writer.flush()
+    for index in indexes.values():
+        index.save()
+    print(f"✓ Replayed {count} writes into {table_name} ({writer.created} created, "
+          f"{writer.updated} updated, {len(writer.failures)} failed, {writer.requests} requests)")
+    if not writer.failures and not keep:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay local sink output into Airtable")
+    commands = parser.add_subparsers(dest='command', required=True)
+    replay_parser = commands.add_parser('replay', help="send a JSONL sink file to Airtable")
+    replay_parser.add_argument('path')
+    replay_parser.add_argument('--keep', action='store_true',
+                               help="keep the file after a clean replay")
+    args = parser.parse_args()
+
+    if args.command == 'replay':
+        replay(args.path, args.keep)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Write-ahead journal for resumable sync runs
+Each completed step of a run (a fetched page, a generated guide, a write
+Airtable accepted) is appended to a JSONL file under an idempotency key
+before the run moves on. If the run dies, the next run with the same name
+replays the journal: finished fetches and LLM calls are not repeated and
+committed rows are not written again. A run that finishes cleanly deletes
+its journal.
+"""
+import json
+import os
+import re
+import threading
+import time
+
+from upsert_index import STATE_DIR
+
+JOURNAL_DIR = os.getenv('AOE4_JOURNAL_DIR', os.path.join(STATE_DIR, 'journals'))
+# Journals older than this are from an abandoned run and are not resumed
+MAX_AGE = float(os.getenv('AOE4_JOURNAL_MAX_AGE', str(24 * 3600)))
+# Entries reach the OS as soon as they are recorded, which survives a killed
+# process; they are fsynced (against power loss) at most this often
+FSYNC_INTERVAL = float(os.getenv('AOE4_JOURNAL_FSYNC_INTERVAL', '1'))
+
+
+def journal_key(*parts):
+    """Idempotency key for a step, e.g. journal_key("rm_solo", 3)"""
+    return json.dumps(parts, ensure_ascii=False, separators=(',', ':'))
+
+
+class RunJournal:
+    """Append-only log of the steps a run has completed
+
+        journal = RunJournal("sync_leaderboard_rm_solo")
+        data = journal.step("page", journal_key(leaderboard, page), lambda: fetch(page))
+        ...
+        journal.record("write", key, {"id": record_id})
+        journal.complete()
+
+    Entries are (kind, key) -> value; recording a key again replaces it.
+    Only keys and file offsets are held in memory and values are read back
+    from disk when asked for, so memory grows with the number of entries but
+    not with the size of the pages they hold.
+    """
+
+    def __init__(self, name, journal_dir=None, max_age=MAX_AGE):
+        self.name = name
+        slug = re.sub(r'[^\w.-]+', '_', name)
+        self.path = os.path.join(journal_dir or JOURNAL_DIR, f"{slug}.jsonl")
+        self.lock = threading.Lock()
+        self.offsets = {}  # (kind, key) -> byte offset of its latest line
+        self.started_at = time.time()
+        self.file = None
+        self.torn = False
+        self.synced_at = 0.0
+        self._load(max_age)
+        self.resumed = bool(self.offsets)
+        if self.resumed:
+            counts = {}
+            for kind, _ in self.offsets:
+                counts[kind] = counts.get(kind, 0) + 1
+            done = ', '.join(f"{count} {kind}" for kind, count in sorted(counts.items()))
+            print(f"Resuming {name} from its journal ({done} already done)")
+
+    def _load(self, max_age):
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            offset = 0
+            for line in f:
+                line_offset, offset = offset, offset + len(line)
+                # Finish a line cut off by the crash so the next entry starts cleanly
+                self.torn = not line.endswith(b"\n")
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # the line being written when the run died
+                if entry.get('kind') == 'start':
+                    self.started_at = entry['at']
+                    if time.time() - self.started_at > max_age:
+                        print(f"Discarding stale journal {self.path}")
+                        self.started_at = time.time()
+                        self.torn = False
+                        break
+                    continue
+                self.offsets[(entry['kind'], entry['key'])] = line_offset
+            else:
+                return
+        os.remove(self.path)
+
+    def _open(self):
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            new = not os.path.exists(self.path)
+            self.file = open(self.path, 'a+b')
+            if new:
+                self.file.write(json.dumps({"kind": "start", "at": self.started_at}).encode() + b"\n")
+            elif self.torn:
+                self.file.write(b"\n")
+                self.torn = False
+        return self.file
+
+    def _read(self, offset):
+        f = self._open()
+        f.seek(offset)
+        return json.loads(f.readline()).get('value')
+
+    def get(self, kind, key, default=None):
+        with self.lock:
+            offset = self.offsets.get((kind, key))
+            return default if offset is None else self._read(offset)
+
+    def has(self, kind, key):
+        with self.lock:
+            return (kind, key) in self.offsets
+
+    def values(self, kind):
+        """key -> value of every entry of one kind"""
+        with self.lock:
+            return {key: self._read(offset)
+                    for (k, key), offset in self.offsets.items() if k == kind}
+
+    def record(self, kind, key, value=None):
+        """Durably record a completed step before the run relies on it"""
+        line = json.dumps({"kind": kind, "key": key, "value": value},
+                          ensure_ascii=False, separators=(',', ':')).encode() + b"\n"
+        with self.lock:
+            f = self._open()
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            f.write(line)
+            f.flush()
+            now = time.monotonic()
+            if now - self.synced_at >= FSYNC_INTERVAL:
+                os.fsync(f.fileno())
+                self.synced_at = now
+            self.offsets[(kind, key)] = offset
+
+    def step(self, kind, key, fn):
+        """fn()'s result, from the journal if this step already completed
+
+        Only truthy results are recorded, so a failed step runs again on
+        resume.
+        """
+        with self.lock:
+            offset = self.offsets.get((kind, key))
+            if offset is not None:
+                return self._read(offset)
+        value = fn()
+        if value:
+            self.record(kind, key, value)
+        return value
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                os.fsync(self.file.fileno())
+                self.file.close()
+                self.file = None
+
+    def complete(self):
+        """The run finished; the next one starts from scratch"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        with self.lock:
+            self.offsets = {}
+
+
+def restore_index(index, journal):
+    """Mark writes committed by an interrupted run as pushed in an UpsertIndex
+
+    The index is only saved at the end of a run, so without this a resumed
+    run would create those rows a second time.
+    """
+    writes = journal.values("write")
+    for value in writes.values():
+        index.mark_pushed(value['fields'], value.get('id'))
+    return len(writes)
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Per-stage metrics for a sync run
+Every fetch, transform, write and LLM call is timed into a latency
+histogram next to counters for requests, records, retries, cache lookups
+and bytes. A run's metrics can be printed, written as a JSON summary and
+as Prometheus text (for node_exporter's textfile collector), and any stage
+can be run under cProfile.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+METRICS_JSON = os.getenv('AOE4_METRICS_JSON', '')
+METRICS_PROM = os.getenv('AOE4_METRICS_PROM', '')
+PROFILE_STAGES = [s for s in os.getenv('AOE4_PROFILE', '').split(',') if s]
+PROFILE_DIR = os.getenv('AOE4_PROFILE_DIR', os.path.join('.data', 'profiles'))
+
+STAGES = ("fetch", "transform", "write", "llm", "dag")
+# Histogram bucket upper bounds in seconds, Prometheus style
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PREFIX = "aoe4_sync"
+
+COUNTER_HELP = {
+    "requests": "Upstream requests sent, including retries",
+    "retries": "Requests retried after a 429/503",
+    "throttled": "Throttled (429/503) answers",
+    "records": "Records passing through a stage",
+    "failures": "Records a stage gave up on",
+    "cache_lookups": "Cache lookups by result",
+    "bytes": "Payload bytes by direction",
+    "llm_tokens": "OpenAI tokens by kind",
+}
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate, interpolating inside the bucket like histogram_quantile()"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets + (self.max,), self.counts):
+            if count and seen + count >= rank:
+                upper = min(bound, self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.max
+
+
+def endpoint_label(url):
+    """Low-cardinality label for a URL: its path with ids replaced"""
+    path = re.sub(r'^[a-z]+://[^/]+', '', url.split('?')[0])
+    path = re.sub(r'^/api/v\d+', '', path)
+    return re.sub(r'/\d+(?=/|$)', '/:id', path) or '/'
+
+
+class RunMetrics:
+    """Thread-safe registry of stage timings and counters for one run"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.histograms = {}  # (stage, target) -> Histogram
+        self.errors = {}  # (stage, target) -> count
+        self.counters = {}  # (name, sorted label items) -> value
+        self.profile_stages = set(PROFILE_STAGES)
+        self.profiles = {}  # stage -> pstats.Stats
+        self.profiling = threading.local()
+
+    def observe(self, stage, seconds, target="", error=False):
+        key = (stage, target)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+            if error:
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextmanager
+    def timed(self, stage, target=""):
+        """Time a block into the stage histogram, under cProfile if enabled"""
+        profiler = None
+        if stage in self.profile_stages and not getattr(self.profiling, 'active', False):
+            # One profiler per thread at a time; nested stages share it
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                self.profiling.active = True
+            except ValueError:
+                # Python 3.12+ allows one active profiler per process, so a
+                # block overlapping another thread's profile runs unprofiled
+                profiler = None
+                self.count("profile_skipped", stage=stage)
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start, target, error)
+            if profiler is not None:
+                profiler.disable()
+                self.profiling.active = False
+                with self.lock:
+                    if stage in self.profiles:
+                        self.profiles[stage].add(profiler)
+                    else:
+                        self.profiles[stage] = pstats.Stats(profiler)
+
+    def profile(self, stages):
+        self.profile_stages.update(stages)
+
+    def summary(self):
+        """The run as a JSON-serializable dict"""
+        with self.lock:
+            stages = [{
+                "stage": stage,
+                "target": target,
+                "calls": h.count,
+                "errors": self.errors.get((stage, target), 0),
+                "seconds": round(h.sum, 4),
+                "p50_ms": round(h.quantile(0.5) * 1000, 2),
+                "p95_ms": round(h.quantile(0.95) * 1000, 2),
+                "p99_ms": round(h.quantile(0.99) * 1000, 2),
+                "max_ms": round(h.max * 1000, 2),
+            } for (stage, target), h in sorted(self.histograms.items())]
+            counters = dict(self.counters)
+
+        grouped = {}
+        caches = {}
+        for (name, labels), value in sorted(counters.items()):
+            grouped.setdefault(name, []).append(dict(labels, value=value))
+            if name == "cache_lookups":
+                labels = dict(labels)
+                caches.setdefault(labels['cache'], {})[labels['result']] = value
+        for lookups in caches.values():
+            total = sum(lookups.values())
+            lookups['hit_rate'] = round(lookups.get('hit', 0) / total, 3) if total else 0.0
+
+        return {
+            "started_at": datetime.fromtimestamp(self.started).isoformat(),
+            "duration_seconds": round(time.time() - self.started, 3),
+            "stages": stages,
+            "counters": grouped,
+            "cache_hit_rates": caches,
+        }
+
+    def prometheus_text(self):
+        """The run in the Prometheus text exposition format"""
+        with self.lock:
+            histograms = dict(self.histograms)
+            errors = dict(self.errors)
+            counters = dict(self.counters)
+
+        lines = [
+            f"# HELP {PREFIX}_stage_seconds Time spent per stage call",
+            f"# TYPE {PREFIX}_stage_seconds histogram",
+        ]
+        for (stage, target), h in sorted(histograms.items()):
+            labels = {"stage": stage, "target": target}
+            cumulative = 0
+            for bound, count in zip(h.buckets, h.counts):
+                cumulative += count
+                lines.append(f"{PREFIX}_stage_seconds_bucket"
+                             f"{_labels(dict(labels, le=_number(bound)))} {cumulative}")
+            lines.append(f"{PREFIX}_stage_seconds_bucket{_labels(dict(labels, le='+Inf'))} {h.count}")
+            lines.append(f"{PREFIX}_stage_seconds_sum{_labels(labels)} {_number(h.sum)}")
+            lines.append(f"{PREFIX}_stage_seconds_count{_labels(labels)} {h.count}")
+
+        lines.append(f"# HELP {PREFIX}_stage_errors_total Stage calls that raised")
+        lines.append(f"# TYPE {PREFIX}_stage_errors_total counter")
+        for (stage, target), count in sorted(errors.items()):
+            lines.append(f"{PREFIX}_stage_errors_total{_labels({'stage': stage, 'target': target})} {count}")
+
+        by_name = {}
+        for (name, labels), value in sorted(counters.items()):
+            by_name.setdefault(name, []).append((dict(labels), value))
+        for name, series in by_name.items():
+            lines.append(f"# HELP {PREFIX}_{name}_total {COUNTER_HELP.get(name, name)}")
+            lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+            for labels, value in series:
+                lines.append(f"{PREFIX}_{name}_total{_labels(labels)} {_number(value)}")
+
+        lines.append(f"# HELP {PREFIX}_run_duration_seconds Wall-clock time of the run so far")
+        lines.append(f"# TYPE {PREFIX}_run_duration_seconds gauge")
+        lines.append(f"{PREFIX}_run_duration_seconds {_number(time.time() - self.started)}")
+        lines.append(f"# TYPE {PREFIX}_run_started_timestamp_seconds gauge")
+        lines.append(f"{PREFIX}_run_started_timestamp_seconds {_number(self.started)}")
+        return "\n".join(lines) + "\n"
+
+    def write_profiles(self, directory=PROFILE_DIR, top=15):
+        """Dump each profiled stage to <directory>/<stage>.prof and print its hot spots"""
+        with self.lock:
+            profiles = dict(self.profiles)
+        if not profiles:
+            return
+        os.makedirs(directory, exist_ok=True)
+        for stage, stats in profiles.items():
+            path = os.path.join(directory, f"{stage}.prof")
+            stats.dump_stats(path)
+            out = io.StringIO()
+            stats.stream = out
+            stats.sort_stats('cumulative').print_stats(top)
+            print(f"\nProfile of {stage} ({path}):")
+            print(out.getvalue().strip())
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _write_atomic(path, text):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    # A textfile collector must never see a half-written file
+    os.replace(tmp_path, path)
+
+
+# Shared by every instrumented call in the process
+metrics = RunMetrics()
+
+
+def add_metrics_arguments(parser):
+    """--metrics-json, --metrics-prom and --profile for a script's CLI"""
+    parser.add_argument('--metrics-json', default=METRICS_JSON,
+                        help="write the run's metrics to this JSON file")
+    parser.add_argument('--metrics-prom', default=METRICS_PROM,
+                        help="write the run's metrics to this file in Prometheus text format")
+    parser.add_argument('--profile', nargs='+', choices=STAGES, default=[],
+                        help=f"run these stages under cProfile (dumped to {PROFILE_DIR})")
+
+
+def configure_metrics(args):
+    metrics.profile(args.profile)
+
+
+def export_metrics(json_path=None, prom_path=None):
+    """Write the JSON summary and Prometheus text where requested"""
+    if json_path:
+        _write_atomic(json_path, json.dumps(metrics.summary(), indent=2) + "\n")
+    if prom_path:
+        _write_atomic(prom_path, metrics.prometheus_text())
+
+
+def finish_metrics(args):
+    """Print the summary, export it and write any profiles at the end of a run"""
+    print_metrics_summary()
+    export_metrics(args.metrics_json, args.metrics_prom)
+    metrics.write_profiles()
+
+
+def print_metrics_summary():
+    """One line per stage and target, then cache, retry and byte totals"""
+    summary = metrics.summary()
+    if not summary['stages']:
+        return
+    print(f"\n{'Stage':<10} {'Target':<36} {'Calls':>6} {'Errors':>6} {'Seconds':>8} "
+          f"{'p50 ms':>8} {'p99 ms':>8}")
+    for s in summary['stages']:
+        print(f"{s['stage']:<10} {s['target'][:36]:<36} {s['calls']:>6} {s['errors']:>6} "
+              f"{s['seconds']:>8.2f} {s['p50_ms']:>8.1f} {s['p99_ms']:>8.1f}")
+    for cache, lookups in summary['cache_hit_rates'].items():
+        print(f"Cache {cache}: {lookups['hit_rate']:.0%} hit rate "
+              f"({', '.join(f'{k} {v}' for k, v in lookups.items() if k != 'hit_rate')})")
+    counters = summary['counters']
+    for name in ("requests", "retries", "bytes"):
+        if name in counters:
+            parts = [f"{'/'.join(str(v) for k, v in c.items() if k != 'value')} {c['value']}"
+                     for c in counters[name]]
+            print(f"{name.capitalize()}: {', '.join(parts)}")
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Run every sync pipeline in one process
+Civ stats are fetched once and shared by the stats sync and the AI
+analysis, while the leaderboard crawl runs alongside them:
+
+    fetch_civ_stats ──┬─> sync_stats
+    fetch_matchups ───┤
+    fetch_maps ───────┴─> generate_analysis
+               └────────> sync_maps  (every slice's map stats, only when asked for)
+    fetch_leaderboard ──> sync_players
+    sync_ladder          (whole-ladder rating distribution, only when asked for)
+
+    python scripts/run_pipelines.py
+    python scripts/run_pipelines.py --stages sync_stats sync_players
+    python scripts/run_pipelines.py --stages sync_ladder
+    python scripts/run_pipelines.py --stages generate_analysis sync_maps
+    python scripts/run_pipelines.py --standalone   # Airtable REST API instead of MCP
+"""
+import argparse
+import importlib
+import itertools
+import time
+
+from leaderboard_crawler import crawl_leaderboard
+from llm_pool import MAX_CONCURRENT_REQUESTS
+from map_matrix import fetch_map_matrix
+from matchup_matrix import fetch_matchup_matrix
+from pipeline_dag import Stage, print_dag_summary, run_dag, select_stages
+from rate_limit import print_rate_limit_summary
+from record_sinks import add_sink_arguments, configure_sinks
+from run_metrics import add_metrics_arguments, configure_metrics, finish_metrics
+from stat_slices import LEADERBOARDS, RANK_LEVELS
+
+# Stages that write somewhere; fetch stages are pulled in as needed
+TARGETS = ("sync_stats", "generate_analysis", "sync_players", "sync_ladder", "sync_maps")
+# sync_ladder crawls the whole ladder and sync_maps every slice, so they
+# only run when asked for
+DEFAULT_TARGETS = ("sync_stats", "generate_analysis", "sync_players")
+
+
+def load_module(name, standalone):
+    return importlib.import_module(f"{name}_standalone" if standalone else name)
+
+
+def build_stages(targets, standalone=False, leaderboard="rm_solo", top_n=50,
+                 workers=MAX_CONCURRENT_REQUESTS, batch_guides=False, enrich=False):
+    """The pipeline graph, importing only the scripts the targets need"""
+    stages = []
+    if {"sync_stats", "generate_analysis"} & set(targets):
+        civ_sync = load_module("sync_civ_meta_stats", standalone)
+
+        def fetch_civ_stats():
+            data = civ_sync.fetch_civ_stats("rm_solo", None)
+            if not data:
+                raise RuntimeError("no civ stats returned")
+            return data
+
+        stages.append(Stage("fetch_civ_stats", fetch_civ_stats))
+        stages.append(Stage("sync_stats", lambda data: civ_sync.sync_stats("rm_solo", None, data=data),
+                            deps=("fetch_civ_stats",)))
+
+    if {"generate_analysis", "sync_maps"} & set(targets):
+        # One fetch serves both: every slice when the maps are synced, else
+        # only the rm_solo all-ranks slice the analysis reads
+        if "sync_maps" in targets:
+            stages.append(Stage("fetch_maps", lambda: fetch_map_matrix(LEADERBOARDS, RANK_LEVELS),
+                                optional=True))
+        else:
+            stages.append(Stage("fetch_maps", fetch_map_matrix, optional=True))
+
+    if "generate_analysis" in targets:
+        analysis = load_module("generate_meta_analysis", standalone)
+        # Matchups and maps only sharpen the prompts, so the analysis runs without them
+        stages.append(Stage("fetch_matchups", fetch_matchup_matrix, optional=True))
+        stages.append(Stage("generate_analysis",
+                            lambda data, matchups, maps: analysis.generate_analysis(
+                                data, matchups, workers, batch_guides=batch_guides, maps=maps),
+                            deps=("fetch_civ_stats", "fetch_matchups", "fetch_maps")))
+
+    if "sync_maps" in targets:
+        maps_sync = load_module("sync_civ_meta_stats", standalone)
+
+        def sync_maps(matrix):
+            if matrix is None:
+                raise RuntimeError("no map stats returned")
+            maps_sync.sync_maps(matrix=matrix)
+
+        stages.append(Stage("sync_maps", sync_maps, deps=("fetch_maps",)))
+
+    if "sync_players" in targets:
+        players_sync = load_module("sync_leaderboard", standalone)
+
+        def fetch_leaderboard():
+            # Only page 1 is fetched here; the rest of the crawl streams
+            # into sync_players instead of being collected in memory
+            players = crawl_leaderboard(players_sync.fetch_leaderboard, leaderboard, top_n)
+            first = next(players, None)
+            if first is None:
+                raise RuntimeError("no leaderboard players returned")
+            return itertools.chain([first], players)
+
+        stages.append(Stage("fetch_leaderboard", fetch_leaderboard))
+        stages.append(Stage("sync_players",
+                            lambda players: players_sync.sync_leaderboard(leaderboard, top_n,
+                                                                          players=players,
+                                                                          enrich=enrich),
+                            deps=("fetch_leaderboard",)))
+
+    if "sync_ladder" in targets:
+        ladder_sync = load_module("sync_ladder_stats", standalone)
+        stages.append(Stage("sync_ladder", lambda: ladder_sync.sync_ladder_stats(leaderboard)))
+    return select_stages(stages, targets)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the AoE4 World → Airtable pipelines in one process")
+    parser.add_argument('--stages', nargs='+', choices=TARGETS, default=list(DEFAULT_TARGETS),
+                        help=f"pipelines to run (default: {' '.join(DEFAULT_TARGETS)})")
+    parser.add_argument('--standalone', action='store_true',
+                        help="write through the Airtable REST API instead of MCP")
+    parser.add_argument('--leaderboard', default="rm_solo")
+    parser.add_argument('--top-n', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=MAX_CONCURRENT_REQUESTS,
+                        help="OpenAI requests in flight at once")
+    parser.add_argument('--batch-guides', action='store_true',
+                        help="generate several civ guides per OpenAI call")
+    parser.add_argument('--enrich', action='store_true',
+                        help="add profile data to sync_players (peak ratings, streak, rating history)")
+    add_sink_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    configure_sinks(args)
+    configure_metrics(args)
+
+    print("="*60)
+    print("AoE4 World → Airtable Pipelines")
+    print(f"Stages: {', '.join(args.stages)}")
+    print("="*60)
+
+    start = time.perf_counter()
+    stages = build_stages(args.stages, args.standalone, args.leaderboard, args.top_n, args.workers,
+                          batch_guides=args.batch_guides, enrich=args.enrich)
+    outcomes = run_dag(stages, workers=len(stages))
+    print_dag_summary(outcomes, time.perf_counter() - start)
+
+    print()
+    print_rate_limit_summary()
+    finish_metrics(args)
+
+    failed = [name for name, outcome in outcomes.items() if outcome['status'] != 'ok']
+    print("\n" + "="*60)
+    print("Pipelines complete!" if not failed else f"Pipelines finished with problems: {', '.join(failed)}")
+    print("="*60)
+    if failed:
+        exit(1)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Local time-series store of every sync snapshot
+Each sync_stats / sync_leaderboard run is appended to SQLite with its
+timestamp and patch, so trend questions are answered locally instead of by
+paging through the Airtable API
+
+    python scripts/snapshot_store.py civ-trend Mongols --patches 3
+    python scripts/snapshot_store.py player-history 8139502
+"""
+import argparse
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+SNAPSHOT_DB = os.getenv('AOE4_SNAPSHOT_DB', os.path.join('.data', 'snapshots.sqlite3'))
+# Records buffered by a streaming sync before they are inserted
+SNAPSHOT_BATCH = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS civ_stats (
+    snapshot_at TEXT NOT NULL,
+    patch TEXT,
+    leaderboard TEXT NOT NULL,
+    rank_level TEXT NOT NULL,
+    civilization TEXT NOT NULL,
+    win_rate REAL,
+    pick_rate REAL,
+    games_count INTEGER,
+    avg_game_duration INTEGER
+);
+CREATE INDEX IF NOT EXISTS civ_stats_key
+    ON civ_stats (civilization, leaderboard, rank_level, patch, snapshot_at);
+CREATE INDEX IF NOT EXISTS civ_stats_time
+    ON civ_stats (leaderboard, rank_level, snapshot_at);
+
+CREATE TABLE IF NOT EXISTS player_snapshots (
+    snapshot_at TEXT NOT NULL,
+    profile_id INTEGER NOT NULL,
+    leaderboard TEXT NOT NULL,
+    player_name TEXT,
+    rank INTEGER,
+    rating INTEGER,
+    rank_level TEXT,
+    win_rate REAL,
+    games_count INTEGER,
+    country TEXT,
+    last_game TEXT
+);
+CREATE INDEX IF NOT EXISTS player_snapshots_key
+    ON player_snapshots (profile_id, leaderboard, snapshot_at);
+CREATE INDEX IF NOT EXISTS player_snapshots_time
+    ON player_snapshots (leaderboard, snapshot_at);
+"""
+
+CIV_COLUMNS = ("snapshot_at", "patch", "leaderboard", "rank_level", "civilization",
+               "win_rate", "pick_rate", "games_count", "avg_game_duration")
+PLAYER_COLUMNS = ("snapshot_at", "profile_id", "leaderboard", "player_name", "rank",
+                  "rating", "rank_level", "win_rate", "games_count", "country", "last_game")
+
+
+class SnapshotStore:
+    """Append-only SQLite store of civ stats and leaderboard snapshots
+
+    Records are the same dicts the sync scripts send to Airtable.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or SNAPSHOT_DB
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.db.close()
+
+    def record_civ_stats(self, records):
+        """Append civ stats records (their last_updated is the snapshot time)"""
+        rows = [tuple(r.get('last_updated') if c == 'snapshot_at' else r.get(c)
+                      for c in CIV_COLUMNS)
+                for r in records]
+        self._insert("civ_stats", CIV_COLUMNS, rows)
+        return len(rows)
+
+    def record_players(self, records, snapshot_at=None):
+        """Append leaderboard player records taken at snapshot_at (default now)"""
+        snapshot_at = snapshot_at or datetime.now().isoformat()
+        rows = [tuple(snapshot_at if c == 'snapshot_at' else r.get(c) for c in PLAYER_COLUMNS)
+                for r in records]
+        self._insert("player_snapshots", PLAYER_COLUMNS, rows)
+        return len(rows)
+
+    def discard_players(self, leaderboard, snapshot_at):
+        """Drop a partly written snapshot, e.g. before an interrupted sync is resumed"""
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM player_snapshots WHERE leaderboard = ? AND snapshot_at = ?",
+                            (leaderboard, snapshot_at))
+
+    def _insert(self, table, columns, rows):
+        if not rows:
+            return
+        placeholders = ", ".join("?" for _ in columns)
+        with self.lock, self.db:
+            self.db.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+
+    def _query(self, sql, params):
+        with self.lock:
+            return [dict(row) for row in self.db.execute(sql, params)]
+
+    def civ_history(self, civilization, leaderboard="rm_solo", rank_level="All Ranks",
+                    since=None, until=None):
+        """Every snapshot of one civ slice, oldest first"""
+        return self._query("""
+            SELECT * FROM civ_stats
+            WHERE civilization = ? AND leaderboard = ? AND rank_level = ?
+              AND (? IS NULL OR snapshot_at >= ?) AND (? IS NULL OR snapshot_at <= ?)
+            ORDER BY snapshot_at""",
+            (civilization, leaderboard, rank_level, since, since, until, until))
+
+    def civ_trend_by_patch(self, civilization, leaderboard="rm_solo",
+                           rank_level="All Ranks", patches=3):
+        """Latest snapshot of a civ in each of its last `patches` patches"""
+        rows = self._query("""
+            SELECT c.* FROM civ_stats c
+            JOIN (
+                SELECT patch, MAX(snapshot_at) AS snapshot_at FROM civ_stats
+                WHERE civilization = ? AND leaderboard = ? AND rank_level = ?
+                GROUP BY patch
+            ) latest USING (patch, snapshot_at)
+            WHERE c.civilization = ? AND c.leaderboard = ? AND c.rank_level = ?
+            ORDER BY c.snapshot_at DESC
+            LIMIT ?""",
+            (civilization, leaderboard, rank_level,
+             civilization, leaderboard, rank_level, patches))
+        return rows[::-1]
+
+    def civ_snapshot(self, leaderboard="rm_solo", rank_level="All Ranks", at=None):
+        """Every civ as of the latest snapshot at or before `at`"""
+        rows = self._query("""
+            SELECT MAX(snapshot_at) AS snapshot_at FROM civ_stats
+            WHERE leaderboard = ? AND rank_level = ? AND (? IS NULL OR snapshot_at <= ?)""",
+            (leaderboard, rank_level, at, at))
+        if not rows or rows[0]['snapshot_at'] is None:
+            return []
+        return self._query("""
+            SELECT * FROM civ_stats
+            WHERE leaderboard = ? AND rank_level = ? AND snapshot_at = ?
+            ORDER BY win_rate DESC""",
+            (leaderboard, rank_level, rows[0]['snapshot_at']))
+
+    def latest_players(self, leaderboard="rm_solo"):
+        """Players in the most recent leaderboard snapshot, best rank first"""
+        return self._query("""
+            SELECT * FROM player_snapshots
+            WHERE leaderboard = ? AND snapshot_at = (
+                SELECT MAX(snapshot_at) FROM player_snapshots WHERE leaderboard = ?)
+            ORDER BY rank""",
+            (leaderboard, leaderboard))
+
+    def player_history(self, profile_id, leaderboard="rm_solo", since=None, until=None):
+        """Every snapshot of one player, oldest first"""
+        return self._query("""
+            SELECT * FROM player_snapshots
+            WHERE profile_id = ? AND leaderboard = ?
+              AND (? IS NULL OR snapshot_at >= ?) AND (? IS NULL OR snapshot_at <= ?)
+            ORDER BY snapshot_at""",
+            (profile_id, leaderboard, since, since, until, until))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def snapshot_store():
+    """The process-wide store, opened on first use
+
+    Pipeline stages run in parallel, so the first callers can race here.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SnapshotStore()
+        return _store
+
+
+def _print_rows(rows, columns):
+    print("  ".join(f"{c:>14}" for c in columns))
+    for row in rows:
+        print("  ".join(f"{str(row.get(c, '')):>14}" for c in columns))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query local sync snapshots")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    trend = sub.add_parser("civ-trend", help="a civ's latest stats in each recent patch")
+    trend.add_argument("civilization")
+    trend.add_argument("--leaderboard", default="rm_solo")
+    trend.add_argument("--rank-level", default="All Ranks")
+    trend.add_argument("--patches", type=int, default=3)
+
+    history = sub.add_parser("civ-history", help="every snapshot of one civ")
+    history.add_argument("civilization")
+    history.add_argument("--leaderboard", default="rm_solo")
+    history.add_argument("--rank-level", default="All Ranks")
+    history.add_argument("--since")
+    history.add_argument("--until")
+
+    player = sub.add_parser("player-history", help="every snapshot of one player")
+    player.add_argument("profile_id", type=int)
+    player.add_argument("--leaderboard", default="rm_solo")
+    player.add_argument("--since")
+    player.add_argument("--until")
+
+    args = parser.parse_args()
+    store = snapshot_store()
+    if args.command == "civ-trend":
+        _print_rows(store.civ_trend_by_patch(args.civilization, args.leaderboard,
+                                             args.rank_level, args.patches),
+                    ("patch", "snapshot_at", "win_rate", "pick_rate", "games_count"))
+    elif args.command == "civ-history":
+        _print_rows(store.civ_history(args.civilization, args.leaderboard, args.rank_level,
+                                      args.since, args.until),
+                    ("patch", "snapshot_at", "win_rate", "pick_rate", "games_count"))
+    else:
+        _print_rows(store.player_history(args.profile_id, args.leaderboard,
+                                         args.since, args.until),
+                    ("snapshot_at", "rank", "rating", "rank_level", "win_rate", "games_count"))
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Leaderboard × rank level slices of the AoE4 World stats endpoints
+Builds the slice matrix and fetches every slice concurrently
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+LEADERBOARDS = ("rm_solo", "rm_team")
+# None is the all-ranks aggregate
+RANK_LEVELS = (None, "conqueror", "diamond", "platinum", "gold", "silver", "bronze")
+# Enough to fetch the default 14-slice matrix in one wave
+MAX_WORKERS = int(os.getenv('AOE4_SLICE_WORKERS', '16'))
+
+
+def stat_slices(leaderboards=LEADERBOARDS, rank_levels=RANK_LEVELS):
+    """Every (leaderboard, rank_level) combination, in a stable order"""
+    return [(leaderboard, rank_level)
+            for leaderboard in leaderboards
+            for rank_level in rank_levels]
+
+
+def slice_label(leaderboard, rank_level):
+    return f"{leaderboard} / {rank_level or 'All Ranks'}"
+
+
+def fetch_slices(fetch, slices, workers=MAX_WORKERS):
+    """Fetch every slice concurrently, yielding (slice, data) as each completes
+
+    fetch(leaderboard, rank_level) returns the decoded response or None;
+    exceptions are reported and yielded as None so one bad slice doesn't
+    stop the rest.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(fetch, *slice_): slice_ for slice_ in slices}
+        for future in as_completed(futures):
+            slice_ = futures[future]
+            try:
+                data = future.result()
+            except Exception as e:
+                print(f"Error fetching {slice_label(*slice_)}: {e}")
+                data = None
+            yield slice_, data
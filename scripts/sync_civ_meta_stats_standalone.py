@@ -3,16 +3,29 @@
 Sync Civilization Meta Stats from AoE4 World API to Airtable
 STANDALONE VERSION - Uses Airtable API directly (no MCP dependency)
 """
-import json
+import argparse
 import os
-import requests
 from datetime import datetime
 
+from airtable_batch import AirtableBatchWriter
+from http_cache import cached_get_json
+from map_matrix import MIN_GAMES as MAP_MIN_GAMES, fetch_map_matrix
+from matchup_matrix import MIN_GAMES as MATCHUP_MIN_GAMES, fetch_matchup_matrix
+from rate_limit import print_rate_limit_summary
+from record_sinks import add_sink_arguments, configure_sinks, open_writer
+from run_metrics import add_metrics_arguments, configure_metrics, finish_metrics, metrics
+from snapshot_store import snapshot_store
+from stat_slices import (LEADERBOARDS, MAX_WORKERS, RANK_LEVELS, fetch_slices,
+                         slice_label, stat_slices)
+from upsert_index import CIV_STATS_KEY, MAP_KEY, MATCHUP_KEY, UpsertIndex, upsert_record
+
 # Configuration
 BASE_ID = "appKeqSFMnexidZfd"
 TABLE_NAME = "Civilization Meta Stats"
-API_BASE = "https://aoe4world.com/api/v0"
-AIRTABLE_API = "https://api.airtable.com/v0"
+MATCHUP_TABLE_NAME = "Civilization Matchups"
+MAP_TABLE_NAME = "Map Meta Stats"
+API_BASE = os.getenv('AOE4_WORLD_API', "https://aoe4world.com/api/v0")
+AIRTABLE_API = os.getenv('AIRTABLE_API_URL', "https://api.airtable.com/v0")
 
 # Get Airtable token from environment
 AIRTABLE_TOKEN = os.getenv('AIRTABLE_ACCESS_TOKEN')
@@ -45,23 +58,6 @@ CIV_NAME_MAP = {
     "jeanne_darc": "Jeanne d'Arc"
 }
 
-def create_airtable_record(fields):
-    """Create a record in Airtable using REST API"""
-    url = f"{AIRTABLE_API}/{BASE_ID}/{TABLE_NAME}"
-    headers = {
-        'Authorization': f'Bearer {AIRTABLE_TOKEN}',
-        'Content-Type': 'application/json'
-    }
-    data = {'fields': fields}
-    
-    try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"Error creating record: {e}")
-        return None
-
 def fetch_civ_stats(leaderboard="rm_solo", rank_level=None):
     """Fetch civilization statistics from AoE4 World API"""
     url = f"{API_BASE}/stats/{leaderboard}/civilizations"
@@ -70,23 +66,45 @@ def fetch_civ_stats(leaderboard="rm_solo", rank_level=None):
         params['rank_level'] = rank_level
     
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        return cached_get_json(url, params=params)
     except Exception as e:
         print(f"Error fetching data: {e}")
         return None
 
-def sync_stats(leaderboard="rm_solo", rank_level=None):
-    """Sync civilization stats to Airtable"""
+def civ_display_name(civ_id):
+    return CIV_NAME_MAP.get(civ_id, civ_id.replace('_', ' ').title())
+
+def build_stat_record(stat, leaderboard, rank_level, patch, timestamp):
+    """Turn one API stats row into an Airtable record"""
+    return {
+        "civilization": civ_display_name(stat.get('civilization', '')),
+        "leaderboard": leaderboard,
+        "rank_level": rank_level if rank_level else "All Ranks",
+        "win_rate": round(stat.get('win_rate', 0), 2),
+        "pick_rate": round(stat.get('pick_rate', 0), 2),
+        "games_count": stat.get('games_count', 0),
+        "avg_game_duration": int(stat.get('duration_average', 0)),
+        "patch": patch,
+        "last_updated": timestamp
+    }
+
+def sync_stats(leaderboard="rm_solo", rank_level=None, upsert=True, data=None):
+    """Sync civilization stats to Airtable
+
+    With upsert, rows are matched on civilization + leaderboard + rank_level
+    + patch and only new or changed rows are written; otherwise every
+    civilization is appended. Pass data to sync an already fetched response.
+    Returns True if the stats were fetched and every write was accepted.
+    """
     print(f"\n{'='*60}")
     print(f"Syncing {leaderboard} stats" + (f" for {rank_level}" if rank_level else " (All Ranks)"))
     print(f"{'='*60}")
     
-    data = fetch_civ_stats(leaderboard, rank_level)
+    if data is None:
+        data = fetch_civ_stats(leaderboard, rank_level)
     if not data:
         print("Failed to fetch data")
-        return
+        return False
     
     stats_list = data.get('data', [])
     patch = data.get('patch', 'unknown')
@@ -95,39 +113,194 @@ def sync_stats(leaderboard="rm_solo", rank_level=None):
     print(f"Found {len(stats_list)} civilizations")
     print(f"Patch: {patch}")
     
-    count = 0
+    writer = open_writer(lambda: AirtableBatchWriter(BASE_ID, TABLE_NAME, AIRTABLE_TOKEN, AIRTABLE_API),
+                         BASE_ID, TABLE_NAME, CIV_STATS_KEY)
+    index = UpsertIndex(BASE_ID, TABLE_NAME, CIV_STATS_KEY) if upsert else None
+    unchanged = 0
+    records = []
     for stat in stats_list:
-        civ_id = stat.get('civilization', '')
-        civ_name = CIV_NAME_MAP.get(civ_id, civ_id.replace('_', ' ').title())
-        
-        record = {
-            "civilization": civ_name,
-            "leaderboard": leaderboard,
-            "rank_level": rank_level if rank_level else "All Ranks",
-            "win_rate": round(stat.get('win_rate', 0), 2),
-            "pick_rate": round(stat.get('pick_rate', 0), 2),
-            "games_count": stat.get('games_count', 0),
-            "avg_game_duration": int(stat.get('duration_average', 0)),
-            "patch": patch,
-            "last_updated": timestamp
-        }
+        with metrics.timed("transform", "civ_stats"):
+            record = build_stat_record(stat, leaderboard, rank_level, patch, timestamp)
+        records.append(record)
+        civ_name = record['civilization']
         
         print(f"  {civ_name}: {record['win_rate']}% WR, {record['pick_rate']}% PR")
         
-        result = create_airtable_record(record)
-        if result:
-            count += 1
+        if index is None:
+            writer.add(record)
+        elif upsert_record(index, writer, record) is None:
+            unchanged += 1
+    
+    writer.close()
+    if index is not None:
+        index.save()
+    # Every fetched row goes to the local history, changed or not
+    snapshot_store().record_civ_stats(records)
+    print(f"\n✓ Synced {writer.created + writer.updated}/{len(stats_list)} civilizations "
+          f"({writer.created} created, {writer.updated} updated, {unchanged} unchanged, {writer.requests} requests)")
+    return not writer.failures
+
+def sync_all_slices(leaderboards=LEADERBOARDS, rank_levels=RANK_LEVELS,
+                    workers=MAX_WORKERS, upsert=True):
+    """Sync every leaderboard × rank_level slice in one run
+
+    Slices are fetched concurrently and their records merged into a single
+    batched write stream, so the whole matrix takes about as long as the
+    slowest slice.
+    """
+    slices = stat_slices(leaderboards, rank_levels)
+    print(f"\n{'='*60}")
+    print(f"Syncing {len(slices)} stats slices ({len(leaderboards)} leaderboards × {len(rank_levels)} rank levels)")
+    print(f"{'='*60}")
+    
+    timestamp = datetime.now().isoformat()
+    writer = open_writer(lambda: AirtableBatchWriter(BASE_ID, TABLE_NAME, AIRTABLE_TOKEN, AIRTABLE_API),
+                         BASE_ID, TABLE_NAME, CIV_STATS_KEY)
+    index = UpsertIndex(BASE_ID, TABLE_NAME, CIV_STATS_KEY) if upsert else None
+    unchanged = 0
+    records = []
+    failed = 0
+    for (leaderboard, rank_level), data in fetch_slices(fetch_civ_stats, slices, workers):
+        if not data:
+            print(f"  {slice_label(leaderboard, rank_level)}: failed to fetch")
+            failed += 1
+            continue
+        
+        stats_list = data.get('data', [])
+        patch = data.get('patch', 'unknown')
+        print(f"  {slice_label(leaderboard, rank_level)}: {len(stats_list)} civilizations (patch {patch})")
+        
+        for stat in stats_list:
+            with metrics.timed("transform", "civ_stats"):
+                record = build_stat_record(stat, leaderboard, rank_level, patch, timestamp)
+            records.append(record)
+            if index is None:
+                writer.add(record)
+            elif upsert_record(index, writer, record) is None:
+                unchanged += 1
     
-    print(f"\n✓ Synced {count}/{len(stats_list)} civilizations")
+    writer.close()
+    if index is not None:
+        index.save()
+    # Every fetched row goes to the local history, changed or not
+    snapshot_store().record_civ_stats(records)
+    print(f"\n✓ Synced {writer.created + writer.updated}/{len(records)} records from {len(slices) - failed}/{len(slices)} slices "
+          f"({writer.created} created, {writer.updated} updated, {unchanged} unchanged, {writer.requests} requests)")
+
+def sync_matchups(leaderboards=LEADERBOARDS, rank_levels=RANK_LEVELS,
+                  workers=MAX_WORKERS, upsert=True, min_games=MATCHUP_MIN_GAMES):
+    """Sync the civ-vs-civ matchup matrix of every slice
+
+    Each civ pair with at least min_games games gets a row with its win
+    rate and 95% Wilson interval.
+    """
+    slices = stat_slices(leaderboards, rank_levels)
+    print(f"\n{'='*60}")
+    print(f"Syncing matchups for {len(slices)} slices")
+    print(f"{'='*60}")
+    
+    matrix = fetch_matchup_matrix(leaderboards, rank_levels, workers)
+    if matrix is None:
+        print("Failed to fetch matchups")
+        return
+    
+    records = matrix.records(datetime.now().isoformat(), civ_display_name, min_games)
+    print(f"{len(matrix.civs)} civilizations, {len(records)} matchups with {min_games}+ games "
+          f"across {len(matrix.slices)}/{len(slices)} slices")
+    
+    writer = open_writer(lambda: AirtableBatchWriter(BASE_ID, MATCHUP_TABLE_NAME, AIRTABLE_TOKEN, AIRTABLE_API),
+                         BASE_ID, MATCHUP_TABLE_NAME, MATCHUP_KEY)
+    index = UpsertIndex(BASE_ID, MATCHUP_TABLE_NAME, MATCHUP_KEY) if upsert else None
+    unchanged = 0
+    for record in records:
+        if index is None:
+            writer.add(record)
+        elif upsert_record(index, writer, record) is None:
+            unchanged += 1
+    
+    writer.close()
+    if index is not None:
+        index.save()
+    print(f"\n✓ Synced {writer.created + writer.updated}/{len(records)} matchups "
+          f"({writer.created} created, {writer.updated} updated, {unchanged} unchanged, {writer.requests} requests)")
+
+def sync_maps(leaderboards=LEADERBOARDS, rank_levels=RANK_LEVELS,
+              workers=MAX_WORKERS, upsert=True, min_games=MAP_MIN_GAMES, matrix=None):
+    """Sync map × civ statistics of every slice
+
+    Slices are fetched concurrently; each map in each slice becomes one
+    record with its map type, game count, strongest and weakest civs and
+    every civ's win rate, pick rate and games packed into civ_stats. Pass
+    matrix to sync an already fetched MapMatrix.
+    """
+    slices = stat_slices(leaderboards, rank_levels)
+    print(f"\n{'='*60}")
+    print(f"Syncing map stats for {len(slices)} slices")
+    print(f"{'='*60}")
+    
+    if matrix is None:
+        matrix = fetch_map_matrix(leaderboards, rank_levels, workers)
+    if matrix is None:
+        print("Failed to fetch map stats")
+        return
+    
+    records = matrix.records(datetime.now().isoformat(), civ_display_name, min_games)
+    print(f"{len(matrix.maps)} maps, {len(matrix.civs)} civilizations, {len(records)} map records "
+          f"across {len(matrix.slices)}/{len(slices)} slices")
+    
+    writer = open_writer(lambda: AirtableBatchWriter(BASE_ID, MAP_TABLE_NAME, AIRTABLE_TOKEN, AIRTABLE_API),
+                         BASE_ID, MAP_TABLE_NAME, MAP_KEY)
+    index = UpsertIndex(BASE_ID, MAP_TABLE_NAME, MAP_KEY) if upsert else None
+    unchanged = 0
+    for record in records:
+        if index is None:
+            writer.add(record)
+        elif upsert_record(index, writer, record) is None:
+            unchanged += 1
+    
+    writer.close()
+    if index is not None:
+        index.save()
+    print(f"\n✓ Synced {writer.created + writer.updated}/{len(records)} maps "
+          f"({writer.created} created, {writer.updated} updated, {unchanged} unchanged, {writer.requests} requests)")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync civilization meta stats to Airtable")
+    parser.add_argument('--all-slices', action='store_true',
+                        help="sync every leaderboard × rank level slice concurrently")
+    parser.add_argument('--matchups', action='store_true',
+                        help="also sync the civ-vs-civ matchup matrix of every slice")
+    parser.add_argument('--maps', action='store_true',
+                        help="also sync map × civ stats of every slice")
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS,
+                        help="slices fetched at once with --all-slices / --matchups / --maps")
+    add_sink_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    configure_sinks(args)
+    configure_metrics(args)
+    
     print("="*60)
     print("AoE4 World API → Airtable Sync (Standalone)")
     print("Civilization Meta Statistics")
     print("="*60)
     
-    # Sync overall stats for ranked solo
-    sync_stats("rm_solo", None)
+    if args.all_slices:
+        # rm_solo and rm_team × all ranks, conqueror, diamond, platinum, ...
+        sync_all_slices(workers=args.workers)
+    else:
+        # Sync overall stats for ranked solo
+        sync_stats("rm_solo", None)
+    
+    if args.matchups:
+        sync_matchups(workers=args.workers)
+    
+    if args.maps:
+        sync_maps(workers=args.workers)
+    
+    print()
+    print_rate_limit_summary()
+    finish_metrics(args)
     
     print("\n" + "="*60)
     print("Sync complete!")
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Long-running sync daemon with adaptive polling
+Keeps HTTP and MCP connections and the response cache warm between polls.
+Each source is polled on its own schedule: the interval shrinks while the
+data keeps changing and grows while it doesn't, and a poll whose snapshot
+hashes the same as the last one skips the write phase entirely
+
+    python scripts/sync_daemon.py
+    python scripts/sync_daemon.py --standalone --sources leaderboard --top-n 200
+"""
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import signal
+import time
+from datetime import datetime
+
+import http_cache
+import mcp_session
+from http_client import close_sessions
+from leaderboard_crawler import crawl_leaderboard
+from rate_limit import print_rate_limit_summary
+from record_sinks import add_sink_arguments, configure_sinks
+from run_metrics import add_metrics_arguments, configure_metrics, export_metrics, finish_metrics
+
+MIN_INTERVAL = float(os.getenv('AOE4_DAEMON_MIN_INTERVAL', '60'))
+MAX_INTERVAL = float(os.getenv('AOE4_DAEMON_MAX_INTERVAL', '3600'))
+# Interval multipliers after a poll that found changed / unchanged data
+SPEEDUP = 0.5
+SLOWDOWN = 1.5
+
+SOURCES = ("leaderboard", "civ_stats")
+
+
+def snapshot_hash(payload):
+    """Stable hash of a decoded API payload"""
+    encoded = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def format_interval(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m{seconds:02d}s" if minutes else f"{seconds}s"
+
+
+class PolledSource:
+    """One upstream polled on an adaptive interval
+
+    fetch() returns the data or None on failure; sync(data) writes it and
+    returns whether every write was accepted. A failed fetch or sync keeps
+    the current interval, and a failed sync does not keep the hash, so the
+    next poll writes the same data again.
+    """
+
+    def __init__(self, name, fetch, sync, min_interval=MIN_INTERVAL,
+                 max_interval=MAX_INTERVAL):
+        self.name = name
+        self.fetch = fetch
+        self.sync = sync
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.next_run = 0.0
+        self.last_hash = None
+        self.polls = 0
+        self.changes = 0
+        self.failures = 0
+
+    def poll(self):
+        self.polls += 1
+        try:
+            data = self.fetch()
+        except Exception as e:
+            print(f"Error polling {self.name}: {e}")
+            data = None
+
+        stamp = datetime.now().strftime('%H:%M:%S')
+        if not data:
+            self.failures += 1
+            outcome = "fetch failed"
+        else:
+            digest = snapshot_hash(data)
+            if digest == self.last_hash:
+                self.interval = min(self.max_interval, self.interval * SLOWDOWN)
+                outcome = "unchanged, write skipped"
+            else:
+                self.changes += 1
+                if self.sync(data):
+                    self.last_hash = digest
+                    self.interval = max(self.min_interval, self.interval * SPEEDUP)
+                    outcome = "changed, synced"
+                else:
+                    self.failures += 1
+                    outcome = "changed, sync failed"
+        self.next_run = time.monotonic() + self.interval
+        print(f"[{stamp}] {self.name}: {outcome}; next poll in {format_interval(self.interval)}")
+
+
+def build_sources(names, standalone=False, leaderboard="rm_solo", top_n=50,
+                  min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+    suffix = "_standalone" if standalone else ""
+    sources = []
+    if "leaderboard" in names:
+        players_sync = importlib.import_module(f"sync_leaderboard{suffix}")
+
+        def fetch_players():
+            # Pages arrive in the order they finish; sort so identical
+            # ladders hash the same
+            players = crawl_leaderboard(players_sync.fetch_leaderboard, leaderboard, top_n)
+            return sorted(players, key=lambda p: (p.get('rank') or 0, p.get('profile_id') or 0))
+
+        sources.append(PolledSource(
+            "leaderboard",
+            fetch_players,
+            lambda players: players_sync.sync_leaderboard(leaderboard, top_n, players=players),
+            min_interval, max_interval))
+    if "civ_stats" in names:
+        civ_sync = importlib.import_module(f"sync_civ_meta_stats{suffix}")
+        sources.append(PolledSource(
+            "civ_stats",
+            lambda: civ_sync.fetch_civ_stats("rm_solo", None),
+            lambda data: civ_sync.sync_stats("rm_solo", None, data=data),
+            min_interval, max_interval))
+    return sources
+
+
+def run_daemon(sources, max_polls=None, metrics_json=None, metrics_prom=None):
+    """Poll each source whenever it is due until stopped (SIGINT/SIGTERM)
+
+    Metrics are exported after every poll, so a scraper always sees the
+    daemon's running totals.
+    """
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+
+    # Every poll revalidates with the upstream (a 304 when nothing changed)
+    # instead of trusting the cache TTL, which is longer than the fastest poll
+    http_cache.cache.ttl = 0
+    mcp_session.keep_session_open()
+    polls = 0
+    try:
+        while not stopping and (max_polls is None or polls < max_polls):
+            source = min(sources, key=lambda s: s.next_run)
+            wait = source.next_run - time.monotonic()
+            if wait > 0:
+                # Sleep in short steps so a SIGTERM is acted on promptly
+                time.sleep(min(wait, 1.0))
+                continue
+            source.poll()
+            polls += 1
+            export_metrics(metrics_json, metrics_prom)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mcp_session.close_shared_session()
+        close_sessions()
+
+    print(f"\n{'Source':<14} {'Polls':>6} {'Changed':>8} {'Failed':>7} {'Interval':>9}")
+    for source in sources:
+        print(f"{source.name:<14} {source.polls:>6} {source.changes:>8} {source.failures:>7} "
+              f"{format_interval(source.interval):>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep Airtable in sync with AoE4 World continuously")
+    parser.add_argument('--sources', nargs='+', choices=SOURCES, default=list(SOURCES))
+    parser.add_argument('--standalone', action='store_true',
+                        help="write through the Airtable REST API instead of MCP")
+    parser.add_argument('--leaderboard', default="rm_solo")
+    parser.add_argument('--top-n', type=int, default=50)
+    parser.add_argument('--min-interval', type=float, default=MIN_INTERVAL,
+                        help="seconds between polls while data is changing")
+    parser.add_argument('--max-interval', type=float, default=MAX_INTERVAL,
+                        help="seconds between polls once data has gone quiet")
+    parser.add_argument('--max-polls', type=int, help="stop after this many polls")
+    add_sink_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    configure_sinks(args)
+    configure_metrics(args)
+
+    print("="*60)
+    print("AoE4 World → Airtable Sync Daemon")
+    print(f"Sources: {', '.join(args.sources)} "
+          f"(every {format_interval(args.min_interval)} to {format_interval(args.max_interval)})")
+    print("="*60)
+
+    sources = build_sources(args.sources, args.standalone, args.leaderboard, args.top_n,
+                            args.min_interval, args.max_interval)
+    run_daemon(sources, args.max_polls, args.metrics_json, args.metrics_prom)
+
+    print()
+    print_rate_limit_summary()
+    finish_metrics(args)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3.11
+"""
+Sync Leaderboard Rating Distribution from AoE4 World to Airtable
+Summarizes the whole ladder into a few dozen distribution rows
+"""
+import argparse
+import os
+from datetime import datetime
+
+from http_cache import get_json
+from ladder_stats import ladder_distribution
+from leaderboard_crawler import crawl_leaderboard
+from mcp_session import McpRecordWriter
+from rate_limit import print_rate_limit_summary
+from record_sinks import add_sink_arguments, configure_sinks, open_writer
+from run_metrics import add_metrics_arguments, configure_metrics, finish_metrics
+from upsert_index import LADDER_KEY, UpsertIndex, upsert_record
+
+BASE_ID = "appKeqSFMnexidZfd"
+TABLE_ID = "Ladder Distribution"
+API_BASE = os.getenv('AOE4_WORLD_API', "https://aoe4world.com/api/v0")
+
+def fetch_leaderboard(leaderboard="rm_solo", page=1):
+    """Fetch leaderboard from AoE4 World API
+
+    A whole-ladder crawl reads thousands of pages once each, so they skip
+    the on-disk HTTP cache.
+    """
+    url = f"{API_BASE}/leaderboards/{leaderboard}"
+    params = {"page": page}
+
+    try:
+        return get_json(url, params=params)
+    except Exception as e:
+        print(f"Error fetching leaderboard: {e}")
+        return None
+
+def sync_ladder_stats(leaderboard="rm_solo", top_n=None, upsert=True, players=None):
+    """Sync the rating distribution of a leaderboard to Airtable
+
+    Crawls the whole ladder (or its top_n players) and writes one summary
+    row per segment: the whole ladder, each rank_level and the most common
+    countries, each with rating percentiles and histogram, win-rate spread
+    and player counts. Rows are matched on leaderboard + segment_type +
+    segment, so repeated runs update them in place.
+    """
+    print(f"\n{'='*60}")
+    print(f"Syncing rating distribution of {leaderboard}")
+    print(f"{'='*60}")
+
+    if players is None:
+        players = crawl_leaderboard(fetch_leaderboard, leaderboard, top_n)
+    distribution = ladder_distribution(players)
+    if distribution is None:
+        print("Failed to fetch leaderboard")
+        return
+
+    records = distribution.records(leaderboard, datetime.now().isoformat())
+    print(f"Computed {len(records)} segments from {distribution.total} players")
+
+    writer = open_writer(lambda: McpRecordWriter(BASE_ID, TABLE_ID),
+                         BASE_ID, TABLE_ID, LADDER_KEY)
+    index = UpsertIndex(BASE_ID, TABLE_ID, LADDER_KEY) if upsert else None
+    unchanged = 0
+    for record in records:
+        if record['segment_type'] == "rank_level":
+            print(f"  {record['segment']}: {record['players']} players, "
+                  f"median {record['rating_p50']} ELO, {record['win_rate_p50']}% median WR")
+        if index is None:
+            writer.add(record)
+        elif upsert_record(index, writer, record) is None:
+            unchanged += 1
+
+    writer.close()
+    if index is not None:
+        index.save()
+    print(f"\n✓ Synced {writer.created + writer.updated}/{len(records)} segments "
+          f"({writer.created} created, {writer.updated} updated, {unchanged} unchanged)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync leaderboard rating distribution to Airtable")
+    parser.add_argument('--leaderboard', default="rm_solo")
+    parser.add_argument('--top-n', type=int, default=None,
+                        help="only the top N players (default: the whole ladder)")
+    add_sink_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    configure_sinks(args)
+    configure_metrics(args)
+
+    print("="*60)
+    print("AoE4 World API → Airtable Sync")
+    print("Ladder Rating Distribution")
+    print("="*60)
+
+    sync_ladder_stats(args.leaderboard, top_n=args.top_n)
+
+    print()
+    print_rate_limit_summary()
+    finish_metrics(args)
+
+    print("\n" + "="*60)
+    print("Sync complete!")
+    print("="*60)
@@ -2,34 +2,24 @@
 """
 Sync Top Players from AoE4 World Leaderboards to Airtable
 """
-import json
-import subprocess
-import requests
+import argparse
+import os
 from datetime import datetime
 
+from http_cache import cached_get_json
+from leaderboard_crawler import crawl_leaderboard
+from mcp_session import McpRecordWriter
+from player_profiles import enrich_players, profile_cache
+from rate_limit import print_rate_limit_summary
+from record_sinks import add_sink_arguments, configure_sinks, open_writer
+from run_journal import RunJournal, journal_key, restore_index
+from run_metrics import add_metrics_arguments, configure_metrics, finish_metrics, metrics
+from snapshot_store import SNAPSHOT_BATCH, snapshot_store
+from upsert_index import PLAYER_KEY, UpsertIndex, upsert_record
+
 BASE_ID = "appKeqSFMnexidZfd"
 TABLE_ID = "Leaderboard Players"
-API_BASE = "https://aoe4world.com/api/v0"
-
-def create_record(fields):
-    """Create a record in Airtable using manus-mcp-cli"""
-    input_data = {
-        "baseId": BASE_ID,
-        "tableId": TABLE_ID,
-        "fields": fields
-    }
-    
-    cmd = [
-        "manus-mcp-cli", "tool", "call", "create_record",
-        "--server", "airtable",
-        "--input", json.dumps(input_data)
-    ]
-    
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        print(f"Error: {result.stderr}")
-        return None
-    return result.stdout
+API_BASE = os.getenv('AOE4_WORLD_API', "https://aoe4world.com/api/v0")
 
 def fetch_leaderboard(leaderboard="rm_solo", page=1):
     """Fetch leaderboard from AoE4 World API"""
@@ -37,72 +27,145 @@ def fetch_leaderboard(leaderboard="rm_solo", page=1):
     params = {"page": page}
     
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        return cached_get_json(url, params=params)
     except Exception as e:
         print(f"Error fetching leaderboard: {e}")
         return None
 
-def sync_leaderboard(leaderboard="rm_solo", top_n=50):
-    """Sync top N players from leaderboard to Airtable"""
+def sync_leaderboard(leaderboard="rm_solo", top_n=50, upsert=True, players=None, enrich=False):
+    """Sync top N players from leaderboard to Airtable
+
+    With upsert, players are matched on profile_id + leaderboard and only
+    new or changed rows are written; otherwise every player is appended.
+    Pass players to sync an already fetched list instead of crawling.
+    Fetched pages and accepted writes are journaled, so a run that dies
+    halfway resumes where it stopped instead of fetching and writing again.
+    A run that gets through the crawl ends its journal even if some writes
+    failed, so the next run fetches a fresh ladder; the failed records never
+    reached the index, so its diff sends them again.
+    Players stream from the crawler through the writer and into the
+    snapshot store in small batches, so pages and records are never all
+    held at once. Per-player state still grows with top_n: the upsert
+    index, the journal's keys and any failed writes.
+    With enrich, each player also gets peak ratings, streak, rating history
+    and other modes from their cached or freshly fetched profile.
+    Returns True if players were found and every write was accepted.
+    """
     print(f"\n{'='*60}")
     print(f"Syncing Top {top_n} Players from {leaderboard}")
     print(f"{'='*60}")
     
-    data = fetch_leaderboard(leaderboard, page=1)
-    if not data:
-        print("Failed to fetch leaderboard")
-        return
-    
-    players = data.get('players', [])
+    # Pages are fetched concurrently and written as they arrive; the crawler
+    # only runs a bounded number of pages ahead of the writer
+    journal = RunJournal(f"sync_leaderboard_{leaderboard}")
+    if players is None:
+        def fetch_page(leaderboard, page=1):
+            return journal.step("page", journal_key(leaderboard, page),
+                                lambda: fetch_leaderboard(leaderboard, page))
+        players = crawl_leaderboard(fetch_page, leaderboard, top_n)
+    if enrich:
+        players = enrich_players(players, leaderboard)
     
-    # Limit to top N
-    players = players[:top_n]
-    
-    print(f"Found {len(players)} players")
-    
-    count = 0
+    writer = open_writer(lambda: McpRecordWriter(BASE_ID, TABLE_ID),
+                         BASE_ID, TABLE_ID, PLAYER_KEY)
+    index = UpsertIndex(BASE_ID, TABLE_ID, PLAYER_KEY) if upsert else None
+    if index is not None:
+        restore_index(index, journal)
+    store = snapshot_store()
+    # One snapshot time for the whole run, kept when it is resumed
+    snapshot_at = datetime.fromtimestamp(journal.started_at).isoformat()
+    if journal.resumed:
+        store.discard_players(leaderboard, snapshot_at)
+    unchanged = 0
+    found = 0
+    records = []
     for player in players:
-        # Calculate win rate
-        wins = player.get('wins', 0)
-        losses = player.get('losses', 0)
-        total_games = wins + losses
-        win_rate = (wins / total_games * 100) if total_games > 0 else 0
-        
-        record = {
-            "player_name": player.get('name', 'Unknown'),
-            "profile_id": player.get('profile_id', 0),
-            "rank": player.get('rank', 0),
-            "rating": player.get('rating', 0),
-            "rank_level": player.get('rank_level', 'Unknown'),
-            "win_rate": round(win_rate, 2),
-            "games_count": total_games,
-            "leaderboard": leaderboard,
-            "country": player.get('country', ''),
-            "last_game": player.get('last_game_at', '')
-        }
+        found += 1
+        with metrics.timed("transform", "players"):
+            # Calculate win rate
+            wins = player.get('wins', 0)
+            losses = player.get('losses', 0)
+            total_games = wins + losses
+            win_rate = (wins / total_games * 100) if total_games > 0 else 0
+
+            record = {
+                "player_name": player.get('name', 'Unknown'),
+                "profile_id": player.get('profile_id', 0),
+                "rank": player.get('rank', 0),
+                "rating": player.get('rating', 0),
+                "rank_level": player.get('rank_level', 'Unknown'),
+                "win_rate": round(win_rate, 2),
+                "games_count": total_games,
+                "leaderboard": leaderboard,
+                "country": player.get('country', ''),
+                "last_game": player.get('last_game_at', '')
+            }
+            if player.get('profile'):
+                record.update(player['profile'])
+        records.append(record)
+        if len(records) >= SNAPSHOT_BATCH:
+            store.record_players(records, snapshot_at)
+            records.clear()
         
         print(f"  #{record['rank']}: {record['player_name']} - {record['rating']} ELO ({record['win_rate']}% WR)")
         
-        result = create_record(record)
-        if result:
-            count += 1
+        if index is None:
+            key = journal_key(record['profile_id'], leaderboard)
+            on_written = (lambda fields, record_id, key=key:
+                          journal.record("write", key, {"id": record_id, "fields": fields}))
+            if journal.has("write", key):
+                unchanged += 1
+            elif journal.resumed:
+                # The batch in flight when the last run died may have landed
+                writer.upsert(record, PLAYER_KEY, on_written=on_written)
+            else:
+                writer.add(record, on_written=on_written)
+        elif upsert_record(index, writer, record, journal) is None:
+            unchanged += 1
     
-    print(f"\n✓ Synced {count}/{len(players)} players")
+    if found == 0:
+        print("Failed to fetch leaderboard")
+    
+    writer.close()
+    if index is not None:
+        index.save()
+    # Every fetched player goes to the local history, changed or not
+    store.record_players(records, snapshot_at)
+    if enrich:
+        print(profile_cache().summary())
+    if found:
+        journal.complete()
+    else:
+        journal.close()
+    print(f"\n✓ Synced {writer.created + writer.updated}/{found} players "
+          f"({writer.created} created, {writer.updated} updated, {unchanged} unchanged)")
+    return bool(found) and not writer.failures
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync top leaderboard players to Airtable")
+    parser.add_argument('--enrich', action='store_true',
+                        help="add profile data (peak ratings, streak, rating history, modes)")
+    add_sink_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    configure_sinks(args)
+    configure_metrics(args)
+    
     print("="*60)
     print("AoE4 World API → Airtable Sync")
     print("Leaderboard Players")
     print("="*60)
     
     # Sync top 50 players from ranked solo
-    sync_leaderboard("rm_solo", top_n=50)
+    sync_leaderboard("rm_solo", top_n=50, enrich=args.enrich)
     
     # Optionally sync team leaderboard
     # sync_leaderboard("rm_team", top_n=50)
     
+    print()
+    print_rate_limit_summary()
+    finish_metrics(args)
+    
     print("\n" + "="*60)
     print("Sync complete!")
     print("="*60)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Local index of records already pushed to Airtable
+Lets the sync scripts upsert on natural keys and skip unchanged records
+instead of appending a fresh row for every record on every run
+"""
+import json
+import os
+import threading
+
+STATE_DIR = os.getenv('AOE4_SYNC_STATE_DIR', '.sync_state')
+
+# Natural keys identifying a row across runs
+PLAYER_KEY = ("profile_id", "leaderboard")
+CIV_STATS_KEY = ("civilization", "leaderboard", "rank_level", "patch")
+MATCHUP_KEY = ("civilization", "opponent", "leaderboard", "rank_level", "patch")
+LADDER_KEY = ("leaderboard", "segment_type", "segment")
+MAP_KEY = ("map", "leaderboard", "rank_level", "patch")
+
+# Fields that change every run without the underlying data changing. They are
+# ignored when diffing but still sent along with any real change.
+VOLATILE_FIELDS = ("last_updated",)
+
+
+class UpsertIndex:
+    """What was last pushed for each natural key, stored as JSON on disk
+
+        index = UpsertIndex(BASE_ID, TABLE_ID, PLAYER_KEY)
+        for record in records:
+            upsert_record(index, writer, record)
+        writer.flush()
+        index.save()
+
+    Writers confirm writes from their own threads (the MCP reader, the
+    fan-out workers) while the sync loop diffs, so every access to the
+    entries holds the lock.
+    """
+
+    def __init__(self, base_id, table_name, key_fields, state_dir=None,
+                 volatile_fields=VOLATILE_FIELDS):
+        state_dir = state_dir or STATE_DIR
+        slug = table_name.lower().replace(' ', '_')
+        self.path = os.path.join(state_dir, f"{base_id}_{slug}.json")
+        self.key_fields = tuple(key_fields)
+        self.volatile_fields = tuple(volatile_fields)
+        self.entries = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            print(f"Ignoring unreadable sync index {self.path}: {e}")
+
+    def key(self, fields):
+        return json.dumps([fields.get(name) for name in self.key_fields])
+
+    def diff(self, fields):
+        """Compare a record with what was last pushed for its key
+
+        Returns (action, record_id, changed) where action is "create",
+        "update" or None when nothing changed. For updates, changed holds
+        the key fields plus every field whose value differs.
+        """
+        with self.lock:
+            entry = self.entries.get(self.key(fields))
+            if entry is None:
+                return "create", None, dict(fields)
+            previous = dict(entry.get('fields', {}))
+            record_id = entry.get('id')
+
+        changed = {
+            name: value for name, value in fields.items()
+            if name not in self.volatile_fields and previous.get(name) != _normalize(value)
+        }
+        if not changed:
+            return None, record_id, {}
+
+        for name in self.key_fields + self.volatile_fields:
+            if name in fields:
+                changed[name] = fields[name]
+        return "update", record_id, changed
+
+    def mark_pushed(self, fields, record_id=None):
+        """Record that fields were written successfully"""
+        key = self.key(fields)
+        normalized = {name: _normalize(value) for name, value in fields.items()}
+        with self.lock:
+            entry = self.entries.get(key, {})
+            merged = dict(entry.get('fields', {}))
+            merged.update(normalized)
+            self.entries[key] = {'id': record_id or entry.get('id'), 'fields': merged}
+            self.dirty = True
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            # Per-thread temp file: two indexes of one table may save at once
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f, ensure_ascii=False, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+
+
+def _normalize(value):
+    """Round-trip through JSON so values compare the same as after a reload"""
+    return json.loads(json.dumps(value))
+
+
+def upsert_record(index, writer, fields, journal=None):
+    """Send a record through writer only if it differs from the index
+
+    Returns the action taken ("create", "update" or None). The index is
+    updated once the writer confirms the write, so failed records are
+    retried on the next run. With a RunJournal the write is also journaled
+    straight away, so an interrupted run does not repeat it.
+    """
+    action, record_id, changed = index.diff(fields)
+    if action is None:
+        return None
+
+    def on_written(written_fields, new_id):
+        index.mark_pushed(fields, new_id)
+        if journal is not None:
+            journal.record("write", index.key(fields),
+                           {"id": new_id or record_id, "fields": fields})
+
+    if action == "update" and record_id:
+        writer.update(record_id, changed, on_written=on_written)
+    else:
+        writer.upsert(changed, index.key_fields, on_written=on_written)
+    return action
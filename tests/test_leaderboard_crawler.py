@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for the concurrent leaderboard crawler
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from leaderboard_crawler import MAX_FAILED_PAGES, crawl_leaderboard
+
+PER_PAGE = 50
+
+
+def ladder_page(number, size=PER_PAGE):
+    start = (number - 1) * PER_PAGE
+    return {"per_page": PER_PAGE,
+            "players": [{"profile_id": start + i, "rank": start + i + 1} for i in range(size)]}
+
+
+class FakeLadder:
+    """fetch_page stand-in: pages up to `good` succeed, the rest fail"""
+
+    def __init__(self, good, fail_with=None):
+        self.good = good
+        self.fail_with = fail_with
+        self.requested = []
+        self.lock = threading.Lock()
+
+    def __call__(self, leaderboard, page=1):
+        with self.lock:
+            self.requested.append(page)
+        if page <= self.good:
+            return ladder_page(page)
+        if self.fail_with:
+            raise self.fail_with
+        return None
+
+
+def crawl(fetch_page, **kwargs):
+    """Run a crawl on a thread, failing the test if it doesn't end"""
+    result = []
+    thread = threading.Thread(target=lambda: result.extend(crawl_leaderboard(fetch_page, **kwargs)),
+                              daemon=True)
+    thread.start()
+    thread.join(timeout=10)
+    if thread.is_alive():
+        raise AssertionError("crawl did not terminate")
+    return result
+
+
+class WholeLadderCrawlTest(unittest.TestCase):
+
+    def test_stops_at_short_page(self):
+        pages = {1: ladder_page(1), 2: ladder_page(2), 3: ladder_page(3, size=10)}
+        players = crawl(lambda leaderboard, page=1: pages.get(page, {"players": []}), top_n=None)
+        self.assertEqual(len(players), 2 * PER_PAGE + 10)
+
+    def test_stops_when_every_later_page_fails(self):
+        ladder = FakeLadder(good=4)
+        players = crawl(ladder, top_n=None, workers=2, prefetch=4)
+        self.assertEqual(len(players), 4 * PER_PAGE)
+        # The failures in a row plus whatever was already in flight
+        self.assertLess(max(ladder.requested), 4 + MAX_FAILED_PAGES + 4 + 1)
+
+    def test_stops_when_every_later_page_raises(self):
+        ladder = FakeLadder(good=1, fail_with=RuntimeError("503"))
+        players = crawl(ladder, top_n=None, workers=2, prefetch=4)
+        self.assertEqual(len(players), PER_PAGE)
+
+    def test_stops_after_failed_pages_in_a_row(self):
+        # Nothing past the failures can be trusted to ever come up short
+        failing = range(3, 3 + MAX_FAILED_PAGES)
+
+        def fetch_page(leaderboard, page=1):
+            return None if page in failing else ladder_page(page)
+
+        players = crawl(fetch_page, top_n=None, workers=1, prefetch=4)
+        self.assertEqual(len(players), 2 * PER_PAGE)
+
+    def test_isolated_failures_are_skipped(self):
+        failing = {3, 6}
+
+        def fetch_page(leaderboard, page=1):
+            if page in failing:
+                return None
+            return ladder_page(page, size=PER_PAGE if page < 9 else 0)
+
+        players = crawl(fetch_page, top_n=None, workers=1, prefetch=1)
+        self.assertEqual(len(players), (8 - len(failing)) * PER_PAGE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Tests for the map × civ matrix
+
+    python -m unittest discover tests
+"""
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from map_matrix import build_map_matrix, map_type
+
+SLICE = ("rm_solo", None)
+
+
+def civ(name, games, wins):
+    return {"civilization": name, "games_count": games, "win_count": wins,
+            "win_rate": round(wins / games * 100, 2), "pick_rate": 10.0}
+
+
+class MapMatrixTest(unittest.TestCase):
+
+    def test_map_type_comes_from_the_api(self):
+        self.assertEqual(map_type({"map": "Dry Arabia", "map_type": "open"}), "Open")
+        self.assertEqual(map_type({"map": "Lakeside", "type": "WATER"}), "Water")
+        self.assertIsNone(map_type({"map": "Black Forest"}))
+        self.assertIsNone(map_type({"map": "Mystery", "map_type": "megarandom"}))
+
+    def test_unclassified_maps_stay_out_of_type_results(self):
+        data = {"patch": "10.1", "data": [
+            {"map": "Dry Arabia", "map_type": "open", "games_count": 200, "duration_average": 1200,
+             "civilizations": [civ("english", 100, 60), civ("french", 100, 40)]},
+            {"map": "Mystery", "games_count": 400, "duration_average": 900,
+             "civilizations": [civ("english", 200, 50), civ("french", 200, 150)]},
+        ]}
+        matrix = build_map_matrix([(SLICE, data)])
+        self.assertEqual(matrix.map_types, ["Open", None])
+        self.assertEqual(matrix.type_results("english"), [("Open", 60.0, 100)])
+        self.assertEqual(matrix.most_played_type(), "Open")
+        records = {r['map']: r for r in matrix.records("2026-01-01")}
+        self.assertIsNone(records["Mystery"]['map_type'])
+        self.assertEqual(records["Mystery"]['avg_game_duration'], 900)
+        self.assertEqual(json.loads(records["Dry Arabia"]['civ_stats'])['english'], [60.0, 10.0, 100])
+
+    def test_flat_row_durations_are_weighted_by_games(self):
+        data = {"patch": "10.1", "data": [
+            dict(civ("english", 300, 150), map="Altai", map_type="open", duration_average=1000),
+            dict(civ("french", 100, 50), map="Altai", map_type="open", duration_average=2000),
+        ]}
+        matrix = build_map_matrix([(SLICE, data)])
+        self.assertEqual(matrix.durations[0, 0], 1250)
+        self.assertEqual(matrix.map_games[0, 0], 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tests for incremental match-history ingestion
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from match_history import MatchStore, fetch_new_games, ingest_match_history
+
+PER_PAGE = 5
+
+
+class FakeHistory:
+    """fetch_player_games stand-in over an in-memory list of games, newest first"""
+
+    def __init__(self):
+        self.games = []
+        self.requests = 0
+
+    def play(self, count):
+        start = len(self.games)
+        new = [{"game_id": start + n, "started_at": f"2026-01-01T00:{start + n:04d}",
+                "teams": [[{"player": {"profile_id": 1, "result": "win"}}]]}
+               for n in range(count)]
+        self.games = list(reversed(new)) + self.games
+
+    def __call__(self, profile_id, leaderboard, since=None, page=1):
+        self.requests += 1
+        batch = self.games[(page - 1) * PER_PAGE:page * PER_PAGE]
+        return {"games": batch, "per_page": PER_PAGE}
+
+
+class MatchHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = MatchStore(os.path.join(self.tmp.name, 'matches.sqlite3'))
+        self.history = FakeHistory()
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def ingest(self, **kwargs):
+        return ingest_match_history([1], fetch=self.history, store=self.store, workers=1, **kwargs)
+
+    def test_stops_at_the_high_water_mark(self):
+        self.history.play(3)
+        self.ingest()
+        self.history.play(2)
+        self.history.requests = 0
+        result = self.ingest()
+        self.assertEqual(result['new'], 2)
+        self.assertEqual(self.history.requests, 1)
+
+    def test_reports_whether_the_mark_was_reached(self):
+        self.history.play(30)
+        games, complete = fetch_new_games(self.history, 1, "rm_solo", max_pages=2)
+        self.assertEqual((len(games), complete), (10, False))
+        games, complete = fetch_new_games(self.history, 1, "rm_solo", max_pages=10)
+        self.assertEqual((len(games), complete), (30, True))
+
+    def test_mark_stays_put_until_the_gap_is_read(self):
+        self.history.play(3)
+        self.ingest()
+        first_mark = self.store.high_water_marks("rm_solo")[1]
+
+        # More new games than one run reads: the mark must not jump past them
+        self.history.play(12)
+        result = self.ingest(catchup_pages=2)
+        self.assertEqual(result['behind'], 1)
+        self.assertEqual(self.store.high_water_marks("rm_solo")[1], first_mark)
+
+        result = self.ingest(catchup_pages=10)
+        self.assertEqual(result['behind'], 0)
+        self.assertEqual(len(self.store.player_games(1, limit=100)), 15)
+        self.assertEqual(self.store.high_water_marks("rm_solo")[1], self.history.games[0]['started_at'])
+
+    def test_new_player_backfill_is_capped(self):
+        self.history.play(30)
+        result = self.ingest(max_pages=2)
+        self.assertEqual((result['new'], result['behind']), (10, 0))
+        self.assertEqual(self.store.high_water_marks("rm_solo")[1], self.history.games[0]['started_at'])
+
+
+if __name__ == '__main__':
+    unittest.main()
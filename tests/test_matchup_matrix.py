@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Tests for the civ × civ matchup matrix
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from matchup_matrix import build_matchup_matrix, wilson_interval
+
+SLICE = ("rm_solo", None)
+
+
+def pair(civ, other, games, wins):
+    return {"civilization": civ, "other_civilization": other, "games_count": games, "win_count": wins}
+
+
+class MatchupMatrixTest(unittest.TestCase):
+
+    def matrix(self, *rows):
+        return build_matchup_matrix([(SLICE, {"patch": "10.1", "data": list(rows)})])
+
+    def test_wilson_interval_contains_the_rate(self):
+        low, high = wilson_interval(60, 100)
+        self.assertTrue(50 < low < 60 < high)
+        low, high = wilson_interval(0, 0)
+        self.assertTrue(low != low and high != high)  # NaN without games
+
+    def test_lopsided_only_lists_pairs_the_interval_backs(self):
+        matrix = self.matrix(
+            pair("english", "french", 1000, 650),   # clearly lopsided
+            pair("mongols", "rus", 40, 24),         # 60% but the interval spans 50%
+            pair("abbasid", "delhi", 500, 260),     # 52%, lower bound under 50%
+        )
+        rows = matrix.lopsided()
+        self.assertEqual([(civ, other) for civ, other, _, _ in rows], [("english", "french")])
+        civ, other, rate, games = rows[0]
+        self.assertEqual((rate, games), (65.0, 1000))
+
+    def test_lopsided_lists_each_pair_once_favoured_civ_first(self):
+        matrix = self.matrix(
+            pair("english", "french", 1000, 350),
+            pair("french", "english", 1000, 650),
+            pair("china", "malians", 800, 600),
+        )
+        rows = matrix.lopsided(n=5)
+        self.assertEqual([(civ, other) for civ, other, _, _ in rows],
+                         [("china", "malians"), ("french", "english")])
+        self.assertEqual(len(matrix.lopsided(n=1)), 1)
+
+    def test_even_meta_has_no_lopsided_pairs(self):
+        matrix = self.matrix(pair("english", "french", 1000, 500))
+        self.assertEqual(matrix.lopsided(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
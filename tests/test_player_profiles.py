@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Tests for the profile cache: coalesced fetches and per-group TTLs
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import player_profiles
+from player_profiles import ProfileCache, enrich_players, mode_unchanged
+
+HOUR = 3600
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def profile(profile_id, rating=1500, games=100, name="Player"):
+    return {
+        "profile_id": profile_id, "name": name, "country": "de", "steam_id": "7656",
+        "modes": {"rm_solo": {"rating": rating, "max_rating": rating + 50, "streak": 2,
+                              "games_count": games, "wins_count": 60, "losses_count": 40,
+                              "last_game_at": "2026-01-01T00:00:00Z",
+                              "rating_history": {"1700000000": {"rating": rating}}}},
+    }
+
+
+def leaderboard_row(profile_id, games=100):
+    return {"profile_id": profile_id, "wins": 60, "losses": games - 60,
+            "last_game_at": "2026-01-01T00:00:00Z"}
+
+
+class ProfileCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.clock = FakeClock()
+        patcher = mock.patch.object(player_profiles, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.served = {}
+        self.fetches = []
+        self.cache = ProfileCache(os.path.join(self.tmp.name, 'profiles.sqlite3'),
+                                  ttl=24 * HOUR, modes_ttl=HOUR, fetch=self.fetch)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def fetch(self, profile_id):
+        self.fetches.append(profile_id)
+        return self.served.get(profile_id)
+
+    def stored_at(self, profile_id):
+        row = self.cache.db.execute("SELECT identity_at, modes_at FROM profiles WHERE profile_id = ?",
+                                    (profile_id,)).fetchone()
+        return tuple(row)
+
+    def test_concurrent_lookups_share_one_fetch(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def slow_fetch(profile_id):
+            self.fetches.append(profile_id)
+            started.set()
+            release.wait(5)
+            return profile(profile_id)
+
+        self.cache.fetch = slow_fetch
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.lookup(leaderboard_row(7))))
+                   for _ in range(8)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        # Let the other lookups reach the in-flight fetch before it finishes
+        for _ in range(100):
+            if self.cache.coalesced == 7:
+                break
+            threading.Event().wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(self.fetches, [7])
+        self.assertEqual(self.cache.coalesced, 7)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(fields == results[0] and fields['max_rating'] == 1550 for fields in results))
+
+    def test_fresh_profile_is_not_fetched_again(self):
+        self.served[1] = profile(1)
+        self.cache.lookup(leaderboard_row(1))
+        self.clock.now += HOUR / 2
+        self.cache.lookup(leaderboard_row(1))
+        self.assertEqual(self.fetches, [1])
+        self.assertEqual(self.cache.fresh, 1)
+
+    def test_stale_modes_of_an_unchanged_player_are_renewed_without_a_fetch(self):
+        self.served[1] = profile(1)
+        self.cache.lookup(leaderboard_row(1))
+        identity_at, modes_at = self.stored_at(1)
+        self.clock.now += 2 * HOUR
+        fields = self.cache.lookup(leaderboard_row(1, games=100))
+        self.assertEqual(self.fetches, [1])
+        self.assertEqual(self.cache.renewed, 1)
+        self.assertEqual(fields['max_rating'], 1550)
+        # Only the stale group's clock moves
+        self.assertEqual(self.stored_at(1), (identity_at, modes_at + 2 * HOUR))
+
+    def test_stale_modes_with_new_games_are_fetched(self):
+        self.served[1] = profile(1)
+        self.cache.lookup(leaderboard_row(1))
+        self.clock.now += 2 * HOUR
+        self.served[1] = profile(1, rating=1600, games=105)
+        fields = self.cache.lookup(leaderboard_row(1, games=105))
+        self.assertEqual(self.fetches, [1, 1])
+        self.assertEqual(fields['max_rating'], 1650)
+
+    def test_stale_identity_is_fetched_even_if_modes_are_fresh(self):
+        self.served[1] = profile(1)
+        self.cache.lookup(leaderboard_row(1))
+        self.cache.modes_ttl = 48 * HOUR
+        self.clock.now += 25 * HOUR
+        self.cache.lookup(leaderboard_row(1))
+        self.assertEqual(self.fetches, [1, 1])
+
+    def test_failed_fetch_is_not_cached(self):
+        self.assertIsNone(self.cache.lookup(leaderboard_row(3)))
+        self.served[3] = profile(3)
+        self.assertIsNotNone(self.cache.lookup(leaderboard_row(3)))
+        self.assertEqual((self.cache.failed, self.cache.fetched), (1, 1))
+
+    def test_mode_unchanged(self):
+        mode = {"games_count": 100, "last_game_at": "2026-01-01T00:00:00Z"}
+        self.assertTrue(mode_unchanged(mode, leaderboard_row(1, games=100)))
+        self.assertFalse(mode_unchanged(mode, leaderboard_row(1, games=101)))
+        self.assertFalse(mode_unchanged(mode, dict(leaderboard_row(1), last_game_at="2026-02-01T00:00:00Z")))
+        self.assertFalse(mode_unchanged(None, leaderboard_row(1)))
+
+    def test_enrich_players_keeps_order(self):
+        for n in range(1, 21):
+            self.served[n] = profile(n, rating=1000 + n)
+        del self.served[5]
+        players = list(enrich_players((leaderboard_row(n) for n in range(1, 21)), "rm_solo",
+                                      profiles=self.cache, workers=4, prefetch=3))
+        self.assertEqual([p['profile_id'] for p in players], list(range(1, 21)))
+        self.assertNotIn('profile', players[4])
+        self.assertEqual(players[0]['profile']['max_rating'], 1051)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Tests for the adaptive rate limiter and retry loop
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+from email.utils import formatdate
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import rate_limit
+from rate_limit import (BACKOFF_CAP, DECREASE_FACTOR, INCREASE_STEP, RateLimiter, backoff_delay,
+                        call_with_backoff, retry_after_seconds)
+
+
+class FakeClock:
+    """Stands in for the time module: sleep() moves the clock instead of waiting"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class ThrottledError(Exception):
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+
+
+def answers(*responses):
+    """send() stand-in returning (or raising) each response in turn"""
+    remaining = list(responses)
+
+    def send():
+        response = remaining.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+    send.remaining = remaining
+    return send
+
+
+class RateLimitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(rate_limit, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Backoff without a Retry-After is its fixed half only
+        patcher = mock.patch.object(rate_limit.random, 'uniform', lambda low, high: low)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_throttling_cuts_the_rate_down_to_the_floor(self):
+        bucket = RateLimiter("test", 10)
+        bucket.throttled(retry_after=0)
+        self.assertAlmostEqual(bucket.rate, 10 * DECREASE_FACTOR)
+        for _ in range(20):
+            bucket.throttled(retry_after=0)
+        self.assertAlmostEqual(bucket.rate, bucket.min_rate)
+        self.assertEqual(bucket.throttled_count, 21)
+
+    def test_success_wins_the_rate_back_additively(self):
+        bucket = RateLimiter("test", 10)
+        bucket.throttled(retry_after=0)
+        bucket.succeeded()
+        self.assertAlmostEqual(bucket.rate, 10 * DECREASE_FACTOR + 10 * INCREASE_STEP)
+        for _ in range(100):
+            bucket.succeeded()
+        self.assertEqual(bucket.rate, 10)
+
+    def test_bucket_spaces_requests_after_the_burst(self):
+        bucket = RateLimiter("test", 4, burst=2)
+        for _ in range(4):
+            bucket.acquire()
+        self.assertEqual(bucket.requests, 4)
+        self.assertAlmostEqual(sum(self.clock.slept), 0.5)
+
+    def test_throttled_bucket_pauses_for_retry_after(self):
+        bucket = RateLimiter("test", 10)
+        bucket.throttled(retry_after=3)
+        bucket.acquire()
+        self.assertGreaterEqual(self.clock.now, 1003)
+
+    def test_retry_after_header(self):
+        self.assertEqual(retry_after_seconds({"Retry-After": "2.5"}), 2.5)
+        self.assertEqual(retry_after_seconds({"Retry-After": "-1"}), 0.0)
+        date = formatdate(self.clock.now + 30, usegmt=True)
+        self.assertAlmostEqual(retry_after_seconds({"Retry-After": date}), 30, delta=1)
+        self.assertIsNone(retry_after_seconds({"Retry-After": "soon"}))
+        self.assertIsNone(retry_after_seconds({}))
+        self.assertIsNone(retry_after_seconds(None))
+
+    def test_backoff_grows_and_is_capped(self):
+        self.assertEqual([backoff_delay(n) for n in range(3)], [0.5, 1.0, 2.0])
+        self.assertEqual(backoff_delay(20), BACKOFF_CAP / 2)
+
+    def test_429_is_retried_after_retry_after(self):
+        bucket = RateLimiter("test", 10)
+        send = answers(FakeResponse(429, {"Retry-After": "2"}), FakeResponse(200))
+        response = call_with_backoff(bucket, send)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((bucket.retries, bucket.throttled_count), (1, 1))
+        self.assertGreaterEqual(self.clock.now, 1002)
+
+    def test_503_is_retried_with_backoff(self):
+        bucket = RateLimiter("test", 10)
+        send = answers(FakeResponse(503), FakeResponse(503), FakeResponse(200))
+        self.assertEqual(call_with_backoff(bucket, send).status_code, 200)
+        # 0.5s then 1s of backoff, plus refilling the emptied bucket
+        self.assertGreaterEqual(self.clock.now - 1000, 1.5)
+
+    def test_other_errors_are_not_retried(self):
+        bucket = RateLimiter("test", 10)
+        send = answers(FakeResponse(500), FakeResponse(200))
+        self.assertEqual(call_with_backoff(bucket, send).status_code, 500)
+        self.assertEqual(len(send.remaining), 1)
+
+        send = answers(ValueError("bad request"), FakeResponse(200))
+        with self.assertRaises(ValueError):
+            call_with_backoff(bucket, send)
+        self.assertEqual(len(send.remaining), 1)
+
+    def test_throttling_exception_is_retried_then_raised(self):
+        bucket = RateLimiter("test", 10)
+        send = answers(ThrottledError(FakeResponse(429)), FakeResponse(200))
+        self.assertEqual(call_with_backoff(bucket, send).status_code, 200)
+
+        send = answers(*[ThrottledError(FakeResponse(429)) for _ in range(3)])
+        with self.assertRaises(ThrottledError):
+            call_with_backoff(bucket, send, max_retries=2)
+        self.assertEqual(send.remaining, [])
+
+    def test_last_throttled_answer_is_returned_when_retries_run_out(self):
+        bucket = RateLimiter("test", 10)
+        send = answers(*[FakeResponse(429) for _ in range(3)])
+        self.assertEqual(call_with_backoff(bucket, send, max_retries=2).status_code, 429)
+        self.assertEqual(bucket.retries, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
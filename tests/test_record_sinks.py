@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Tests for record sinks, fan-out and JSONL replay
+
+    python -m unittest discover tests
+"""
+import io
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from record_sinks import FanOutWriter, JsonlSink, LocalSink, SqliteSink, StdoutSink, replay_jsonl
+from upsert_index import PLAYER_KEY, UpsertIndex
+
+BASE_ID = "appTest"
+TABLE = "Leaderboard Players"
+
+
+class FakeAirtable:
+    """Confirming writer stand-in; optionally blocks until released"""
+
+    def __init__(self, gate=None):
+        self.gate = gate
+        self.calls = []
+        self.created = 0
+        self.updated = 0
+        self.failures = []
+
+    def add(self, fields, on_written=None):
+        self._write("add", None, fields, on_written)
+
+    def update(self, record_id, fields, on_written=None):
+        self._write("update", record_id, fields, on_written)
+
+    def upsert(self, fields, merge_on, on_written=None):
+        self._write("upsert", tuple(merge_on), fields, on_written)
+
+    def flush(self):
+        pass
+
+    def _write(self, op, extra, fields, on_written):
+        if self.gate is not None:
+            self.gate.wait()
+        self.calls.append((op, extra, dict(fields)))
+        if op == "update":
+            self.updated += 1
+        else:
+            self.created += 1
+        if on_written:
+            on_written(fields, extra if op == "update" else f"rec{len(self.calls)}")
+
+
+class BrokenSink(LocalSink):
+    name = "broken"
+
+    def _write(self, chunk):
+        raise OSError("disk full")
+
+
+def player(profile_id, **fields):
+    return dict({"profile_id": profile_id, "leaderboard": "rm_solo", "rating": 1500}, **fields)
+
+
+class SinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def read_jsonl(self, path):
+        with open(path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_fan_out_reaches_every_sink(self):
+        airtable = FakeAirtable()
+        jsonl = JsonlSink(BASE_ID, TABLE, path=self.path("a.jsonl"), batch_size=2)
+        sqlite = SqliteSink(BASE_ID, TABLE, PLAYER_KEY, path=self.path("sinks.sqlite3"))
+        confirmed = []
+        with FanOutWriter([("airtable", airtable), ("jsonl", jsonl), ("sqlite", sqlite)],
+                          confirming=airtable) as writer:
+            for n in range(5):
+                writer.add(player(n), on_written=lambda fields, record_id: confirmed.append(record_id))
+            writer.upsert(player(0, rating=1600), PLAYER_KEY)
+        self.assertEqual(len(airtable.calls), 6)
+        self.assertEqual(len(confirmed), 5)
+        self.assertEqual(len(self.read_jsonl(jsonl.path)), 6)
+        db = sqlite3.connect(sqlite.path)
+        rows = dict(db.execute("SELECT record_key, fields FROM records"))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(json.loads(rows[json.dumps([0, "rm_solo"])])['rating'], 1600)
+        self.assertEqual((writer.created, writer.failures), (6, []))
+
+    def test_callbacks_only_come_from_the_confirming_sink(self):
+        jsonl = JsonlSink(BASE_ID, TABLE, path=self.path("a.jsonl"))
+        confirmed = []
+        with FanOutWriter([("jsonl", jsonl)]) as writer:
+            writer.add(player(1), on_written=lambda fields, record_id: confirmed.append(record_id))
+        self.assertEqual(confirmed, [])
+
+    def test_failing_sink_does_not_stop_the_others(self):
+        jsonl = JsonlSink(BASE_ID, TABLE, path=self.path("a.jsonl"), batch_size=1)
+        broken = BrokenSink(BASE_ID, TABLE, batch_size=1)
+        with FanOutWriter([("broken", broken), ("jsonl", jsonl)]) as writer:
+            for n in range(3):
+                writer.add(player(n))
+        self.assertEqual(len(self.read_jsonl(jsonl.path)), 3)
+        self.assertEqual(len(writer.failures), 3)
+        self.assertEqual(writer.failures[0][1], "disk full")
+
+    def test_slow_sink_does_not_hold_up_the_others(self):
+        gate = threading.Event()
+        airtable = FakeAirtable(gate)
+        jsonl = JsonlSink(BASE_ID, TABLE, path=self.path("a.jsonl"), batch_size=1)
+        writer = FanOutWriter([("airtable", airtable), ("jsonl", jsonl)], confirming=airtable)
+        for n in range(3):
+            writer.add(player(n))
+        for _ in range(100):
+            if jsonl.created == 3:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual((jsonl.created, len(airtable.calls)), (3, 0))
+        gate.set()
+        writer.close()
+        self.assertEqual(len(airtable.calls), 3)
+
+    def test_closed_writer(self):
+        writer = FanOutWriter([("jsonl", JsonlSink(BASE_ID, TABLE, path=self.path("a.jsonl")))])
+        writer.close()
+        writer.flush()  # nothing left to wait for
+        with self.assertRaises(RuntimeError):
+            writer.add(player(1))
+
+    def test_stdout_sink_leaves_sys_stdout_alone(self):
+        stream = io.StringIO()
+        before = sys.stdout
+        sink = StdoutSink(BASE_ID, TABLE, stream=stream)
+        sink.upsert(player(1), PLAYER_KEY)
+        self.assertIs(sys.stdout, before)
+        entry = json.loads(stream.getvalue())
+        self.assertEqual((entry['op'], entry['merge_on']), ("upsert", list(PLAYER_KEY)))
+        self.assertIs(StdoutSink(BASE_ID, TABLE).stream, sys.__stdout__)
+
+    def test_replay_skips_rows_airtable_already_has(self):
+        jsonl = JsonlSink(BASE_ID, TABLE, path=self.path("a.jsonl"))
+        for n in range(3):
+            jsonl.upsert(player(n), PLAYER_KEY)
+        jsonl.update("rec9", {"rating": 1700})
+        jsonl.add({"note": "appended"})
+        jsonl.close()
+
+        index = UpsertIndex(BASE_ID, TABLE, PLAYER_KEY, state_dir=self.tmp.name)
+        airtable = FakeAirtable()
+        self.assertEqual(replay_jsonl(jsonl.path, airtable, lambda merge_on: index), 5)
+        self.assertEqual([op for op, _, _ in airtable.calls], ["upsert"] * 3 + ["update", "add"])
+
+        again = FakeAirtable()
+        replay_jsonl(jsonl.path, again, lambda merge_on: index)
+        self.assertEqual([op for op, _, _ in again.calls], ["update", "add"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for the write-ahead run journal
+
+    python -m unittest discover tests
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from run_journal import RunJournal, journal_key, restore_index
+from upsert_index import PLAYER_KEY, UpsertIndex
+
+
+class RunJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def journal(self, **kwargs):
+        return RunJournal("sync_leaderboard_rm_solo", journal_dir=self.tmp.name, **kwargs)
+
+    def test_values_are_read_back_from_disk(self):
+        journal = self.journal()
+        journal.record("page", journal_key("rm_solo", 1), {"players": [1, 2]})
+        journal.record("page", journal_key("rm_solo", 2), {"players": [3]})
+        # Recording a key again replaces it
+        journal.record("page", journal_key("rm_solo", 1), {"players": [9]})
+        self.assertEqual(journal.get("page", journal_key("rm_solo", 1)), {"players": [9]})
+        self.assertEqual(len(journal.values("page")), 2)
+        self.assertTrue(all(isinstance(offset, int) for offset in journal.offsets.values()))
+        self.assertIsNone(journal.get("page", journal_key("rm_solo", 3)))
+
+    def test_crashed_run_is_resumed(self):
+        journal = self.journal()
+        journal.step("page", journal_key("rm_solo", 1), lambda: {"players": [1]})
+        journal.close()  # the process dies here: no complete()
+
+        calls = []
+        resumed = self.journal()
+        self.assertTrue(resumed.resumed)
+        self.assertEqual(resumed.started_at, journal.started_at)
+        page = resumed.step("page", journal_key("rm_solo", 1), lambda: calls.append(1))
+        self.assertEqual(page, {"players": [1]})
+        self.assertEqual(calls, [])
+
+    def test_torn_last_line_is_ignored(self):
+        journal = self.journal()
+        journal.record("write", "a", {"id": "rec1"})
+        journal.close()
+        with open(journal.path, 'ab') as f:
+            f.write(b'{"kind":"write","key":"b","val')
+
+        resumed = self.journal()
+        self.assertTrue(resumed.has("write", "a"))
+        self.assertFalse(resumed.has("write", "b"))
+        resumed.record("write", "c", {"id": "rec3"})
+        resumed.close()
+        self.assertEqual(set(self.journal().values("write")), {"a", "c"})
+
+    def test_falsy_results_are_not_recorded(self):
+        journal = self.journal()
+        self.assertIsNone(journal.step("page", "1", lambda: None))
+        self.assertEqual(journal.step("page", "2", lambda: {}), {})
+        self.assertFalse(journal.has("page", "1") or journal.has("page", "2"))
+        self.assertEqual(journal.step("page", "1", lambda: {"players": [1]}), {"players": [1]})
+        self.assertTrue(journal.has("page", "1"))
+
+    def test_stale_journal_is_discarded(self):
+        journal = self.journal()
+        journal.record("page", "1", {"players": [1]})
+        journal.close()
+        with open(journal.path, 'rb') as f:
+            lines = f.readlines()
+        lines[0] = json.dumps({"kind": "start", "at": time.time() - 3600}).encode() + b"\n"
+        with open(journal.path, 'wb') as f:
+            f.writelines(lines)
+
+        self.assertTrue(self.journal(max_age=7200).resumed)
+        fresh = self.journal(max_age=60)
+        self.assertFalse(fresh.resumed)
+        self.assertFalse(os.path.exists(fresh.path))
+
+    def test_complete_starts_the_next_run_fresh(self):
+        journal = self.journal()
+        journal.record("page", "1", {"players": [1]})
+        journal.complete()
+        self.assertFalse(os.path.exists(journal.path))
+        self.assertFalse(journal.has("page", "1"))
+        self.assertFalse(self.journal().resumed)
+
+    def test_close_keeps_entries(self):
+        journal = self.journal()
+        journal.record("write", "a", {"id": "rec1"})
+        journal.close()
+        journal.close()  # closing twice is harmless
+        self.assertEqual(self.journal().get("write", "a"), {"id": "rec1"})
+
+    def test_restore_index_marks_committed_writes(self):
+        journal = self.journal()
+        fields = {"profile_id": 1, "leaderboard": "rm_solo", "rating": 1500}
+        journal.record("write", journal_key(1, "rm_solo"), {"id": "rec1", "fields": fields})
+        journal.close()
+
+        index = UpsertIndex("appTest", "Leaderboard Players", PLAYER_KEY, state_dir=self.tmp.name)
+        self.assertEqual(restore_index(index, self.journal()), 1)
+        self.assertEqual(index.diff(fields), (None, "rec1", {}))
+
+
+if __name__ == '__main__':
+    unittest.main()
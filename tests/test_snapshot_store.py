@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared snapshot store
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import snapshot_store
+from snapshot_store import SnapshotStore
+
+
+class SnapshotStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(snapshot_store, '_store', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_parallel_stages_share_one_store(self):
+        opened = []
+        path = os.path.join(self.tmp.name, 'snapshots.sqlite3')
+
+        def slow_open():
+            store = SnapshotStore(path)
+            opened.append(store)
+            threading.Event().wait(0.05)  # widen the window a race would need
+            return store
+
+        results = []
+        with mock.patch.object(snapshot_store, 'SnapshotStore', slow_open):
+            threads = [threading.Thread(target=lambda: results.append(snapshot_store.snapshot_store()))
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(5)
+        for store in opened:
+            self.addCleanup(store.close)
+        self.assertEqual(len(opened), 1)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(store is opened[0] for store in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Tests for the sync daemon's change detection
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from sync_daemon import PolledSource
+
+
+class PolledSourceTest(unittest.TestCase):
+
+    def source(self, results):
+        synced = []
+
+        def sync(data):
+            synced.append(data)
+            return results.pop(0)
+
+        source = PolledSource("test", lambda: {"players": [1, 2, 3]}, sync,
+                              min_interval=10, max_interval=100)
+        return source, synced
+
+    def test_unchanged_data_skips_the_write(self):
+        source, synced = self.source([True])
+        source.poll()
+        source.poll()
+        self.assertEqual(len(synced), 1)
+        self.assertEqual(source.interval, 15)
+
+    def test_failed_sync_is_retried_with_the_same_data(self):
+        source, synced = self.source([False, True])
+        source.poll()
+        self.assertIsNone(source.last_hash)
+        self.assertEqual(source.failures, 1)
+        source.poll()
+        source.poll()
+        self.assertEqual(len(synced), 2)
+        self.assertIsNotNone(source.last_hash)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for the local upsert index
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from upsert_index import PLAYER_KEY, UpsertIndex, upsert_record
+
+
+class FakeWriter:
+    """Record writer stand-in that accepts every write straight away"""
+
+    def __init__(self, accept=True):
+        self.accept = accept
+        self.calls = []
+
+    def upsert(self, fields, key_fields, on_written=None):
+        self.calls.append(("upsert", None, dict(fields)))
+        if self.accept and on_written:
+            on_written(fields, f"rec{len(self.calls)}")
+
+    def update(self, record_id, fields, on_written=None):
+        self.calls.append(("update", record_id, dict(fields)))
+        if self.accept and on_written:
+            on_written(fields, record_id)
+
+
+def player(**fields):
+    record = {"profile_id": 1, "leaderboard": "rm_solo", "rating": 1500, "rank": 10,
+              "last_updated": "2026-01-01T00:00:00"}
+    record.update(fields)
+    return record
+
+
+class UpsertIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.index = self.open_index()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def open_index(self):
+        return UpsertIndex("appTest", "Leaderboard Players", PLAYER_KEY, state_dir=self.tmp.name)
+
+    def test_new_record_is_created(self):
+        writer = FakeWriter()
+        self.assertEqual(upsert_record(self.index, writer, player()), "create")
+        self.assertEqual(writer.calls[0][0], "upsert")
+
+    def test_unchanged_record_is_skipped(self):
+        writer = FakeWriter()
+        upsert_record(self.index, writer, player())
+        self.assertIsNone(upsert_record(self.index, writer, player()))
+        self.assertEqual(len(writer.calls), 1)
+
+    def test_changed_fields_are_merged(self):
+        writer = FakeWriter()
+        upsert_record(self.index, writer, player())
+        self.assertEqual(upsert_record(self.index, writer, player(rating=1525)), "update")
+        action, record_id, fields = writer.calls[-1]
+        self.assertEqual((action, record_id), ("update", "rec1"))
+        # Only what changed, plus the key and volatile fields
+        self.assertEqual(set(fields), {"rating", "profile_id", "leaderboard", "last_updated"})
+        self.assertEqual(self.index.diff(player(rating=1525))[0], None)
+
+    def test_volatile_fields_are_ignored(self):
+        writer = FakeWriter()
+        upsert_record(self.index, writer, player())
+        self.assertIsNone(upsert_record(self.index, writer, player(last_updated="2026-02-01T00:00:00")))
+
+    def test_failed_write_is_retried(self):
+        upsert_record(self.index, FakeWriter(accept=False), player())
+        self.assertEqual(self.index.diff(player())[0], "create")
+
+    def test_save_and_load_round_trip(self):
+        writer = FakeWriter()
+        upsert_record(self.index, writer, player(country="de", tags=["a", "b"]))
+        self.index.save()
+        reloaded = self.open_index()
+        self.assertEqual(reloaded.entries, self.index.entries)
+        self.assertEqual(reloaded.diff(player(country="de", tags=["a", "b"])), (None, "rec1", {}))
+
+    def test_concurrent_marks_and_diffs(self):
+        errors = []
+
+        def mark(start):
+            try:
+                for n in range(start, start + 500):
+                    self.index.mark_pushed(player(profile_id=n), f"rec{n}")
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=mark, args=(n * 500,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        # The sync loop diffs and saves while writers confirm
+        for n in range(2000):
+            self.index.diff(player(profile_id=n))
+            if n % 500 == 0:
+                self.index.save()
+        for thread in threads:
+            thread.join()
+        self.index.save()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.open_index().entries), 2000)
+
+
+if __name__ == '__main__':
+    unittest.main()